@@ -1,7 +1,9 @@
 from rest_framework import serializers
+from conf.localization import LocalizedFieldsMixin
 from .models import Banner
 
-class BannerSerializer(serializers.ModelSerializer):
+class BannerSerializer(LocalizedFieldsMixin, serializers.ModelSerializer):
+    localized_fields = ('title', 'description')
 
     class Meta:
         model=Banner
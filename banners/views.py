@@ -6,6 +6,8 @@ from rest_framework import status
 from django.shortcuts import get_object_or_404
 from .models import Banner
 from .serializers import BannerSerializer
+from conf.localization import get_response_language
+from conf.pagination import IdCursorPagination
 
 class BannerListCreateView(APIView):
     @swagger_auto_schema(
@@ -15,7 +17,12 @@ class BannerListCreateView(APIView):
     )
     def get(self, request):
         banners = Banner.objects.all()
-        serializer = BannerSerializer(banners, many=True)
+        context = {'language': get_response_language(request)}
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(banners, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(BannerSerializer(page, many=True, context=context).data)
+        serializer = BannerSerializer(banners, many=True, context=context)
         return Response(serializer.data)
 
     @swagger_auto_schema(
@@ -59,7 +66,7 @@ class BannerDetailView(APIView):
     )
     def get(self, request, pk):
         banners = get_object_or_404(Banner, pk=pk)
-        serializer = BannerSerializer(banners)
+        serializer = BannerSerializer(banners, context={'language': get_response_language(request)})
         return Response(serializer.data)
 
     @swagger_auto_schema(
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core import checks
+
+# Кэши, которые не видны другим процессам: корзина в них теряется между воркерами и при вытеснении.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_cart_cache(app_configs, **kwargs):
+    """Корзины в кэше (CART_ANONYMOUS или CART_STORE='cache') требуют общего для всех процессов кэша."""
+    if not (settings.CART_ANONYMOUS or settings.CART_STORE == 'cache'):
+        return []
+    backend = settings.CACHES.get(settings.CART_CACHE_ALIAS, {}).get('BACKEND')
+    if backend is None or backend in PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            f"Корзины хранятся в кэше '{settings.CART_CACHE_ALIAS}', но он не общий для процессов ({backend}).",
+            hint="Укажите в CART_CACHE_ALIAS общий кэш (например, Redis) или отключите CART_ANONYMOUS "
+                 "и используйте CART_STORE='db'.",
+            id='card.E001',
+        )]
+    return []
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from card.services import prune_unavailable_lines, sweep_carts
+
+
+class Command(BaseCommand):
+    help = ("Чистит корзины: удаляет позиции продуктов без остатка, пустые и брошенные корзины. "
+            "Запускать по расписанию (cron), например раз в сутки.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empty-days', type=int, default=settings.CART_EMPTY_RETENTION_DAYS,
+                            help="Через сколько дней без изменений удалять пустые корзины")
+        parser.add_argument('--abandoned-days', type=int, default=settings.CART_ABANDONED_RETENTION_DAYS,
+                            help="Через сколько дней без изменений удалять корзины с позициями")
+        parser.add_argument('--archive', help="Дописывать удаляемые корзины с позициями в этот файл (JSON Lines)")
+        parser.add_argument('--skip-prune', action='store_true',
+                            help="Не удалять позиции продуктов без остатка")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Сколько корзин или позиций обрабатывать одной транзакцией")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        chunk_size = options['chunk_size']
+        pruned = 0 if options['skip_prune'] else prune_unavailable_lines(chunk_size)
+        empty, _ = sweep_carts(now - timedelta(days=options['empty_days']), empty_only=True, chunk_size=chunk_size)
+        if options['archive']:
+            with open(options['archive'], 'a', encoding='utf-8') as archive:
+                abandoned, items = sweep_carts(
+                    now - timedelta(days=options['abandoned_days']), chunk_size=chunk_size, archive=archive
+                )
+        else:
+            abandoned, items = sweep_carts(now - timedelta(days=options['abandoned_days']), chunk_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено позиций без остатка: {pruned}, пустых корзин: {empty}, "
+            f"брошенных корзин: {abandoned} (позиций в них: {items})."
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-17 08:36
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    Cart = apps.get_model('card', 'Cart')
+    CartItem = apps.get_model('card', 'CartItem')
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(count=Sum('quantity')).values('count')), 0),
+        total_price=Coalesce(Subquery(
+            items.annotate(price=Sum(F('quantity') * F('product__price'))).values('price')
+        ), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('card', '0001_initial'),
+        ('products', '0024_inventory_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,13 @@ class Cart(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Итоги по текущим ценам продуктов; меняются вместе с позициями (card.services) и при смене цены продукта.
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    total_price = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Для sweep_carts: старые корзины выбираются по диапазону updated_at.
+        indexes = [models.Index(fields=['updated_at', 'id'])]
 
     def __str__(self):
         return f"Cart for {self.user.email}"
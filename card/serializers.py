@@ -1,11 +1,27 @@
+from django.conf import settings
 from rest_framework import serializers
 from products.models import Product
-from products.serializers import ProductSerializers
 from .models import Cart, CartItem
+from .services import check_stock
+
+# Поля продукта, которые читает CartProductSerializer (для .only() в запросах корзины).
+CART_PRODUCT_FIELDS = ('id', 'title', 'price', 'old_price', 'total', 'links')
+
+
+class CartProductSerializer(serializers.ModelSerializer):
+    """Краткое описание продукта в позиции корзины; полная карточка — в /api/products/<id>/."""
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'title', 'price', 'old_price', 'total', 'image']
+
+    def get_image(self, obj):
+        return obj.links[0] if obj.links else None
 
 
 class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializers(read_only=True)
+    product = CartProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
     )
@@ -22,15 +38,19 @@ class CartItemSerializer(serializers.ModelSerializer):
 
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
-    total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
-        fields = ['id', 'user', 'items', 'total_price', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'user', 'created_at', 'updated_at']
+        fields = ['id', 'user', 'items', 'item_count', 'total_price', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'user', 'item_count', 'total_price', 'created_at', 'updated_at']
 
-    def get_total_price(self, obj):
-        return sum(item.quantity * item.product.price for item in obj.items.all())
+
+class CartDeltaSerializer(serializers.Serializer):
+    """Ответ на изменение корзины: изменённая позиция (null, если удалена) и новые итоги."""
+    item = CartItemSerializer(allow_null=True)
+    item_id = serializers.IntegerField()
+    item_count = serializers.IntegerField()
+    total_price = serializers.IntegerField()
 
 
 class CartItemAddSerializer(serializers.Serializer):
@@ -43,45 +63,48 @@ class CartItemAddSerializer(serializers.Serializer):
         return value
 
     def validate(self, data):
-        product = Product.objects.get(id=data['product_id'])
-        if product.total < data['quantity']:
-            raise serializers.ValidationError(
-                f"Недостаточно товара: доступно {product.total}, запрошено {data['quantity']}."
-            )
+        check_stock(Product.objects.only('total').get(id=data['product_id']), data['quantity'])
         return data
 
-    def create(self, validated_data):
-        cart = self.context['cart']
-        product = Product.objects.get(id=validated_data['product_id'])
-        quantity = validated_data['quantity']
 
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product, defaults={'quantity': quantity}
-        )
-        if not created:
-            new_quantity = cart_item.quantity + quantity
-            if product.total < new_quantity:
-                raise serializers.ValidationError(
-                    f"Недостаточно товара: доступно {product.total}, запрошено {new_quantity}."
-                )
-            cart_item.quantity = new_quantity
-            cart_item.save()
+class CartItemUpdateSerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=1)
 
-        return cart_item
 
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(
+        choices=['add', 'set', 'remove'],
+        help_text="add — прибавить quantity, set — установить quantity (0 удаляет позицию), remove — удалить позицию"
+    )
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, required=False)
 
-class CartItemUpdateSerializer(serializers.Serializer):
-    quantity = serializers.IntegerField(min_value=1)
+    def validate(self, data):
+        if data['op'] == 'add':
+            data.setdefault('quantity', 1)
+            if data['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': "Для add количество должно быть не меньше 1."})
+        elif data['op'] == 'set' and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': "Для set нужно указать количество."})
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Длина списка проверяется до разбора операций, чтобы слишком большой запрос не валидировался целиком.
+        fields['operations'] = CartOperationSerializer(
+            many=True, allow_empty=False, max_length=settings.CART_BATCH_MAX_OPERATIONS,
+            error_messages={'max_length': "Не больше {max_length} операций за запрос."},
+        )
+        return fields
 
-    def validate_quantity(self, value):
-        product = self.instance.product
-        if product.total < value:
-            raise serializers.ValidationError(
-                f"Недостаточно товара: доступно {product.total}, запрошено {value}."
-            )
-        return value
 
-    def update(self, instance, validated_data):
-        instance.quantity = validated_data['quantity']
-        instance.save()
-        return instance
\ No newline at end of file
+class CartBatchResultSerializer(serializers.Serializer):
+    """Ответ пакетного изменения: изменённые позиции, id удалённых позиций и новые итоги."""
+    items = CartItemSerializer(many=True)
+    removed_item_ids = serializers.ListField(child=serializers.IntegerField())
+    item_count = serializers.IntegerField()
+    total_price = serializers.IntegerField()
@@ -0,0 +1,223 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+
+from products.inventory import InsufficientStock
+from products.models import Product
+from .models import Cart, CartItem
+
+
+def lock_cart(user):
+    """Корзина пользователя, заблокированная до конца транзакции (создаётся при необходимости)."""
+    cart, created = Cart.objects.select_for_update().get_or_create(user=user)
+    return cart
+
+
+def check_stock(product, quantity):
+    if product.total < quantity:
+        raise serializers.ValidationError(
+            f"Недостаточно товара: доступно {product.total}, запрошено {quantity}."
+        )
+
+
+def shift_totals(cart, count, amount):
+    """Сдвигает итоги корзины на разницу одной позиции, не перечитывая остальные позиции."""
+    if count or amount:
+        Cart.objects.filter(pk=cart.pk).update(
+            item_count=F('item_count') + count, total_price=F('total_price') + amount, updated_at=timezone.now()
+        )
+        cart.item_count += count
+        cart.total_price += amount
+
+
+def set_quantity(cart, product, quantity, item=None):
+    """Ставит количество продукта в корзине (0 удаляет позицию) и возвращает позицию или None.
+
+    Вызывать внутри transaction.atomic() с корзиной из lock_cart: блокировка корзины упорядочивает
+    изменения одной корзины, поэтому итоги можно сдвигать на разницу, а не пересчитывать.
+    """
+    if item is None:
+        item = CartItem.objects.filter(cart=cart, product=product).first()
+    previous = item.quantity if item else 0
+    if quantity and item is None:
+        item = CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+    elif quantity and quantity != previous:
+        item.quantity = quantity
+        item.save(update_fields=['quantity'])
+    elif not quantity and item is not None:
+        item.delete()
+        item = None
+    shift_totals(cart, quantity - previous, (quantity - previous) * product.price)
+    return item
+
+
+
+def fold_operations(quantities, operations):
+    """Сворачивает операции add/set/remove в итоговые количества {product_id: quantity} (0 — удалить)."""
+    quantities = dict(quantities)
+    for operation in operations:
+        product_id = operation['product_id']
+        if operation['op'] == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+        elif operation['op'] == 'set':
+            quantities[product_id] = operation['quantity']
+        else:
+            quantities[product_id] = 0
+    return quantities
+
+
+def load_products(product_ids, product_fields=('id', 'price', 'total')):
+    """Продукты {id: Product} одним запросом; отсутствующие id — ошибка валидации."""
+    products = Product.objects.only(*product_fields).in_bulk(product_ids)
+    missing = set(product_ids) - set(products)
+    if missing:
+        raise serializers.ValidationError(f"Продукты с ID {sorted(missing)} не существуют.")
+    return products
+
+
+def check_quantities(quantities, products):
+    """Проверяет остатки сразу по всем продуктам и перечисляет всю нехватку в InsufficientStock."""
+    shortages = [
+        (product_id, products[product_id].total, quantity)
+        for product_id, quantity in sorted(quantities.items())
+        if products[product_id].total < quantity
+    ]
+    if shortages:
+        raise InsufficientStock(shortages)
+
+
+def apply_batch(cart, operations, product_fields=('id', 'price', 'total')):
+    """Применяет операции [{'op': 'add'|'set'|'remove', 'product_id', 'quantity'}, ...] к корзине целиком.
+
+    Вызывать внутри transaction.atomic() с корзиной из lock_cart. Операции сворачиваются в итоговое
+    количество по каждому продукту, поэтому число запросов не зависит от числа строк: одна выборка
+    текущих позиций, одна — продуктов (существование и остаток), один upsert и одно удаление.
+    Нехватка проверяется по всем продуктам сразу. Возвращает (изменённые позиции, id удалённых позиций).
+    """
+    product_ids = {operation['product_id'] for operation in operations}
+    existing = {
+        item.product_id: item
+        for item in CartItem.objects.filter(cart=cart, product_id__in=product_ids).only('id', 'product_id', 'quantity')
+    }
+    quantities = fold_operations({product_id: item.quantity for product_id, item in existing.items()}, operations)
+    products = load_products(product_ids, product_fields)
+    check_quantities(quantities, products)
+
+    changed = {
+        product_id: quantity for product_id, quantity in quantities.items()
+        if quantity != (existing[product_id].quantity if product_id in existing else 0)
+    }
+    items = CartItem.objects.bulk_create(
+        [
+            CartItem(cart=cart, product=products[product_id], quantity=quantity)
+            for product_id, quantity in sorted(changed.items()) if quantity
+        ],
+        update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+    )
+    removed = [existing[product_id].pk for product_id, quantity in sorted(changed.items()) if not quantity]
+    if removed:
+        CartItem.objects.filter(pk__in=removed).delete()
+
+    count = amount = 0
+    for product_id, quantity in changed.items():
+        difference = quantity - (existing[product_id].quantity if product_id in existing else 0)
+        count += difference
+        amount += difference * products[product_id].price
+    shift_totals(cart, count, amount)
+    return items, removed
+
+
+def clear_cart(cart):
+    cart.items.all().delete()
+    Cart.objects.filter(pk=cart.pk).update(item_count=0, total_price=0, updated_at=timezone.now())
+    cart.item_count = cart.total_price = 0
+
+
+def refresh_totals(carts):
+    """Пересчитывает итоги корзин queryset'а одним UPDATE (после смены цены или удаления продукта)."""
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    carts.update(
+        item_count=Coalesce(Subquery(items.annotate(count=Sum('quantity')).values('count')), 0),
+        total_price=Coalesce(Subquery(
+            items.annotate(price=Sum(F('quantity') * F('product__price'))).values('price')
+        ), 0),
+    )
+
+
+def refresh_cart_totals(cart_ids, chunk_size=1000):
+    """Пересчитывает итоги корзин cart_ids пачками; каждая пачка — короткая транзакция.
+
+    Корзины пачки блокируются в порядке id, как при изменении корзины: без блокировки пересчёт мог бы
+    прочитать позиции до параллельного изменения и затереть его сдвиг итогов.
+    """
+    cart_ids = sorted(set(cart_ids))
+    for offset in range(0, len(cart_ids), chunk_size):
+        chunk = cart_ids[offset:offset + chunk_size]
+        with transaction.atomic():
+            list(Cart.objects.select_for_update().filter(id__in=chunk).order_by('id').values_list('id'))
+            refresh_totals(Cart.objects.filter(id__in=chunk))
+
+
+def prune_unavailable_lines(chunk_size=1000):
+    """Удаляет позиции продуктов с нулевым остатком пачками по id и возвращает их число.
+
+    Каждая пачка — отдельная короткая транзакция: корзины пачки блокируются (в том же порядке, что и при
+    изменении корзины), позиции удаляются, итоги корзин пересчитываются. updated_at корзин не меняется,
+    чтобы чистка не продлевала жизнь брошенным корзинам.
+    """
+    pruned = last_id = 0
+    while True:
+        rows = list(
+            CartItem.objects.filter(id__gt=last_id, product__total=0).order_by('id').values_list('id', 'cart_id')[:chunk_size]
+        )
+        if not rows:
+            return pruned
+        last_id = rows[-1][0]
+        cart_ids = sorted({cart_id for item_id, cart_id in rows})
+        with transaction.atomic():
+            list(Cart.objects.select_for_update().filter(id__in=cart_ids).order_by('id').values_list('id'))
+            pruned += CartItem.objects.filter(id__in=[item_id for item_id, cart_id in rows], product__total=0).delete()[0]
+            refresh_totals(Cart.objects.filter(id__in=cart_ids))
+
+
+def sweep_carts(cutoff, empty_only=False, chunk_size=1000, archive=None):
+    """Удаляет корзины, не менявшиеся до cutoff, и возвращает (корзин, позиций).
+
+    Корзины выбираются пачками по индексу (updated_at, id); в транзакции пачки они блокируются
+    с skip_locked, так что корзины, которые сейчас меняются, пропускаются, а длинных блокировок нет.
+    Удалённые корзины с позициями пишутся в archive (файл, по строке JSON на корзину), если он передан.
+    """
+    carts = Cart.objects.filter(updated_at__lt=cutoff)
+    if empty_only:
+        carts = carts.filter(item_count=0)
+    deleted_carts = deleted_items = 0
+    while True:
+        ids = list(carts.order_by('updated_at', 'id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted_carts, deleted_items
+        with transaction.atomic():
+            ids = list(carts.select_for_update(skip_locked=True).filter(id__in=ids).values_list('id', flat=True))
+            if archive is not None:
+                archive_carts(ids, archive)
+            deleted, per_model = Cart.objects.filter(id__in=ids).delete()
+        deleted_carts += per_model.get(Cart._meta.label, 0)
+        deleted_items += per_model.get(CartItem._meta.label, 0)
+        if not ids:
+            # Вся пачка сейчас заблокирована изменениями; её возьмёт следующий запуск.
+            return deleted_carts, deleted_items
+
+
+def archive_carts(cart_ids, archive):
+    lines = {}
+    for cart_id, product_id, quantity in CartItem.objects.filter(cart_id__in=cart_ids).order_by('cart_id', 'product_id').values_list(
+        'cart_id', 'product_id', 'quantity'
+    ):
+        lines.setdefault(cart_id, []).append({'product_id': product_id, 'quantity': quantity})
+    carts = Cart.objects.filter(id__in=lines).order_by('id').values('id', 'user_id', 'updated_at', 'item_count', 'total_price')
+    for cart in carts:
+        archive.write(json.dumps({**cart, 'items': lines[cart['id']]}, cls=DjangoJSONEncoder) + '\n')
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from products.models import Product
+from .models import Cart
+from .services import refresh_cart_totals
+
+
+def cart_ids_with(product_id):
+    return Cart.objects.filter(items__product_id=product_id).values_list('id', flat=True).distinct()
+
+
+# Итоги пересчитываются после коммита: сохранение продукта не держит блокировки корзин,
+# а пересчёт видит уже зафиксированные цену и позиции.
+@receiver(post_save, sender=Product)
+def reprice_carts(sender, instance, created, update_fields=None, using='default', **kwargs):
+    if update_fields is not None and 'price' not in update_fields:
+        return
+    loaded_price = getattr(instance, '_loaded_price', None)
+    instance._loaded_price = instance.price
+    if created or (loaded_price is not None and loaded_price == instance.price):
+        return
+    product_id = instance.pk
+    transaction.on_commit(lambda: refresh_cart_totals(cart_ids_with(product_id)), using=using)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_carts(sender, instance, **kwargs):
+    instance._cart_ids = list(cart_ids_with(instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_carts(sender, instance, using='default', **kwargs):
+    cart_ids = getattr(instance, '_cart_ids', None)
+    if cart_ids:
+        transaction.on_commit(lambda: refresh_cart_totals(cart_ids), using=using)
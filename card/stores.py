@@ -0,0 +1,295 @@
+import re
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import NotAuthenticated
+
+from products.models import Product
+from .models import Cart, CartItem
+from .serializers import CART_PRODUCT_FIELDS
+from .services import (
+    apply_batch, check_quantities, check_stock, fold_operations, load_products, lock_cart, set_quantity,
+)
+
+CART_TOKEN_HEADER = 'X-Cart-Token'
+CART_TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{20,64}$')
+
+
+def planned_items():
+    return CartItem.objects.select_related('product').only(
+        'id', 'cart_id', 'quantity', *(f'product__{field}' for field in CART_PRODUCT_FIELDS)
+    )
+
+
+def planned_carts():
+    return Cart.objects.prefetch_related(Prefetch('items', queryset=planned_items()))
+
+
+class CartStore:
+    """Хранилище корзины одного покупателя.
+
+    Все методы изменения возвращают корзину с актуальными item_count и total_price: add и update —
+    (корзина, позиция), remove — (корзина, id позиции), batch — (корзина, изменённые позиции, id удалённых).
+    """
+    # Токен анонимной корзины, который нужно вернуть клиенту в заголовке X-Cart-Token.
+    token = None
+
+    def read(self):
+        raise NotImplementedError
+
+    def quantities(self):
+        """Текущие количества {product_id: quantity}."""
+        raise NotImplementedError
+
+    def add(self, product_id, quantity):
+        raise NotImplementedError
+
+    def update(self, item_id, quantity):
+        raise NotImplementedError
+
+    def remove(self, item_id):
+        raise NotImplementedError
+
+    def batch(self, operations):
+        raise NotImplementedError
+
+    def flush(self):
+        """Переносит корзину в Cart/CartItem и возвращает заблокированную Cart (внутри transaction.atomic())."""
+        raise NotImplementedError
+
+    def checked_out(self):
+        """Вызывается после успешного оформления заказа из корзины, возвращённой flush()."""
+
+    def merge(self, quantities):
+        """Добавляет позиции другой корзины; количество ограничивается остатком, исчезнувшие продукты пропускаются.
+
+        Слияние только добавляет: если остатка не хватает даже на уже лежащее в корзине (в том числе
+        остаток нулевой), позиция пользователя остаётся как есть.
+        """
+        if not quantities:
+            return
+        stock = dict(Product.objects.filter(id__in=quantities).values_list('id', 'total'))
+        current = self.quantities()
+        merged = {
+            product_id: min(current.get(product_id, 0) + quantity, stock[product_id])
+            for product_id, quantity in quantities.items() if product_id in stock
+        }
+        operations = [
+            {'op': 'set', 'product_id': product_id, 'quantity': quantity}
+            for product_id, quantity in sorted(merged.items()) if quantity > current.get(product_id, 0)
+        ]
+        if operations:
+            self.batch(operations)
+
+
+class DatabaseCartStore(CartStore):
+    """Корзина в таблицах Cart/CartItem; изменения идут под блокировкой строки корзины."""
+
+    def __init__(self, user):
+        self.user = user
+
+    def read(self):
+        # Просмотр корзины не создаёт строку Cart: она появляется с первой позицией.
+        return planned_carts().filter(user=self.user).first() or UnsavedCart(self.user, [])
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+
+    def locked_item(self, cart, item_id):
+        return get_object_or_404(
+            CartItem.objects.select_related('product').only(
+                'id', 'cart_id', 'product_id', 'quantity', *(f'product__{field}' for field in CART_PRODUCT_FIELDS)
+            ),
+            cart=cart, pk=item_id,
+        )
+
+    def add(self, product_id, quantity):
+        with transaction.atomic():
+            cart = lock_cart(self.user)
+            product = Product.objects.only(*CART_PRODUCT_FIELDS).get(id=product_id)
+            item = CartItem.objects.filter(cart=cart, product=product).first()
+            quantity += item.quantity if item else 0
+            check_stock(product, quantity)
+            return cart, set_quantity(cart, product, quantity, item)
+
+    def update(self, item_id, quantity):
+        with transaction.atomic():
+            cart = lock_cart(self.user)
+            item = self.locked_item(cart, item_id)
+            check_stock(item.product, quantity)
+            return cart, set_quantity(cart, item.product, quantity, item)
+
+    def remove(self, item_id):
+        with transaction.atomic():
+            cart = lock_cart(self.user)
+            item = self.locked_item(cart, item_id)
+            set_quantity(cart, item.product, 0, item)
+            return cart, item_id
+
+    def batch(self, operations):
+        with transaction.atomic():
+            cart = lock_cart(self.user)
+            items, removed = apply_batch(cart, operations, CART_PRODUCT_FIELDS)
+            return cart, items, removed
+
+    def flush(self):
+        # Блокировка не даёт повторному checkout той же корзины создать второй заказ.
+        return get_object_or_404(Cart.objects.select_for_update(), user=self.user)
+
+
+class UnsavedCart:
+    """Корзина без строки Cart (из кэша или ещё пустая) в том же виде, что Cart для CartSerializer."""
+    id = None
+    created_at = None
+    updated_at = None
+
+    def __init__(self, user, items):
+        self.user = user
+        self.items = items
+        self.item_count = sum(item.quantity for item in items)
+        self.total_price = sum(item.quantity * item.product.price for item in items)
+
+
+class CacheCartStore(CartStore):
+    """Корзина в кэше (CART_CACHE_ALIAS) с TTL CART_CACHE_TTL, без записей в базу до оформления заказа.
+
+    Хранится только {product_id: quantity}; цены и остатки читаются одним запросом при каждом обращении.
+    id позиции совпадает с id продукта. Одновременные изменения одной корзины не блокируются:
+    выигрывает последняя запись, что приемлемо для корзины одного покупателя.
+    """
+
+    def __init__(self, key, user=None, token=None):
+        self.key = key
+        self.user = user
+        self.token = token
+
+    @classmethod
+    def for_user(cls, user):
+        return cls(f'cart:user:{user.pk}', user=user)
+
+    @classmethod
+    def for_token(cls, token):
+        return cls(f'cart:anonymous:{token}', token=token)
+
+    @property
+    def cache(self):
+        return caches[settings.CART_CACHE_ALIAS]
+
+    def quantities(self):
+        return dict(self.cache.get(self.key) or {})
+
+    def save(self, quantities):
+        quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+        if quantities:
+            self.cache.set(self.key, quantities, settings.CART_CACHE_TTL)
+        else:
+            self.cache.delete(self.key)
+
+    def build(self, quantities, products):
+        return UnsavedCart(self.user, [
+            CartItem(id=product_id, product=products[product_id], quantity=quantity)
+            for product_id, quantity in sorted(quantities.items()) if quantity and product_id in products
+        ])
+
+    def read(self):
+        quantities = self.quantities()
+        return self.build(quantities, Product.objects.only(*CART_PRODUCT_FIELDS).in_bulk(quantities))
+
+    def batch(self, operations):
+        current = self.quantities()
+        touched = {operation['product_id'] for operation in operations}
+        quantities = fold_operations(current, operations)
+        products = load_products(touched, CART_PRODUCT_FIELDS)
+        check_quantities({product_id: quantities[product_id] for product_id in touched}, products)
+        products.update(Product.objects.only(*CART_PRODUCT_FIELDS).in_bulk(set(quantities) - touched))
+        # Позиции продуктов, удалённых из каталога, выпадают из корзины.
+        quantities = {product_id: quantity for product_id, quantity in quantities.items() if product_id in products}
+        self.save(quantities)
+
+        cart = self.build(quantities, products)
+        changed = {product_id for product_id in touched if quantities[product_id] != current.get(product_id, 0)}
+        items = [item for item in cart.items if item.id in changed]
+        removed = sorted(product_id for product_id in changed if not quantities[product_id])
+        return cart, items, removed
+
+    def line(self, item_id):
+        if item_id not in self.quantities():
+            raise Http404
+        return item_id
+
+    def add(self, product_id, quantity):
+        cart, items, removed = self.batch([{'op': 'add', 'product_id': product_id, 'quantity': quantity}])
+        return cart, items[0]
+
+    def update(self, item_id, quantity):
+        product_id = self.line(item_id)
+        cart, items, removed = self.batch([{'op': 'set', 'product_id': product_id, 'quantity': quantity}])
+        return cart, next(item for item in cart.items if item.id == product_id)
+
+    def remove(self, item_id):
+        product_id = self.line(item_id)
+        cart, items, removed = self.batch([{'op': 'remove', 'product_id': product_id}])
+        return cart, item_id
+
+    def flush(self):
+        cart = lock_cart(self.user)
+        quantities = self.quantities()
+        available = set(Product.objects.filter(id__in=quantities).values_list('id', flat=True))
+        operations = [
+            {'op': 'set', 'product_id': product_id, 'quantity': quantity}
+            for product_id, quantity in sorted(quantities.items()) if product_id in available
+        ] + [
+            {'op': 'remove', 'product_id': product_id}
+            for product_id in cart.items.exclude(product_id__in=available).values_list('product_id', flat=True)
+        ]
+        if operations:
+            apply_batch(cart, operations)
+        return cart
+
+    def clear(self):
+        self.cache.delete(self.key)
+
+    def checked_out(self):
+        self.clear()
+
+
+def new_cart_token():
+    return secrets.token_urlsafe(24)
+
+
+def request_cart_token(request):
+    token = request.headers.get(CART_TOKEN_HEADER, '')
+    return token if CART_TOKEN_RE.match(token) else None
+
+
+def get_user_cart_store(user):
+    if settings.CART_STORE == 'cache':
+        return CacheCartStore.for_user(user)
+    return DatabaseCartStore(user)
+
+
+def get_cart_store(request):
+    """Хранилище корзины запроса: по CART_STORE для пользователя, кэш по X-Cart-Token для анонима.
+
+    Без CART_ANONYMOUS анонимный запрос отклоняется как неавторизованный.
+    """
+    if request.user.is_authenticated:
+        return get_user_cart_store(request.user)
+    if not settings.CART_ANONYMOUS:
+        raise NotAuthenticated()
+    return CacheCartStore.for_token(request_cart_token(request) or new_cart_token())
+
+
+def merge_anonymous_cart(request, user):
+    """При входе переносит анонимную корзину из X-Cart-Token в корзину пользователя и удаляет её."""
+    token = request_cart_token(request)
+    if token is None or not settings.CART_ANONYMOUS:
+        return
+    anonymous = CacheCartStore.for_token(token)
+    get_user_cart_store(user).merge(anonymous.quantities())
+    anonymous.clear()
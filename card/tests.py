@@ -1,3 +1,486 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import checks
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from products.category_tree import get_category_tree
+from products.models import Category, Comment, Product, Tag
+from products.testing import create_product
+from notifications.models import OutboxMessage
+from order.models import Order, OrderItem
+from user.models import CustomUser
+from .checks import check_cart_cache
+from .models import Cart, CartItem
+from .serializers import CartOperationSerializer
+from .services import refresh_cart_totals
+from .stores import CacheCartStore, DatabaseCartStore
+
+
+class CartQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.tag = Tag.objects.create(name_uz='Antibiotik', name_ru='Антибиотик', name_en='Antibiotic')
+        # Дерево категорий кэшируется на процесс; прогреваем, чтобы считать только запросы на продукты.
+        get_category_tree()
+
+    def add_items(self, count):
+        for i in range(count):
+            product = create_product(self.category)
+            product.tags.add(self.tag)
+            Comment.objects.create(product=product, user=self.user, text='ok', rating=5)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/cart/')
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_cart_query_count_is_constant(self):
+        self.add_items(2)
+        small = self.count_queries()
+        self.add_items(5)
+        self.assertEqual(self.count_queries(), small)
+
+
+class CartMutationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+
+    def add(self, product, quantity=1, query=''):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(f'/api/cart/add/{query}', {'product_id': product.id, 'quantity': quantity}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json(), len(context)
+
+    def test_mutations_return_changed_line_and_totals(self):
+        first = create_product(self.category, price=100)
+        second = create_product(self.category, price=250, links=['https://example.com/1.png'])
+        self.add(first, 2)
+        body, _ = self.add(second)
+        self.assertEqual((body['item_count'], body['total_price']), (3, 450))
+        self.assertEqual(body['item']['product'], {
+            'id': second.id, 'title': second.title, 'price': 250, 'old_price': None, 'total': 10,
+            'image': 'https://example.com/1.png',
+        })
+
+        body = self.client.patch(f"/api/cart/update/{body['item_id']}/", {'quantity': 4}, format='json').json()
+        self.assertEqual((body['item']['quantity'], body['item_count'], body['total_price']), (4, 6, 1200))
+
+        item_id = body['item_id']
+        body = self.client.delete(f'/api/cart/delete/{item_id}/').json()
+        self.assertEqual(body, {'item': None, 'item_id': item_id, 'item_count': 2, 'total_price': 200})
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.item_count, cart.total_price), (2, 200))
+
+    def test_full_response_returns_whole_cart(self):
+        body, _ = self.add(create_product(self.category), 3, query='?full=1')
+        self.assertEqual((body['item_count'], body['total_price'], len(body['items'])), (3, 300, 1))
+
+    def test_mutation_query_count_does_not_depend_on_cart_size(self):
+        self.add(create_product(self.category))
+        _, small = self.add(create_product(self.category))
+        for i in range(5):
+            self.add(create_product(self.category))
+        _, large = self.add(create_product(self.category))
+        self.assertEqual(large, small)
+
+    def test_price_change_and_product_removal_refresh_totals(self):
+        first, second = create_product(self.category, price=100), create_product(self.category, price=100)
+        self.add(first, 2)
+        self.add(second)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.price = 150
+            first.save()
+            cart = Cart.objects.get(user=self.user)
+            self.assertEqual((cart.item_count, cart.total_price), (3, 300))
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.total_price), (3, 400))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.total_price), (2, 300))
+
+    def test_refresh_cart_totals_works_in_chunks(self):
+        product = create_product(self.category, price=100)
+        carts = []
+        for i in range(5):
+            user = CustomUser.objects.create_user(
+                email=f'buyer{i}@example.com', password='x', name='A', surname='B', phone_number=f'+99890000000{i}'
+            )
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product, quantity=i + 1)
+            carts.append(cart)
+        with CaptureQueriesContext(connection) as context:
+            refresh_cart_totals([cart.id for cart in carts] * 2, chunk_size=2)
+        self.assertEqual(sum('UPDATE' in query['sql'] for query in context.captured_queries), 3)
+        self.assertEqual(
+            list(Cart.objects.filter(id__in=[cart.id for cart in carts]).order_by('id').values_list('item_count', 'total_price')),
+            [(i + 1, 100 * (i + 1)) for i in range(5)]
+        )
+
+    def test_save_without_price_change_skips_repricing(self):
+        product = create_product(self.category, price=100)
+        self.add(product)
+        product = Product.objects.get(pk=product.pk)
+        with mock.patch('card.signals.refresh_cart_totals') as refresh_cart_totals, \
+                self.captureOnCommitCallbacks(execute=True):
+            product.title = 'Renamed'
+            product.save()
+            product.price = 120
+            product.save()
+            product.save()
+        self.assertEqual(refresh_cart_totals.call_count, 1)
+
+    def batch(self, operations, query=''):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(f'/api/cart/batch/{query}', {'operations': operations}, format='json')
+        return response, len(context)
+
+    def test_batch_applies_operations_in_order(self):
+        kept, dropped, added = create_product(self.category, price=100), create_product(self.category, price=10), create_product(self.category, price=1)
+        self.add(kept, 1)
+        self.add(dropped, 2)
+        response, _ = self.batch([
+            {'op': 'add', 'product_id': kept.id, 'quantity': 2},
+            {'op': 'remove', 'product_id': dropped.id},
+            {'op': 'add', 'product_id': added.id},
+            {'op': 'set', 'product_id': added.id, 'quantity': 5},
+        ])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([(item['product']['id'], item['quantity']) for item in body['items']], [(kept.id, 3), (added.id, 5)])
+        self.assertEqual(len(body['removed_item_ids']), 1)
+        self.assertEqual((body['item_count'], body['total_price']), (8, 305))
+        self.assertEqual(
+            sorted(CartItem.objects.values_list('product_id', 'quantity')), [(kept.id, 3), (added.id, 5)]
+        )
+        self.assertEqual(self.batch([], query='?full=1')[0].status_code, 400)
+
+    def test_batch_reports_every_shortage_and_changes_nothing(self):
+        first, second = create_product(self.category, total=1), create_product(self.category, total=2)
+        response, _ = self.batch([
+            {'op': 'set', 'product_id': first.id, 'quantity': 2},
+            {'op': 'add', 'product_id': second.id, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()), 2)
+        response, _ = self.batch([{'op': 'add', 'product_id': 0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+    @override_settings(CART_BATCH_MAX_OPERATIONS=2)
+    def test_oversized_batch_is_rejected_before_validating_operations(self):
+        with mock.patch.object(CartOperationSerializer, 'validate') as validate:
+            response, _ = self.batch([{'op': 'add', 'product_id': i} for i in range(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['operations'], {'non_field_errors': ['Не больше 2 операций за запрос.']})
+        validate.assert_not_called()
+
+    def test_batch_query_count_is_constant(self):
+        def operations(count):
+            return [{'op': 'add', 'product_id': create_product(self.category).id, 'quantity': 1} for i in range(count)]
+
+        Cart.objects.create(user=self.user)
+        _, small = self.batch(operations(2))
+        _, large = self.batch(operations(20))
+        self.assertEqual(large, small)
+
+
+@override_settings(CART_ANONYMOUS=True)
+class CartStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+
+    def test_anonymous_cart_lives_in_cache(self):
+        first, second = create_product(self.category, price=100), create_product(self.category, price=50)
+        response = self.client.post('/api/cart/add/', {'product_id': first.id, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        token = response['X-Cart-Token']
+        headers = {'HTTP_X_CART_TOKEN': token}
+
+        self.client.post('/api/cart/add/', {'product_id': second.id}, format='json', **headers)
+        body = self.client.patch(f'/api/cart/update/{first.id}/', {'quantity': 3}, format='json', **headers).json()
+        self.assertEqual((body['item']['quantity'], body['item_count'], body['total_price']), (3, 4, 350))
+        body = self.client.delete(f'/api/cart/delete/{second.id}/', **headers).json()
+        self.assertEqual((body['item_id'], body['item_count'], body['total_price']), (second.id, 3, 300))
+
+        body = self.client.get('/api/cart/', **headers).json()
+        self.assertEqual([(item['product']['id'], item['quantity']) for item in body['items']], [(first.id, 3)])
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(self.client.get('/api/cart/').json()['items'], [])
+        self.assertEqual(self.client.post('/api/cart/checkout/', {}, format='json', **headers).status_code, 403)
+
+    @override_settings(CART_ANONYMOUS=False)
+    def test_anonymous_cart_requires_explicit_setting(self):
+        product = create_product(self.category)
+        response = self.client.post('/api/cart/add/', {'product_id': product.id}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header('X-Cart-Token'))
+        self.assertEqual(self.client.get('/api/cart/').status_code, 403)
+
+    def test_cart_cache_must_be_shared_between_processes(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with self.settings(CACHES=local):
+            self.assertEqual([error.id for error in check_cart_cache(None)], ['card.E001'])
+            self.assertIsInstance(check_cart_cache(None)[0], checks.Error)
+            with self.settings(CART_ANONYMOUS=False):
+                self.assertEqual(check_cart_cache(None), [])
+                with self.settings(CART_STORE='cache'):
+                    self.assertEqual(len(check_cart_cache(None)), 1)
+        with self.settings(CACHES=shared, CART_STORE='cache'):
+            self.assertEqual(check_cart_cache(None), [])
+
+    @override_settings(CART_STORE='cache')
+    def test_cache_store_is_flushed_to_database_at_checkout(self):
+        product = create_product(self.category, total=5)
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            {'op': 'add', 'product_id': product.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.json()['total_price'], 200)
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.post('/api/cart/checkout/', {'address': 'Tashkent'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(Order.objects.get().items.values_list('product_id', 'quantity')), [(product.id, 2)])
+        self.assertEqual(self.client.get('/api/cart/').json()['items'], [])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_login_merges_anonymous_cart_capped_by_stock(self):
+        shared, anonymous_only = create_product(self.category, total=4), create_product(self.category, total=10)
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=shared, quantity=2)
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            {'op': 'add', 'product_id': shared.id, 'quantity': 3},
+            {'op': 'add', 'product_id': anonymous_only.id, 'quantity': 1},
+        ]}, format='json')
+        token = response['X-Cart-Token']
+
+        CustomUser.objects.filter(pk=self.user.pk).update(otp_code='123456', otp_created_at=timezone.now())
+        response = self.client.post(
+            '/api/verify-otp/', {'email': self.user.email, 'otp_code': '123456'}, format='json',
+            HTTP_X_CART_TOKEN=token,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity')),
+            [(shared.id, 4), (anonymous_only.id, 1)]
+        )
+        self.assertEqual(self.client.get('/api/cart/', HTTP_X_CART_TOKEN=token).json()['items'], [])
+
+
+class CartMergeTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+
+    def test_merge_keeps_lines_it_cannot_add_to(self):
+        sold_out, scarce, plenty = (create_product(self.category, total=total) for total in (0, 1, 10))
+        cart = Cart.objects.create(user=self.user)
+        for product in (sold_out, scarce):
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        store = DatabaseCartStore(self.user)
+        store.merge({sold_out.id: 1, scarce.id: 1, plenty.id: 3})
+        self.assertEqual(store.quantities(), {sold_out.id: 2, scarce.id: 2, plenty.id: 3})
+
+    @override_settings(CART_STORE='cache')
+    def test_cache_store_merge_skips_products_without_stock(self):
+        cache.clear()
+        sold_out = create_product(self.category, total=0)
+        store = CacheCartStore.for_user(self.user)
+        store.save({sold_out.id: 2})
+        store.merge({sold_out.id: 1})
+        self.assertEqual(store.quantities(), {sold_out.id: 2})
+
+
+class CartSweepTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.in_stock = create_product(self.category, total=10)
+        self.out_of_stock = create_product(self.category, total=0)
+
+    def create_cart(self, days_ago, products=()):
+        user = CustomUser.objects.create_user(
+            email=f'buyer{CustomUser.objects.count()}@example.com', password='x', name='A', surname='B',
+            phone_number=f'+99890123{CustomUser.objects.count():04d}',
+        )
+        cart = Cart.objects.create(user=user)
+        for product in products:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        Cart.objects.filter(pk=cart.pk).update(
+            updated_at=timezone.now() - timedelta(days=days_ago), item_count=2 * len(products),
+            total_price=200 * len(products),
+        )
+        return cart.pk
+
+    def test_viewing_cart_does_not_create_rows(self):
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user(
+            email='viewer@example.com', password='x', name='A', surname='B', phone_number='+998909999999'
+        ))
+        self.assertEqual(client.get('/api/cart/').json()['items'], [])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_sweep_prunes_lines_and_removes_stale_carts_in_chunks(self):
+        fresh = self.create_cart(1, [self.in_stock, self.out_of_stock])
+        fresh_empty = self.create_cart(1)
+        self.create_cart(30)
+        self.create_cart(30)
+        kept_abandoned = self.create_cart(30, [self.in_stock])
+        abandoned = self.create_cart(120, [self.in_stock])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'carts.jsonl')
+            out = io.StringIO()
+            call_command('sweep_carts', '--archive', path, '--chunk-size', '1', stdout=out)
+            with open(path, encoding='utf-8') as archive:
+                archived = [json.loads(line) for line in archive]
+
+        self.assertIn("позиций без остатка: 1, пустых корзин: 2, брошенных корзин: 1 (позиций в них: 1)", out.getvalue())
+        self.assertEqual(sorted(Cart.objects.values_list('id', flat=True)), sorted([fresh, fresh_empty, kept_abandoned]))
+        self.assertEqual(
+            Cart.objects.filter(pk=fresh).values_list('item_count', 'total_price').get(), (2, 200)
+        )
+        self.assertEqual(
+            [(cart['id'], cart['items']) for cart in archived],
+            [(abandoned, [{'product_id': self.in_stock.id, 'quantity': 2}])]
+        )
+
+
+class CartCheckoutTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        get_category_tree()
+
+    def add_items(self, count, total=10):
+        for i in range(count):
+            product = create_product(self.category, total=total)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def checkout(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/cart/checkout/', {'address': 'Tashkent'}, format='json')
+        return response, len(context)
+
+    def test_checkout_reserves_stock_snapshots_prices_and_clears_cart(self):
+        self.add_items(3)
+        Product.objects.update(price=100)
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        Product.objects.update(price=500)
+
+        order = Order.objects.get()
+        self.assertEqual(sorted(order.items.values_list('quantity', 'unit_price')), [(2, 100)] * 3)
+        self.assertEqual(set(Product.objects.values_list('total', flat=True)), {8})
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING).count(), 1)
+
+    def test_retried_checkout_with_idempotency_key_replays_order(self):
+        self.add_items(2)
+        first = self.client.post('/api/cart/checkout/', {}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        second = self.client.post('/api/cart/checkout/', {}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_checkout_query_count_is_constant(self):
+        self.add_items(2)
+        _, small = self.checkout()
+        self.add_items(6)
+        _, large = self.checkout()
+        self.assertEqual(large, small)
+
+    def test_checkout_reports_all_shortages_and_changes_nothing(self):
+        self.add_items(2, total=1)
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(set(Product.objects.values_list('total', flat=True)), {1})
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class CartCheckoutConcurrencyTests(TransactionTestCase):
+    """Одновременный checkout многих корзин с одним популярным товаром не продаёт больше остатка."""
+    shoppers = 30
+    stock = 20
+
+    def setUp(self):
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.product = create_product(category, 'Popular', total=self.stock)
+        self.users = []
+        for i in range(self.shoppers):
+            user = CustomUser.objects.create_user(
+                email=f'buyer{i}@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+            )
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.product, quantity=1)
+            self.users.append(user)
+
+    def checkout(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        deadline = time.monotonic() + 60
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    return client.post('/api/cart/checkout/', {}, format='json').status_code
+                except OperationalError:
+                    # SQLite не ждёт блокировку таблицы, а сразу отказывает; повторяем запрос.
+                    # Повтор после уже зафиксированного заказа получит 400 «Корзина пуста».
+                    time.sleep(random.uniform(0.001, 0.02))
+            raise AssertionError("Checkout не удалось выполнить из-за блокировок.")
+        finally:
+            connection.close()
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        with ThreadPoolExecutor(10) as pool:
+            statuses = list(pool.map(self.checkout, self.users))
+
+        self.product.refresh_from_db()
+        self.assertTrue(set(statuses) <= {201, 400})
+        self.assertEqual(self.product.total, 0)
+        self.assertEqual(OrderItem.objects.filter(product=self.product).count(), self.stock)
+        self.assertEqual(Order.objects.values('user').distinct().count(), self.stock)
+        self.assertEqual(OutboxMessage.objects.filter(payload__text__icontains='Новый заказ').count(), self.stock)
+        # Покупатели без заказа сохранили корзину, с заказом — получили пустую.
+        self.assertEqual(CartItem.objects.count(), self.shoppers - self.stock)
@@ -1,10 +1,11 @@
 from django.urls import path
-from .views import CartAPI, CartItemAddAPI, CartItemUpdateAPI, CartItemDeleteAPI, CartCheckoutAPI
+from .views import CartAPI, CartItemAddAPI, CartItemUpdateAPI, CartItemDeleteAPI, CartBatchAPI, CartCheckoutAPI
 
 urlpatterns = [
     path('cart/', CartAPI.as_view(), name='cart-detail'),
     path('cart/add/', CartItemAddAPI.as_view(), name='cart-item-add'),
     path('cart/update/<int:pk>/', CartItemUpdateAPI.as_view(), name='cart-item-update'),
     path('cart/delete/<int:pk>/', CartItemDeleteAPI.as_view(), name='cart-item-delete'),
+    path('cart/batch/', CartBatchAPI.as_view(), name='cart-batch'),
     path('cart/checkout/', CartCheckoutAPI.as_view(), name='cart-checkout'),
 ]
\ No newline at end of file
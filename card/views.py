@@ -1,103 +1,170 @@
-import logging
-import requests
-from django.conf import settings
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from drf_yasg import openapi
 from rest_framework import generics, permissions, serializers
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
-from order.models import Order, OrderItem
+from order.idempotency import idempotency_key_parameter, idempotent
 from order.serializers import OrderSerializer
-from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemAddSerializer, CartItemUpdateSerializer
+from order.services import create_order, planned_orders
+from .serializers import (
+    CartBatchResultSerializer, CartBatchSerializer, CartDeltaSerializer, CartSerializer,
+    CartItemAddSerializer, CartItemUpdateSerializer,
+)
+from .services import clear_cart
+from .stores import CART_TOKEN_HEADER, get_cart_store
+
+full_parameter = openapi.Parameter(
+    'full', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, required=False,
+    description="1 — вернуть всю корзину (CartSerializer) вместо изменённой позиции и итогов."
+)
+cart_token_parameter = openapi.Parameter(
+    CART_TOKEN_HEADER, openapi.IN_HEADER, type=openapi.TYPE_STRING, required=False,
+    description="Токен корзины анонимного покупателя (если включено CART_ANONYMOUS, иначе корзина доступна только после входа). "
+                "Без него создаётся новая корзина, и её токен возвращается в заголовке ответа X-Cart-Token. "
+                "После входа корзина переносится в корзину пользователя."
+)
+
+
+def with_token(store, response):
+    if store.token:
+        response[CART_TOKEN_HEADER] = store.token
+    return response
+
+
+def wants_full(request):
+    return request.query_params.get('full') in ('1', 'true')
+
+
+def cart_response(request, store, cart, item, item_id=None, status=200):
+    """Ответ на изменение корзины: по умолчанию только позиция и итоги, с ?full=1 — вся корзина."""
+    if wants_full(request):
+        return with_token(store, Response(CartSerializer(store.read()).data, status=status))
+    return with_token(store, Response(CartDeltaSerializer({
+        'item': item,
+        'item_id': item.pk if item else item_id,
+        'item_count': cart.item_count,
+        'total_price': cart.total_price,
+    }).data, status=status))
 
 
 class CartAPI(generics.RetrieveAPIView):
     serializer_class = CartSerializer
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        return cart
+    permission_classes = [permissions.AllowAny]
 
     @swagger_auto_schema(
         operation_summary="Получить корзину пользователя",
-        operation_description="Возвращает содержимое корзины текущего аутентифицированного пользователя, включая список продуктов и общую стоимость.",
+        operation_description="Возвращает содержимое корзины текущего пользователя (или анонимной корзины по X-Cart-Token), "
+                              "включая список продуктов и общую стоимость.",
+        manual_parameters=[cart_token_parameter],
         responses={
             200: CartSerializer,
         }
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        store = get_cart_store(request)
+        return with_token(store, Response(CartSerializer(store.read()).data))
 
 
 class CartItemAddAPI(generics.CreateAPIView):
     serializer_class = CartItemAddSerializer
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        context['cart'] = cart
-        return context
+    permission_classes = [permissions.AllowAny]
 
     @swagger_auto_schema(
         operation_summary="Добавить продукт в корзину",
-        operation_description="Добавляет продукт в корзину пользователя. Если продукт уже есть, увеличивает его количество.",
+        operation_description="Добавляет продукт в корзину пользователя. Если продукт уже есть, увеличивает его количество. "
+                              "Возвращает изменённую позицию и новые итоги корзины, с ?full=1 — всю корзину.",
         request_body=CartItemAddSerializer,
+        manual_parameters=[full_parameter, cart_token_parameter],
         responses={
-            201: CartSerializer,
+            201: CartDeltaSerializer,
             400: "Неверные данные или продукт не найден",
         }
     )
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        cart = Cart.objects.get(user=self.request.user)
-        return Response(CartSerializer(cart).data, status=201)
+        store = get_cart_store(request)
+        cart, item = store.add(serializer.validated_data['product_id'], serializer.validated_data['quantity'])
+        return cart_response(request, store, cart, item, status=201)
 
 
-class CartItemUpdateAPI(generics.UpdateAPIView):
-    serializer_class = CartItemUpdateSerializer
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get_queryset(self):
-        return CartItem.objects.filter(cart__user=self.request.user)
+class CartItemUpdateAPI(APIView):
+    permission_classes = [permissions.AllowAny]
 
     @swagger_auto_schema(
         operation_summary="Обновить количество продукта в корзине",
-        operation_description="Обновляет количество указанного продукта в корзине пользователя.",
+        operation_description="Обновляет количество указанного продукта в корзине пользователя. "
+                              "Возвращает изменённую позицию и новые итоги корзины, с ?full=1 — всю корзину.",
         request_body=CartItemUpdateSerializer,
+        manual_parameters=[full_parameter, cart_token_parameter],
         responses={
-            200: CartSerializer,
+            200: CartDeltaSerializer,
             404: "Элемент корзины не найден",
         }
     )
     def patch(self, request, *args, **kwargs):
-        response = super().patch(request, *args, **kwargs)
-        cart = Cart.objects.get(user=self.request.user)
-        return Response(CartSerializer(cart).data)
+        return self.update(request, *args, **kwargs)
 
+    def put(self, request, *args, **kwargs):
+        return self.update(request, *args, **kwargs)
+
+    def update(self, request, pk):
+        serializer = CartItemUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        store = get_cart_store(request)
+        cart, item = store.update(pk, serializer.validated_data['quantity'])
+        return cart_response(request, store, cart, item)
 
-class CartItemDeleteAPI(generics.DestroyAPIView):
-    permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        return CartItem.objects.filter(cart__user=self.request.user)
+class CartItemDeleteAPI(APIView):
+    permission_classes = [permissions.AllowAny]
 
     @swagger_auto_schema(
         operation_summary="Удалить продукт из корзины",
-        operation_description="Удаляет указанный продукт из корзины пользователя.",
+        operation_description="Удаляет указанный продукт из корзины пользователя. "
+                              "Возвращает item=null, item_id удалённой позиции и новые итоги, с ?full=1 — всю корзину.",
+        manual_parameters=[full_parameter, cart_token_parameter],
         responses={
-            204: "Продукт успешно удален",
+            200: CartDeltaSerializer,
             404: "Элемент корзины не найден",
         }
     )
-    def delete(self, request, *args, **kwargs):
-        response = super().delete(request, *args, **kwargs)
-        cart = Cart.objects.get(user=self.request.user)
-        return Response(CartSerializer(cart).data, status=200)
+    def delete(self, request, pk):
+        store = get_cart_store(request)
+        cart, item_id = store.remove(pk)
+        return cart_response(request, store, cart, None, item_id=item_id)
+
+
+class CartBatchAPI(generics.GenericAPIView):
+    serializer_class = CartBatchSerializer
+    permission_classes = [permissions.AllowAny]
+
+    @swagger_auto_schema(
+        operation_summary="Пакетное изменение корзины",
+        operation_description="Применяет список операций add/set/remove одной транзакцией: либо все, либо ни одной. "
+                              "Остатки проверяются по всем продуктам сразу, ошибка перечисляет все недостающие. "
+                              "Возвращает изменённые позиции и новые итоги, с ?full=1 — всю корзину.",
+        request_body=CartBatchSerializer,
+        manual_parameters=[full_parameter, cart_token_parameter],
+        responses={
+            200: CartBatchResultSerializer,
+            400: "Неверные операции, продукт не найден или недостаточно товара",
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        store = get_cart_store(request)
+        cart, items, removed = store.batch(serializer.validated_data['operations'])
+        if wants_full(request):
+            return with_token(store, Response(CartSerializer(store.read()).data))
+        return with_token(store, Response(CartBatchResultSerializer({
+            'items': items,
+            'removed_item_ids': removed,
+            'item_count': cart.item_count,
+            'total_price': cart.total_price,
+        }).data))
 
 
 class CartCheckoutAPI(generics.CreateAPIView):
@@ -126,71 +193,28 @@ class CartCheckoutAPI(generics.CreateAPIView):
                 "comment": "Please deliver after 5 PM"
             }
         ),
+        manual_parameters=[idempotency_key_parameter],
         responses={
             201: OrderSerializer,
             400: "Корзина пуста или продукты не найдены",
         }
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
-        cart = get_object_or_404(Cart, user=self.request.user)
-        if not cart.items.exists():
-            raise serializers.ValidationError("Корзина пуста.")
-
-        for item in cart.items.all():
-            if item.product.total < item.quantity:
-                raise serializers.ValidationError(
-                    f"Недостаточно товара для продукта ID {item.product.id}: "
-                    f"доступно {item.product.total}, запрошено {item.quantity}."
-                )
-
         address = request.data.get('address', '')
         comment = request.data.get('comment', '')
 
-        order = Order.objects.create(
-            user=self.request.user,
-            address=address,
-            comment=comment
-        )
-        order_items = [
-            OrderItem(
-                order=order,
-                product=item.product,
-                quantity=item.quantity
-            )
-            for item in cart.items.all()
-        ]
-        OrderItem.objects.bulk_create(order_items)
-
-        total_price = sum(item.quantity * item.product.price for item in cart.items.all())
-        product_list = "\n".join(
-            [f"- {item.product.title} (ID: {item.product.id}, Кол-во: {item.quantity}, Цена: {item.product.price})"
-             for item in cart.items.all()]
-        )
-        message = (
-            f"<b>🛒 Новый заказ #{order.id}</b>\n\n"
-            f"<b>👤 Клиент:</b> {self.request.user.name} {self.request.user.surname}\n"
-            f"<b>📞 Телефон:</b> {self.request.user.phone_number}\n"
-            f"<b>🏠 Адрес доставки:</b> {order.address or 'Не указан'}\n"
-            f"<b>💬 Комментарий:</b> {order.comment or 'Не указан'}\n"
-            f"<b>📦 Продукты:</b>\n{product_list}\n\n"
-            f"<b>💵 Общая сумма:</b> {total_price}\n"
-            f"<b>📅 Дата:</b> {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-            f"<b>📢 Статус:</b> {order.status}"
-        )
-
-        telegram_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
-        payload = {
-            'chat_id': settings.TELEGRAM_CHAT_ID,
-            'text': message,
-            'parse_mode': 'HTML'
-        }
-        try:
-            response = requests.post(telegram_url, json=payload)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            logger = logging.getLogger(__name__)
-            logger.error(f"Не удалось отправить сообщение в Telegram: {e}")
-
-        cart.items.all().delete()
-
+        # Корзина из кэша сначала переносится в базу; строка корзины блокируется,
+        # чтобы повторный checkout той же корзины не создал второй заказ.
+        store = get_cart_store(request)
+        with transaction.atomic():
+            cart = store.flush()
+            items = list(cart.items.values_list('product_id', 'quantity'))
+            if not items:
+                raise serializers.ValidationError("Корзина пуста.")
+            order = create_order(self.request.user, items, address=address, comment=comment)
+            clear_cart(cart)
+        store.checked_out()
+
+        order = planned_orders().get(pk=order.pk)
         return Response(OrderSerializer(order).data, status=201)
\ No newline at end of file
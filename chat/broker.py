@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class SubscriptionOverflow(Exception):
+    """Подписчик не успевал читать события, и часть их потеряна; клиенту нужно пересинхронизироваться."""
+
+
+class Subscription:
+    """Подписка на канал в event loop соединения; события читаются через await get()."""
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Потокобезопасно: publish может вызываться из потока синхронного view."""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        if self.overflowed:
+            raise SubscriptionOverflow(self.channel)
+        event = await self.queue.get()
+        if self.overflowed:
+            raise SubscriptionOverflow(self.channel)
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """Интерфейс pub/sub для доставки событий чата.
+
+    publish вызывается синхронно (из view после коммита) и не должен блокироваться надолго;
+    subscribe вызывается из корутины соединения и возвращает объект с async get() и close().
+    Межпроцессная реализация (например, поверх Redis pub/sub) подключается через CHAT_BROKER.
+    """
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+
+class InMemoryBroker(Broker):
+    """Брокер внутри процесса: доставляет события подписчикам того же ASGI-процесса.
+
+    Подходит для одного процесса и для тестов; при нескольких воркерах или REST под WSGI нужен
+    межпроцессный брокер (см. проверку chat.E001).
+    """
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or settings.CHAT_SUBSCRIBER_QUEUE_SIZE
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self.lock:
+            self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.channel]
+
+
+_brokers = {}
+
+
+def get_broker():
+    path = settings.CHAT_BROKER
+    broker = _brokers.get(path)
+    if broker is None:
+        broker = _brokers.setdefault(path, import_string(path)())
+    return broker
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core import checks
+from django.utils.module_loading import import_string
+
+from .broker import InMemoryBroker
+
+
+@checks.register()
+def check_chat_broker(app_configs, **kwargs):
+    """InMemoryBroker доставляет события только сокетам своего процесса: вне DEBUG он допустим, лишь когда
+    REST и WebSocket обслуживает один ASGI-процесс (CHAT_IN_MEMORY_BROKER_ALLOWED)."""
+    try:
+        broker = import_string(settings.CHAT_BROKER)
+    except ImportError as e:
+        return [checks.Error(f"Не удалось импортировать CHAT_BROKER: {e}", id='chat.E002')]
+    if isinstance(broker, type) and issubclass(broker, InMemoryBroker) and not settings.CHAT_IN_MEMORY_BROKER_ALLOWED:
+        return [checks.Error(
+            f"CHAT_BROKER={settings.CHAT_BROKER} доставляет события чата только внутри одного процесса.",
+            hint="Подключите межпроцессный брокер (например, поверх Redis pub/sub) в CHAT_BROKER или, если REST "
+                 "и WebSocket обслуживает один ASGI-процесс, установите CHAT_IN_MEMORY_BROKER_ALLOWED=True.",
+            id='chat.E001',
+        )]
+    return []
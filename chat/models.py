@@ -31,5 +31,11 @@ class Message(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['chat', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender} in {self.chat}"
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Q
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .broker import SubscriptionOverflow, get_broker
+from .models import Chat, Message
+
+logger = logging.getLogger(__name__)
+
+CHAT_SOCKET_PATH = '/ws/chats/'
+
+# Коды закрытия WebSocket (диапазон 4000-4999 отведён приложениям).
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_OVERFLOW = 4408
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def publish_to_chat(chat, event, exclude=None):
+    """Отправляет событие всем участникам чата (кроме exclude) сразу, без ожидания коммита."""
+    broker = get_broker()
+    for user_id in {chat.user_id, chat.specialist_id} - {exclude}:
+        broker.publish(user_channel(user_id), event)
+
+
+def publish_on_commit(chat, event, exclude=None):
+    """Событие уходит только после коммита, чтобы клиент, получив его, мог сразу прочитать данные по REST."""
+    transaction.on_commit(lambda: publish_to_chat(chat, event, exclude))
+
+
+def mark_read(chat, reader, up_to=None):
+    """Отмечает прочитанными входящие сообщения чата (до up_to включительно) и рассылает квитанцию."""
+    messages = Message.objects.filter(chat=chat, is_read=False).exclude(sender=reader)
+    if up_to is not None:
+        messages = messages.filter(id__lte=up_to)
+    with transaction.atomic():
+        last_id = messages.order_by('-id').values_list('id', flat=True).first()
+        if last_id is None:
+            return 0
+        count = messages.filter(id__lte=last_id).update(is_read=True)
+        publish_on_commit(chat, {'type': 'messages.read', 'chat': chat.id, 'reader': reader.id, 'up_to': last_id})
+    return count
+
+
+@sync_to_async
+def authenticate(scope):
+    """Пользователь по access-токену из ?token=... (браузеры не передают заголовки при открытии WebSocket)."""
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+    if not token:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.is_active else None
+
+
+@sync_to_async
+def find_chat(user, chat_id):
+    return Chat.objects.filter(Q(user=user) | Q(specialist=user), pk=chat_id).only('id', 'user_id', 'specialist_id').first()
+
+
+class ChatSocket:
+    """Одно соединение WebSocket пользователя: доставляет события всех его чатов.
+
+    Сервер шлёт JSON-события message.created, message.updated, message.deleted, messages.read и typing.
+    Клиент может слать {"type": "typing", "chat": id} и {"type": "read", "chat": id, "up_to": id}.
+    Сообщения по-прежнему отправляются через REST. После переподключения (в том числе по коду 4408,
+    когда клиент не успевал читать события) пропущенное дочитывается по /api/chats/{id}/messages/.
+    """
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.user = None
+        self.chats = {}
+
+    async def send_json(self, data):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(data, ensure_ascii=False)})
+
+    async def __call__(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        self.user = await authenticate(self.scope)
+        if self.user is None:
+            await self.send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+            return
+        await self.send({'type': 'websocket.accept'})
+
+        subscription = get_broker().subscribe(user_channel(self.user.id))
+        forwarder = asyncio.ensure_future(self.forward(subscription))
+        try:
+            while True:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message['type'] == 'websocket.receive':
+                    await self.handle(message.get('text') or '')
+        finally:
+            forwarder.cancel()
+            subscription.close()
+
+    async def forward(self, subscription):
+        try:
+            while True:
+                await self.send_json(await subscription.get())
+        except SubscriptionOverflow:
+            logger.warning(f"Chat socket of user {self.user.id} fell behind and was closed")
+            await self.send({'type': 'websocket.close', 'code': CLOSE_OVERFLOW})
+
+    async def chat(self, chat_id):
+        if chat_id not in self.chats:
+            self.chats[chat_id] = await find_chat(self.user, chat_id)
+        return self.chats[chat_id]
+
+    async def handle(self, text):
+        try:
+            event = json.loads(text)
+            chat_id = int(event['chat'])
+            up_to = int(event['up_to']) if event.get('up_to') is not None else None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            await self.send_json({'type': 'error', 'detail': 'Expected JSON with "type" and "chat".'})
+            return
+        chat = await self.chat(chat_id)
+        if chat is None:
+            await self.send_json({'type': 'error', 'detail': 'You are not a participant of this chat.'})
+            return
+        if event.get('type') == 'typing':
+            publish_to_chat(chat, {'type': 'typing', 'chat': chat.id, 'user': self.user.id}, exclude=self.user.id)
+        elif event.get('type') == 'read':
+            await sync_to_async(mark_read)(chat, self.user, up_to)
+        else:
+            await self.send_json({'type': 'error', 'detail': 'Unknown event type.'})
+
+
+async def chat_socket(scope, receive, send):
+    await ChatSocket(scope, receive, send)()
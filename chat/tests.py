@@ -1,3 +1,121 @@
-from django.test import TestCase
+import asyncio
+import json
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from conf.asgi import application
+from user.models import CustomUser
+from .broker import InMemoryBroker, SubscriptionOverflow
+from .checks import check_chat_broker
+from .models import Chat, Message
+
+
+class InMemoryBrokerTests(SimpleTestCase):
+    async def test_publish_reaches_only_channel_subscribers(self):
+        broker = InMemoryBroker(queue_size=10)
+        first, other = broker.subscribe('user:1'), broker.subscribe('user:2')
+        broker.publish('user:1', {'type': 'typing'})
+        self.assertEqual(await asyncio.wait_for(first.get(), 1), {'type': 'typing'})
+        self.assertTrue(other.queue.empty())
+        first.close()
+        other.close()
+        self.assertEqual(broker.subscriptions, {})
+
+    async def test_slow_subscriber_overflows(self):
+        broker = InMemoryBroker(queue_size=1)
+        subscription = broker.subscribe('user:1')
+        for i in range(3):
+            broker.publish('user:1', {'n': i})
+        await asyncio.sleep(0)
+        with self.assertRaises(SubscriptionOverflow):
+            await subscription.get()
+
+
+class ChatBrokerCheckTests(SimpleTestCase):
+    @override_settings(CHAT_BROKER='chat.broker.InMemoryBroker', CHAT_IN_MEMORY_BROKER_ALLOWED=False)
+    def test_in_memory_broker_requires_explicit_permission(self):
+        self.assertEqual([error.id for error in check_chat_broker(None)], ['chat.E001'])
+        with self.settings(CHAT_IN_MEMORY_BROKER_ALLOWED=True):
+            self.assertEqual(check_chat_broker(None), [])
+        with self.settings(CHAT_BROKER='chat.broker.Broker'):
+            self.assertEqual(check_chat_broker(None), [])
+        with self.settings(CHAT_BROKER='chat.broker.Missing'):
+            self.assertEqual([error.id for error in check_chat_broker(None)], ['chat.E002'])
+
+
+class ChatSocketTests(TransactionTestCase):
+    def setUp(self):
+        self.patient = CustomUser.objects.create_user(
+            email='patient@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.specialist = CustomUser.objects.create_user(
+            email='doctor@example.com', password='x', name='C', surname='D', phone_number='+998901234568',
+            role='specialist',
+        )
+        self.chat = Chat.objects.create(user=self.patient, specialist=self.specialist)
+
+    async def connect(self, user=None, token=None):
+        if user is not None:
+            token = str(AccessToken.for_user(user))
+        query_string = f'token={token}'.encode() if token else b''
+        socket = ApplicationCommunicator(application, {
+            'type': 'websocket', 'path': '/ws/chats/', 'query_string': query_string, 'headers': [],
+        })
+        await socket.send_input({'type': 'websocket.connect'})
+        return socket, await socket.receive_output(1)
+
+    async def receive_event(self, socket):
+        output = await socket.receive_output(1)
+        self.assertEqual(output['type'], 'websocket.send')
+        return json.loads(output['text'])
+
+    async def test_rejects_missing_or_invalid_token(self):
+        for token in (None, 'invalid'):
+            socket, output = await self.connect(token=token)
+            self.assertEqual(output, {'type': 'websocket.close', 'code': 4401})
+
+    async def test_participants_receive_messages_receipts_and_typing(self):
+        patient, output = await self.connect(self.patient)
+        self.assertEqual(output, {'type': 'websocket.accept'})
+        specialist, _ = await self.connect(self.specialist)
+
+        def send_message():
+            client = APIClient()
+            client.force_authenticate(self.patient)
+            return client.post('/api/messages/', {'chat': self.chat.id, 'text': 'Hello'}, format='json')
+
+        response = await sync_to_async(send_message)()
+        self.assertEqual(response.status_code, 201)
+        for socket in (specialist, patient):
+            event = await self.receive_event(socket)
+            self.assertEqual((event['type'], event['chat'], event['message']['text']), ('message.created', self.chat.id, 'Hello'))
+
+        await specialist.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'read', 'chat': self.chat.id})})
+        event = await self.receive_event(patient)
+        self.assertEqual(event, {
+            'type': 'messages.read', 'chat': self.chat.id, 'reader': self.specialist.id, 'up_to': response.json()['id'],
+        })
+        self.assertTrue(await Message.objects.filter(pk=response.json()['id'], is_read=True).aexists())
+        await self.receive_event(specialist)
+
+        await patient.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'typing', 'chat': self.chat.id})})
+        self.assertEqual(await self.receive_event(specialist), {'type': 'typing', 'chat': self.chat.id, 'user': self.patient.id})
+        self.assertTrue(await patient.receive_nothing(0.1))
+
+        for socket in (patient, specialist):
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(1)
+
+    async def test_outsider_cannot_send_events_to_chat(self):
+        outsider = await CustomUser.objects.acreate(
+            email='other@example.com', name='E', surname='F', phone_number='+998901234569'
+        )
+        socket, _ = await self.connect(outsider)
+        await socket.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'typing', 'chat': self.chat.id})})
+        self.assertEqual((await self.receive_event(socket))['type'], 'error')
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(1)
@@ -5,6 +5,8 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from .models import Chat, Message
 from .serializers import ChatSerializer, MessageSerializer
+from .realtime import mark_read, publish_on_commit
+from conf.pagination import CreatedAtCursorPagination
 from user.models import CustomUser
 from django.db.models import Q
 from django.contrib.auth.models import AnonymousUser
@@ -252,13 +254,52 @@ class ChatViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'], serializer_class=MessageSerializer)
     def messages(self, request, pk=None):
         chat = self.get_object()
-        messages = chat.messages.all()
+        messages = chat.messages.select_related('chat', 'sender')
+        paginator = CreatedAtCursorPagination()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
         serializer = self.get_serializer(messages, many=True)
         return Response(serializer.data)
 
+    @swagger_auto_schema(
+        operation_summary="Отметить сообщения прочитанными",
+        operation_description="Отмечает прочитанными входящие сообщения чата (все или до up_to включительно). "
+                              "Участники чата получают событие messages.read по WebSocket /ws/chats/.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                "up_to": openapi.Schema(type=openapi.TYPE_INTEGER, description="ID последнего прочитанного сообщения")
+            },
+            example={"up_to": 42}
+        ),
+        responses={
+            200: openapi.Response(
+                description="Число отмеченных сообщений",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={"updated": openapi.Schema(type=openapi.TYPE_INTEGER)}
+                )
+            ),
+            400: "Неверный up_to",
+            404: "Чат не найден"
+        }
+    )
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        chat = self.get_object()
+        up_to = request.data.get('up_to')
+        if up_to is not None:
+            try:
+                up_to = int(up_to)
+            except (TypeError, ValueError):
+                raise serializers.ValidationError({'up_to': 'Invalid message ID'})
+        return Response({'updated': mark_read(chat, request.user, up_to)})
+
 class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
@@ -329,8 +370,18 @@ class MessageViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Chat not found'}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer.save(chat=chat, sender=self.request.user)
+        publish_on_commit(chat, {'type': 'message.created', 'chat': chat.id, 'message': serializer.data})
         logger.info(f"Message sent by user {self.request.user.id} in chat {chat_id}")
 
+    def perform_update(self, serializer):
+        message = serializer.save()
+        publish_on_commit(message.chat, {'type': 'message.updated', 'chat': message.chat_id, 'message': serializer.data})
+
+    def perform_destroy(self, instance):
+        chat, message_id = instance.chat, instance.id
+        instance.delete()
+        publish_on_commit(chat, {'type': 'message.deleted', 'chat': chat.id, 'message_id': message_id})
+
     @swagger_auto_schema(
         operation_summary="Обновить сообщение",
         operation_description="Обновляет текст указанного сообщения по его ID. Доступно только отправителю.",
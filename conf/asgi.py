@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conf.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после настройки Django: модуль чата обращается к моделям.
+from chat.realtime import CHAT_SOCKET_PATH, chat_socket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """HTTP обслуживает Django; WebSocket /ws/chats/ — push-канал событий чата (chat.realtime)."""
+    if scope['type'] == 'websocket':
+        if scope['path'] == CHAT_SOCKET_PATH:
+            return await chat_socket(scope, receive, send)
+        await receive()
+        return await send({'type': 'websocket.close', 'code': 4404})
+    return await django_application(scope, receive, send)
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.translation.trans_real import parse_accept_lang_header
+from rest_framework.permissions import SAFE_METHODS
+
+LANGUAGES = ('uz', 'ru', 'en')
+ALL_LANGUAGES = 'all'
+_UNSET = object()
+
+
+def get_response_language(request):
+    """Язык ответа: ?lang=uz|ru|en, иначе Accept-Language. None — полная трёхъязычная форма.
+
+    Полную форму получают запросы на запись, ?lang=all и клиенты без предпочтений,
+    поэтому админка и редакторы работают как раньше.
+    """
+    if request is None:
+        return None
+    cached = getattr(request, '_response_language', _UNSET)
+    if cached is not _UNSET:
+        return cached
+
+    language = None
+    if request.method in SAFE_METHODS:
+        requested = request.GET.get('lang')
+        if requested:
+            language = requested if requested in LANGUAGES else None
+        else:
+            for code, _ in parse_accept_lang_header(request.META.get('HTTP_ACCEPT_LANGUAGE', '')):
+                code = code.split('-')[0].lower()
+                if code in LANGUAGES:
+                    language = code
+                    break
+    # Кэшируем на исходном HttpRequest, чтобы middleware мог выставить Content-Language.
+    getattr(request, '_request', request)._response_language = language
+    request._response_language = language
+    return language
+
+
+def fallback_chain(language):
+    return (language, *settings.LOCALE_FALLBACKS.get(language, ()))
+
+
+def localize(data, fields, language):
+    """Сворачивает field_uz/field_ru/field_en в одно поле field на языке language.
+
+    Пустой перевод заменяется следующим по цепочке LOCALE_FALLBACKS.
+    """
+    if language is None:
+        return data
+    chain = fallback_chain(language)
+    for field in fields:
+        keys = [f'{field}_{lang}' for lang in LANGUAGES]
+        if not any(key in data for key in keys):
+            continue
+        values = {lang: data.pop(f'{field}_{lang}', None) for lang in LANGUAGES}
+        data[field] = next((values[lang] for lang in chain if values.get(lang)), values[language])
+    return data
+
+
+class LocalizedFieldsMixin:
+    """Для сериализаторов: в ответах на выбранном языке оставляет одно поле вместо трёх переводов.
+
+    Язык берётся из context['language'], а если его нет — из context['request'].
+    """
+    localized_fields = ()
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        if 'language' in self.context:
+            language = self.context['language']
+        else:
+            language = get_response_language(self.context.get('request'))
+        return localize(representation, self.localized_fields, language)
+
+
+class ContentLanguageMiddleware:
+    """Ответы зависят от Accept-Language, поэтому помечаем их для кэшей и сообщаем выбранный язык."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method in SAFE_METHODS:
+            patch_vary_headers(response, ('Accept-Language',))
+        language = getattr(request, '_response_language', None)
+        if language:
+            response.setdefault('Content-Language', language)
+        return response
@@ -0,0 +1,184 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder обрезает время до миллисекунд; курсору нужны точные значения, иначе строки
+    в пределах той же миллисекунды окажутся после курсора и страница повторится."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная (keyset) пагинация по стабильной индексированной сортировке.
+
+    Курсор хранит значения всех полей сортировки последней строки страницы, включая id, и следующая
+    страница выбирается условием (value, id) > (v, id) без OFFSET, даже когда значения повторяются.
+    Каждая сортировка должна заканчиваться на id и состоять из полей без NULL.
+
+    Включается, когда клиент передаёт cursor или page_size, а при PAGINATION_REQUIRED=True
+    работает всегда. Без неё список отдаётся целиком, как раньше.
+    """
+    page_size = settings.PAGINATION_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+    ordering = ('-id',)
+    ordering_param = 'ordering'
+    # Разрешённые значения ?ordering=; каждая сортировка должна быть покрыта индексом.
+    ordering_options = {}
+
+    def is_requested(self, request):
+        return (
+            settings.PAGINATION_REQUIRED
+            or self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
+
+    def get_ordering(self, request, queryset, view):
+        name = request.query_params.get(self.ordering_param)
+        if not name:
+            return self.ordering
+        if name not in self.ordering_options:
+            raise ValidationError({
+                self.ordering_param: f"Допустимые значения: {', '.join(self.ordering_options)}."
+            })
+        return self.ordering_options[name]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+
+        reverse, position = self.decode_cursor(request)
+        ordering = [flip(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_q(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        # Строка курсора существует по ту сторону, откуда пришёл клиент.
+        self.has_next, self.has_previous = (position is not None, has_more) if reverse else (has_more, position is not None)
+        return self.page
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_', validate=True))
+            values = cursor['p']
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return bool(cursor.get('r')), position
+        except (TypeError, ValueError, KeyError, UnicodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        values = [getattr(item, field.lstrip('-')) for field in self.ordering]
+        cursor = {'p': values, 'r': 1} if reverse else {'p': values}
+        encoded = b64encode(json.dumps(cursor, cls=CursorEncoder).encode(), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+def flip(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def keyset_q(ordering, position):
+    """Строки строго после position в порядке ordering: (a, b, id) > (va, vb, vid) в раскрытом виде.
+
+    Первое условие по ведущему полю (>=) дублирует дизъюнкцию, чтобы запрос шёл по диапазону индекса.
+    """
+    def compare(field, strict):
+        name = field.lstrip('-')
+        lookup = ('lt' if field.startswith('-') else 'gt') + ('' if strict else 'e')
+        return f'{name}__{lookup}'
+
+    after = Q()
+    for i in range(len(ordering)):
+        step = Q(**{compare(ordering[i], strict=True): position[i]})
+        for field, value in zip(ordering[:i], position[:i]):
+            step &= Q(**{field.lstrip('-'): value})
+        after |= step
+    return Q(**{compare(ordering[0], strict=False): position[0]}) & after
+
+
+class IdCursorPagination(KeysetPagination):
+    ordering = ('-id',)
+
+
+class CreatedAtCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class ChangeFeedPagination(KeysetPagination):
+    """Лента изменений: всегда постранично, от старых изменений к новым.
+
+    Курсор хранит (updated_at, id): заказы, получившие одинаковый updated_at при массовом переходе,
+    не теряются и не повторяются между страницами. Кроме next ответ всегда содержит poll — ссылку,
+    продолжающую ленту после последнего полученного изменения (на пустой странице — тот же запрос),
+    чтобы опрос возобновлялся с курсора, а не с updated_at.
+    """
+    ordering = ('updated_at', 'id')
+
+    def is_requested(self, request):
+        return True
+
+    def get_poll_link(self):
+        if not self.page:
+            return self.base_url
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'poll': self.get_poll_link(),
+            'results': data,
+        })
+
+
+class ProductCursorPagination(KeysetPagination):
+    ordering = ('-id',)
+    ordering_options = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        '-rating_count': ('-rating_count', '-id'),
+    }
@@ -32,6 +32,7 @@ INSTALLED_APPS = [
     'drf_yasg',
     'order',
     'card',
+    'notifications',
 ]
 
 MIDDLEWARE = [
@@ -43,6 +44,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'conf.localization.ContentLanguageMiddleware',
 ]
 
 ROOT_URLCONF = 'conf.urls'
@@ -115,6 +117,17 @@ REST_FRAMEWORK = {
     ]
 }
 
+PAGINATION_PAGE_SIZE = config('PAGINATION_PAGE_SIZE', default=20, cast=int)
+PAGINATION_MAX_PAGE_SIZE = config('PAGINATION_MAX_PAGE_SIZE', default=100, cast=int)
+PAGINATION_REQUIRED = config('PAGINATION_REQUIRED', default=False, cast=bool)
+
+# Порядок подстановки перевода, если на запрошенном языке поле пустое.
+LOCALE_FALLBACKS = {
+    'uz': ('ru', 'en'),
+    'ru': ('uz', 'en'),
+    'en': ('ru', 'uz'),
+}
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=31),
@@ -139,6 +152,9 @@ EMAIL_PORT = config('EMAIL_PORT', cast=int)
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+# Письма ставятся в очередь (notifications.OutboxMessage) и отправляются воркером dispatch_notifications.
+EMAIL_MESSAGES_PER_RECIPIENT_PER_MINUTE = config('EMAIL_MESSAGES_PER_RECIPIENT_PER_MINUTE', default=5, cast=int)
 
 AUTH_USER_MODEL = 'user.CustomUser'
 
@@ -148,4 +164,62 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN')
-TELEGRAM_CHAT_ID = config('TELEGRAM_CHAT_ID')
\ No newline at end of file
+TELEGRAM_CHAT_ID = config('TELEGRAM_CHAT_ID')
+TELEGRAM_API_URL = config('TELEGRAM_API_URL', default='https://api.telegram.org')
+TELEGRAM_TIMEOUT = config('TELEGRAM_TIMEOUT', default=10, cast=float)
+# Лимиты Bot API: около 30 сообщений в секунду на бота и 20 в минуту в одну группу.
+TELEGRAM_MESSAGES_PER_SECOND = config('TELEGRAM_MESSAGES_PER_SECOND', default=30, cast=int)
+TELEGRAM_MESSAGES_PER_CHAT_PER_MINUTE = config('TELEGRAM_MESSAGES_PER_CHAT_PER_MINUTE', default=20, cast=int)
+
+# Очередь уведомлений (notifications.OutboxMessage), её разбирает manage.py dispatch_notifications.
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=50, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+OUTBOX_RETRY_BASE_DELAY = config('OUTBOX_RETRY_BASE_DELAY', default=5, cast=float)
+OUTBOX_RETRY_MAX_DELAY = config('OUTBOX_RETRY_MAX_DELAY', default=3600, cast=float)
+OUTBOX_LEASE_SECONDS = config('OUTBOX_LEASE_SECONDS', default=120, cast=int)
+OUTBOX_POLL_INTERVAL = config('OUTBOX_POLL_INTERVAL', default=1, cast=float)
+
+# Idempotency-Key для создания заказов: сколько хранится ответ и через сколько незавершённый запрос считается оборванным.
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', default=60, cast=int)
+
+# Сколько строк выгрузки заказов читать из БД за раз (order.export).
+ORDER_EXPORT_CHUNK_SIZE = config('ORDER_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Склад: порог уведомления о заканчивающемся товаре (если у продукта не задан свой) и задержка сверки
+# с журналом — записи моложе неё могут принадлежать ещё не зафиксированным транзакциям.
+LOW_STOCK_THRESHOLD = config('LOW_STOCK_THRESHOLD', default=5, cast=int)
+INVENTORY_RECONCILE_LAG = config('INVENTORY_RECONCILE_LAG', default=60, cast=int)
+
+# Сколько операций принимает /api/cart/batch/ за один запрос.
+CART_BATCH_MAX_OPERATIONS = config('CART_BATCH_MAX_OPERATIONS', default=100, cast=int)
+# Хранилище корзин авторизованных пользователей: 'db' (таблицы Cart/CartItem) или 'cache' (кэш с TTL,
+# в базу переносится при оформлении заказа). Анонимные корзины (X-Cart-Token) живут только в кэше и
+# включаются CART_ANONYMOUS. Для них и для CART_STORE='cache' CART_CACHE_ALIAS должен указывать на общий
+# для всех процессов кэш (например, Redis): с локальным LocMemCache проверка card.E001 не даст запуститься.
+CART_STORE = config('CART_STORE', default='db')
+CART_ANONYMOUS = config('CART_ANONYMOUS', default=False, cast=bool)
+CART_CACHE_ALIAS = config('CART_CACHE_ALIAS', default='default')
+CART_CACHE_TTL = config('CART_CACHE_TTL', default=7 * 24 * 3600, cast=int)
+# sweep_carts: через сколько дней без изменений удаляются пустые и брошенные (непустые) корзины.
+CART_EMPTY_RETENTION_DAYS = config('CART_EMPTY_RETENTION_DAYS', default=7, cast=int)
+CART_ABANDONED_RETENTION_DAYS = config('CART_ABANDONED_RETENTION_DAYS', default=90, cast=int)
+
+# Доставка событий чата по WebSocket (conf.asgi): брокер pub/sub и сколько событий держать
+# для медленного подписчика, прежде чем закрыть соединение (клиент переподключится и дочитает по REST).
+# InMemoryBroker работает только внутри процесса: вне DEBUG проверка chat.E001 требует межпроцессный брокер,
+# если явно не указано, что REST и WebSocket обслуживает один ASGI-процесс.
+CHAT_BROKER = config('CHAT_BROKER', default='chat.broker.InMemoryBroker')
+CHAT_IN_MEMORY_BROKER_ALLOWED = config('CHAT_IN_MEMORY_BROKER_ALLOWED', default=DEBUG, cast=bool)
+CHAT_SUBSCRIBER_QUEUE_SIZE = config('CHAT_SUBSCRIBER_QUEUE_SIZE', default=100, cast=int)
+
+PRODUCT_SEARCH_INDEX_TTL = config('PRODUCT_SEARCH_INDEX_TTL', default=900, cast=int)
+
+AUTOCOMPLETE_INDEX_TTL = config('AUTOCOMPLETE_INDEX_TTL', default=900, cast=int)
+AUTOCOMPLETE_MAX_LIMIT = 10
+
+CATEGORY_TREE_TTL = config('CATEGORY_TREE_TTL', default=3600, cast=int)
+
+PRODUCT_FACETS_CACHE_TTL = config('PRODUCT_FACETS_CACHE_TTL', default=60, cast=int)
+# Границы ценовых интервалов фасета: [0, 10000), [10000, 25000), ..., [500000, ∞).
+PRODUCT_FACET_PRICE_BUCKETS = [0, 10000, 25000, 50000, 100000, 250000, 500000]
@@ -0,0 +1,19 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'channel', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'channel')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    show_full_result_count = False
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        queryset.exclude(status=OutboxMessage.STATUS_SENT).update(
+            status=OutboxMessage.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+    retry.short_description = 'Отправить повторно'
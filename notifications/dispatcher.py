@@ -0,0 +1,125 @@
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxMessage
+from .senders import DeliveryError, EmailSender, TelegramSender, Throttled
+
+logger = logging.getLogger(__name__)
+
+
+def build_senders():
+    return {
+        OutboxMessage.CHANNEL_TELEGRAM: TelegramSender.from_settings(),
+        OutboxMessage.CHANNEL_EMAIL: EmailSender.from_settings(),
+    }
+
+
+class OutboxDispatcher:
+    """Доставляет сообщения из OutboxMessage.
+
+    Пачка забирается в короткой транзакции: next_attempt_at сдвигается на время аренды (lease),
+    так что параллельные воркеры её не видят, а при падении воркера сообщения вернутся в работу.
+    Сама отправка идёт вне транзакции, отправители держат соединения открытыми между сообщениями и пачками.
+    Результат записывается, только пока аренда за этим воркером (next_attempt_at равен выданному при захвате):
+    после её истечения сообщение мог забрать и доставить другой воркер.
+    Неудачи (в том числе непредвиденные исключения отправителя) повторяются с экспоненциальной задержкой,
+    после max_attempts, при постоянной ошибке
+    или по истечении expires_at сообщение помечается как dead. Throttled откладывает сообщение без траты попытки.
+    """
+
+    def __init__(self, senders, batch_size=None, max_attempts=None, lease=None, retry_base_delay=None,
+                 retry_max_delay=None):
+        self.senders = senders
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        self.lease = lease or settings.OUTBOX_LEASE_SECONDS
+        self.retry_base_delay = retry_base_delay or settings.OUTBOX_RETRY_BASE_DELAY
+        self.retry_max_delay = retry_max_delay or settings.OUTBOX_RETRY_MAX_DELAY
+
+    def claim(self):
+        now = timezone.now()
+        with transaction.atomic():
+            due = OutboxMessage.objects.filter(
+                status=OutboxMessage.STATUS_PENDING, next_attempt_at__lte=now, channel__in=list(self.senders)
+            ).order_by('next_attempt_at', 'id')
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            batch = list(due[:self.batch_size])
+            leased_until = now + timedelta(seconds=self.lease)
+            OutboxMessage.objects.filter(id__in=[message.id for message in batch]).update(
+                next_attempt_at=leased_until
+            )
+        for message in batch:
+            message.next_attempt_at = leased_until
+        return batch
+
+    def leased(self, message):
+        """Строка сообщения, если аренда, выданная при захвате, всё ещё у этого воркера."""
+        return OutboxMessage.objects.filter(
+            id=message.id, status=OutboxMessage.STATUS_PENDING, next_attempt_at=message.next_attempt_at
+        )
+
+    def backoff(self, attempts):
+        delay = min(self.retry_base_delay * 2 ** (attempts - 1), self.retry_max_delay)
+        return delay * random.uniform(0.8, 1.2)
+
+    def deliver(self, message):
+        if message.expires_at and message.expires_at <= timezone.now():
+            self.leased(message).update(
+                status=OutboxMessage.STATUS_DEAD, last_error="Истёк срок доставки"
+            )
+            return False
+        try:
+            self.senders[message.channel].send(message.payload)
+        except Throttled as e:
+            self.leased(message).update(
+                last_error=str(e), next_attempt_at=timezone.now() + timedelta(seconds=e.retry_after)
+            )
+            return False
+        except DeliveryError as e:
+            self.fail(message, e)
+            return False
+        except Exception as e:
+            # Ошибка в самом отправителе не должна останавливать воркер: иначе сообщение после аренды
+            # снова уронит следующего. Считаем её обычной неудачной попыткой.
+            logger.exception(f"Сбой отправителя при доставке уведомления {message.id} ({message.channel})")
+            self.fail(message, DeliveryError(f"{type(e).__name__}: {e}"))
+            return False
+        if not self.leased(message).update(
+            status=OutboxMessage.STATUS_SENT, sent_at=timezone.now(), attempts=F('attempts') + 1, last_error=''
+        ):
+            logger.warning(f"Уведомление {message.id} отправлено после истечения аренды; возможен повтор")
+        return True
+
+    def fail(self, message, error):
+        attempts = message.attempts + 1
+        if error.permanent or attempts >= self.max_attempts:
+            logger.error(f"Уведомление {message.id} ({message.channel}) не доставлено: {error}")
+            self.leased(message).update(
+                status=OutboxMessage.STATUS_DEAD, attempts=attempts, last_error=str(error)
+            )
+            return
+        delay = error.retry_after if error.retry_after is not None else self.backoff(attempts)
+        self.leased(message).update(
+            attempts=attempts, last_error=str(error), next_attempt_at=timezone.now() + timedelta(seconds=delay)
+        )
+
+    def run_once(self):
+        """Обрабатывает одну пачку и возвращает число взятых сообщений."""
+        batch = self.claim()
+        for message in batch:
+            self.deliver(message)
+        return len(batch)
+
+    def run(self, poll_interval=None, should_stop=lambda: False):
+        poll_interval = poll_interval or settings.OUTBOX_POLL_INTERVAL
+        while not should_stop():
+            if not self.run_once():
+                time.sleep(poll_interval)
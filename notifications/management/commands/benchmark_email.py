@@ -0,0 +1,56 @@
+import statistics
+import time
+
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+
+from notifications.senders import EmailSender
+from notifications.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает отправку OTP-писем по новому SMTP-соединению на каждое письмо (как раньше в LoginAPI) "
+            "с постоянным соединением воркера. Письма уходят в локальный SMTP sink.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.02,
+                            help="Задержка sink перед приветствием, имитирует подключение и TLS (сек)")
+
+    def handle(self, *args, **options):
+        count = options['count']
+        sink = SMTPSink(latency=options['latency'], keep=False).start()
+        try:
+            def connection():
+                return get_connection(
+                    'django.core.mail.backends.smtp.EmailBackend', host=sink.host, port=sink.port,
+                    username='', password='', use_tls=False, use_ssl=False, fail_silently=False,
+                )
+
+            def inline(i):
+                send_mail('Your Verification Code', f'Your OTP code is: {i:06d}.', 'bench@example.com',
+                          [f'user{i}@example.com'], connection=connection())
+
+            sender = EmailSender(per_recipient_limit=count, connection=connection())
+
+            def pooled(i):
+                sender.send({'subject': 'Your Verification Code', 'body': f'Your OTP code is: {i:06d}.',
+                             'from_email': 'bench@example.com', 'to': [f'user{i}@example.com']})
+
+            for name, send in (('соединение на письмо', inline), ('постоянное соединение', pooled)):
+                timings = []
+                started = time.perf_counter()
+                for i in range(count):
+                    t = time.perf_counter()
+                    send(i)
+                    timings.append((time.perf_counter() - t) * 1000)
+                elapsed = time.perf_counter() - started
+                timings.sort()
+                self.stdout.write(
+                    f"{name:>22}: {count / elapsed:8.1f} писем/с, p50 {statistics.median(timings):6.2f} мс, "
+                    f"p95 {timings[int(len(timings) * 0.95) - 1]:6.2f} мс"
+                )
+            sender.close()
+            self.stdout.write(f"SMTP-подключений: {sink.connections}, писем принято: {sink.received}")
+        finally:
+            sink.close()
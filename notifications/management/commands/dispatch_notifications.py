@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from notifications.dispatcher import OutboxDispatcher, build_senders
+
+
+class Command(BaseCommand):
+    help = "Воркер доставки уведомлений из outbox (Telegram, email). Запускать отдельным процессом."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Обработать одну пачку и выйти")
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--poll-interval', type=float)
+
+    def handle(self, *args, **options):
+        senders = build_senders()
+        dispatcher = OutboxDispatcher(senders, batch_size=options['batch_size'])
+        try:
+            if options['once']:
+                self.stdout.write(f"Обработано сообщений: {dispatcher.run_once()}")
+            else:
+                self.stdout.write("Воркер уведомлений запущен")
+                dispatcher.run(poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for sender in senders.values():
+                sender.close()
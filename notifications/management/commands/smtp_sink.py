@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from notifications.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = "Локальный SMTP-сервер, который принимает и отбрасывает письма. Для разработки и бенчмарков."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(options['host'], options['port'], keep=False)
+        self.stdout.write(f"SMTP sink слушает {sink.host}:{sink.port}")
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.server.server_close()
+            self.stdout.write(f"Принято писем: {sink.received}")
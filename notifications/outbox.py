@@ -0,0 +1,25 @@
+from django.conf import settings
+
+from .models import OutboxMessage
+
+
+def enqueue(channel, payload, expires_at=None):
+    """Ставит уведомление в очередь. Вызывать в транзакции события: откат отменит и уведомление."""
+    return OutboxMessage.objects.create(channel=channel, payload=payload, expires_at=expires_at)
+
+
+def enqueue_telegram(text, chat_id=None):
+    return enqueue(OutboxMessage.CHANNEL_TELEGRAM, {
+        'chat_id': chat_id or settings.TELEGRAM_CHAT_ID,
+        'text': text,
+        'parse_mode': 'HTML',
+    })
+
+
+def enqueue_email(subject, body, recipients, from_email=None, expires_at=None):
+    return enqueue(OutboxMessage.CHANNEL_EMAIL, {
+        'subject': subject,
+        'body': body,
+        'from_email': from_email or settings.EMAIL_HOST_USER,
+        'to': list(recipients),
+    }, expires_at=expires_at)
@@ -0,0 +1,176 @@
+import smtplib
+import time
+from collections import defaultdict, deque
+
+import requests
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from requests.adapters import HTTPAdapter
+
+
+class DeliveryError(Exception):
+    """Ошибка отправки. permanent — повтор бессмыслен; retry_after — через сколько секунд повторить."""
+
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+class Throttled(DeliveryError):
+    """Отправка отложена лимитом получателя; попытка не расходуется."""
+
+
+class RateLimiter:
+    """Скользящее окно: не больше limit отправок за period секунд на каждый ключ."""
+    max_keys = 10000
+
+    def __init__(self, limit, period, clock=time.monotonic, sleep=time.sleep):
+        self.limit = limit
+        self.period = period
+        self.clock = clock
+        self.sleep = sleep
+        self._sent = defaultdict(deque)
+
+    def _prune(self, key, now):
+        window = self._sent.get(key)
+        while window and window[0] <= now - self.period:
+            window.popleft()
+        if window is not None and not window:
+            del self._sent[key]
+        return window or ()
+
+    def delay(self, key=None):
+        """Сколько секунд ждать до свободного слота (0 — можно отправлять сейчас)."""
+        now = self.clock()
+        window = self._prune(key, now)
+        if len(window) < self.limit:
+            return 0
+        return window[0] + self.period - now
+
+    def record(self, key=None):
+        now = self.clock()
+        if len(self._sent) > self.max_keys:
+            for stale in list(self._sent):
+                self._prune(stale, now)
+        self._sent[key].append(now)
+
+    def wait(self, key=None):
+        delay = self.delay(key)
+        if delay > 0:
+            self.sleep(delay)
+        self.record(key)
+
+
+class TelegramSender:
+    """Отправка через Bot API по одному keep-alive соединению с учётом лимитов Telegram
+    (около 30 сообщений в секунду на бота и 20 в минуту в один групповой чат).
+
+    Сообщения в чат, исчерпавший минутный лимит, откладываются (Throttled), как в EmailSender: ожидание
+    в воркере задержало бы остальную очередь дольше аренды пачки.
+    """
+
+    def __init__(self, api_url, token, timeout, per_chat_limit, global_limit, session=None):
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.mount(api_url, HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.chat_limiter = RateLimiter(per_chat_limit, 60)
+        self.global_limiter = RateLimiter(global_limit, 1)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_url=settings.TELEGRAM_API_URL,
+            token=settings.TELEGRAM_BOT_TOKEN,
+            timeout=settings.TELEGRAM_TIMEOUT,
+            per_chat_limit=settings.TELEGRAM_MESSAGES_PER_CHAT_PER_MINUTE,
+            global_limit=settings.TELEGRAM_MESSAGES_PER_SECOND,
+        )
+
+    def send(self, payload):
+        chat_id = payload.get('chat_id')
+        delay = self.chat_limiter.delay(chat_id)
+        if delay > 0:
+            raise Throttled("Превышен лимит сообщений в чат Telegram", retry_after=delay)
+        self.global_limiter.wait()
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DeliveryError(f"Telegram недоступен: {e}")
+
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after')
+            except ValueError:
+                retry_after = None
+            raise DeliveryError("Telegram: 429 Too Many Requests", retry_after=retry_after)
+        if response.status_code >= 500:
+            raise DeliveryError(f"Telegram: HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise DeliveryError(f"Telegram: HTTP {response.status_code} {response.text[:500]}", permanent=True)
+        self.chat_limiter.record(chat_id)
+
+    def close(self):
+        self.session.close()
+
+
+class EmailSender:
+    """Отправка писем по одному постоянному SMTP-соединению, открытому на всё время работы воркера.
+
+    Письма получателю, исчерпавшему лимит, откладываются (Throttled), а не ждут в воркере,
+    чтобы не задерживать остальную очередь.
+    """
+
+    def __init__(self, per_recipient_limit, connection=None, clock=time.monotonic):
+        self.connection = connection or get_connection(fail_silently=False)
+        self.recipient_limiter = RateLimiter(per_recipient_limit, 60, clock=clock)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(per_recipient_limit=settings.EMAIL_MESSAGES_PER_RECIPIENT_PER_MINUTE)
+
+    def send(self, payload):
+        recipients = payload['to']
+        delay = max(self.recipient_limiter.delay(recipient) for recipient in recipients)
+        if delay > 0:
+            raise Throttled("Превышен лимит писем для получателя", retry_after=delay)
+
+        message = EmailMessage(
+            payload['subject'], payload['body'], payload.get('from_email'), recipients, connection=self.connection
+        )
+        try:
+            self._send(message)
+        except smtplib.SMTPServerDisconnected:
+            # Сервер закрыл простаивающее соединение — переподключаемся один раз.
+            self.close()
+            self._send_or_raise(message)
+        except (smtplib.SMTPException, OSError) as e:
+            self._raise(e)
+        for recipient in recipients:
+            self.recipient_limiter.record(recipient)
+
+    def _send(self, message):
+        self.connection.open()
+        message.send()
+
+    def _send_or_raise(self, message):
+        try:
+            self._send(message)
+        except (smtplib.SMTPException, OSError) as e:
+            self._raise(e)
+
+    def _raise(self, error):
+        self.close()
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            codes = [code for code, _ in error.recipients.values()]
+            raise DeliveryError(f"SMTP: получатели отклонены {error.recipients}", permanent=min(codes) >= 500)
+        if isinstance(error, smtplib.SMTPResponseException):
+            raise DeliveryError(f"SMTP: {error.smtp_code} {error.smtp_error!r}", permanent=error.smtp_code >= 500)
+        raise DeliveryError(f"SMTP недоступен: {error}")
+
+    def close(self):
+        try:
+            self.connection.close()
+        except (smtplib.SMTPException, OSError):
+            pass
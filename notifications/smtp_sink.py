@@ -0,0 +1,95 @@
+import socketserver
+import threading
+import time
+
+
+class SMTPSink:
+    """Минимальный локальный SMTP-сервер: принимает и запоминает письма. Для тестов и бенчмарков.
+
+    latency — задержка перед приветствием, имитирует стоимость подключения (DNS, TCP, TLS);
+    refuse — адреса, на которые сервер отвечает 550; keep=False — только считать письма.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, refuse=(), keep=True):
+        self.messages = []
+        self.received = 0
+        self.keep = keep
+        self.connections = 0
+        self.latency = latency
+        self.refuse = set(refuse)
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f'{line}\r\n'.encode())
+
+            def handle(self):
+                with sink._lock:
+                    sink.connections += 1
+                if sink.latency:
+                    time.sleep(sink.latency)
+                self.reply('220 sink ESMTP')
+                mail_from, recipients = None, []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode('utf-8', 'replace').strip()
+                    verb = command[:4].upper()
+                    argument = command[5:].strip()
+                    if verb == 'EHLO':
+                        self.reply('250-sink')
+                        self.reply('250 8BITMIME')
+                    elif verb == 'HELO':
+                        self.reply('250 sink')
+                    elif verb == 'MAIL':
+                        mail_from, recipients = argument.partition(':')[2].strip('<> '), []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        address = argument.partition(':')[2].strip('<> ')
+                        if address in sink.refuse:
+                            self.reply('550 No such user')
+                        else:
+                            recipients.append(address)
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        data = []
+                        for raw in self.rfile:
+                            if raw in (b'.\r\n', b'.\n'):
+                                break
+                            data.append(raw[1:] if raw.startswith(b'..') else raw)
+                        with sink._lock:
+                            sink.received += 1
+                            if sink.keep:
+                                sink.messages.append((mail_from, recipients, b''.join(data)))
+                        self.reply('250 OK')
+                    elif verb == 'RSET':
+                        mail_from, recipients = None, []
+                        self.reply('250 OK')
+                    elif verb == 'NOOP':
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Command not implemented')
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = Server((host, port), Handler)
+        self.host, self.port = self.server.server_address[:2]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,287 @@
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.mail import get_connection
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from order.models import Order
+from order.services import create_order
+from products.models import Category
+from products.testing import create_product
+from user.models import CustomUser
+from .dispatcher import OutboxDispatcher
+from .models import OutboxMessage
+from .outbox import enqueue_email, enqueue_telegram
+from .senders import EmailSender, RateLimiter, TelegramSender
+from .smtp_sink import SMTPSink
+
+
+class StubTelegram:
+    """Локальный HTTP-сервер вместо api.telegram.org: отвечает заранее заданными (status, body)."""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stub.requests.append((self.path, json.loads(body)))
+                status, payload = stub.responses.pop(0) if stub.responses else (200, {'ok': True})
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OutboxDispatcherTests(TestCase):
+    def setUp(self):
+        self.stub = StubTelegram()
+        self.addCleanup(self.stub.close)
+        self.sender = TelegramSender(self.stub.url, 'token', timeout=5, per_chat_limit=1000, global_limit=1000)
+        self.addCleanup(self.sender.close)
+        self.dispatcher = OutboxDispatcher(
+            {OutboxMessage.CHANNEL_TELEGRAM: self.sender}, batch_size=10, max_attempts=3, lease=60,
+            retry_base_delay=10, retry_max_delay=100,
+        )
+
+    def test_delivers_pending_messages(self):
+        message = enqueue_telegram('Новый заказ', chat_id='42')
+        self.assertEqual(self.dispatcher.run_once(), 1)
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_SENT)
+        self.assertIsNotNone(message.sent_at)
+        self.assertEqual(self.stub.requests, [
+            ('/bottoken/sendMessage', {'chat_id': '42', 'text': 'Новый заказ', 'parse_mode': 'HTML'}),
+        ])
+        self.assertEqual(self.dispatcher.run_once(), 0)
+
+    def test_rate_limited_message_waits_for_retry_after(self):
+        message = enqueue_telegram('x', chat_id='42')
+        self.stub.responses.append((429, {'ok': False, 'parameters': {'retry_after': 30}}))
+        self.dispatcher.run_once()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertAlmostEqual(
+            (message.next_attempt_at - timezone.now()).total_seconds(), 30, delta=5
+        )
+        self.assertEqual(self.dispatcher.run_once(), 0)
+
+    def test_server_errors_are_retried_then_dead_lettered(self):
+        message = enqueue_telegram('x', chat_id='42')
+        self.stub.responses.extend([(500, {})] * 3)
+        for attempt in range(1, 4):
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            self.dispatcher.run_once()
+            message.refresh_from_db()
+            self.assertEqual(message.attempts, attempt)
+
+        self.assertEqual(message.status, OutboxMessage.STATUS_DEAD)
+        self.assertIn('500', message.last_error)
+
+    def test_client_error_is_dead_lettered_immediately(self):
+        message = enqueue_telegram('x', chat_id='42')
+        self.stub.responses.append((400, {'ok': False, 'description': 'chat not found'}))
+        self.dispatcher.run_once()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_DEAD)
+        self.assertEqual(message.attempts, 1)
+
+    def test_unreachable_api_is_retried(self):
+        self.stub.close()
+        message = enqueue_telegram('x', chat_id='42')
+        self.dispatcher.run_once()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=5))
+
+    def test_claimed_messages_are_leased(self):
+        enqueue_telegram('x', chat_id='42')
+        self.assertEqual(len(self.dispatcher.claim()), 1)
+        self.assertEqual(self.dispatcher.claim(), [])
+
+    def test_chat_over_limit_is_deferred_without_waiting(self):
+        sender = TelegramSender(self.stub.url, 'token', timeout=5, per_chat_limit=1, global_limit=1000)
+        self.addCleanup(sender.close)
+        sender.chat_limiter.sleep = self.fail
+        dispatcher = OutboxDispatcher({OutboxMessage.CHANNEL_TELEGRAM: sender}, batch_size=10, lease=60)
+        for text in ('first', 'second'):
+            enqueue_telegram(text, chat_id='42')
+        enqueue_telegram('other chat', chat_id='43')
+        dispatcher.run_once()
+
+        deferred = OutboxMessage.objects.get(status=OutboxMessage.STATUS_PENDING)
+        self.assertEqual((deferred.payload['text'], deferred.attempts), ('second', 0))
+        self.assertGreater(deferred.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual([payload['text'] for path, payload in self.stub.requests], ['first', 'other chat'])
+
+    def test_result_is_not_written_after_the_lease_was_lost(self):
+        message = enqueue_telegram('x', chat_id='42')
+        claimed, = self.dispatcher.claim()
+        # Аренда истекла, и сообщение забрал другой воркер.
+        OutboxMessage.objects.update(next_attempt_at=timezone.now() + timedelta(seconds=60))
+        self.dispatcher.deliver(claimed)
+
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.STATUS_PENDING, 0))
+
+
+class BrokenSender:
+    def send(self, payload):
+        if payload.get('text') == 'boom':
+            raise ValueError('bad payload')
+
+
+class UnexpectedSenderErrorTests(TestCase):
+    def test_unexpected_errors_are_retried_then_dead_lettered(self):
+        dispatcher = OutboxDispatcher(
+            {OutboxMessage.CHANNEL_TELEGRAM: BrokenSender()}, batch_size=10, max_attempts=2, lease=60,
+            retry_base_delay=10, retry_max_delay=100,
+        )
+        poison = enqueue_telegram('boom', chat_id='42')
+        healthy = enqueue_telegram('ok', chat_id='42')
+
+        with self.assertLogs('notifications.dispatcher', 'ERROR'):
+            self.assertEqual(dispatcher.run_once(), 2)
+        poison.refresh_from_db()
+        healthy.refresh_from_db()
+        self.assertEqual((poison.status, poison.attempts), (OutboxMessage.STATUS_PENDING, 1))
+        self.assertIn('ValueError: bad payload', poison.last_error)
+        self.assertEqual(healthy.status, OutboxMessage.STATUS_SENT)
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('notifications.dispatcher', 'ERROR'):
+            dispatcher.run_once()
+        poison.refresh_from_db()
+        self.assertEqual((poison.status, poison.attempts), (OutboxMessage.STATUS_DEAD, 2))
+
+
+class OrderOutboxTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.product = create_product(category, 'Aspirin')
+
+    def test_order_enqueues_notification(self):
+        order = create_order(self.user, [(self.product.id, 2)], address='Tashkent')
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.channel, OutboxMessage.CHANNEL_TELEGRAM)
+        self.assertIn(f'#{order.id}', message.payload['text'])
+        self.assertIn('Aspirin', message.payload['text'])
+        self.assertIn('200', message.payload['text'])
+
+    def test_rolled_back_order_leaves_no_notification(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                create_order(self.user, [(self.product.id, 2)])
+                raise RuntimeError
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class RateLimiterTests(TestCase):
+    def test_waits_when_window_is_full(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        limiter = RateLimiter(2, 60, clock=lambda: now[0], sleep=sleep)
+        limiter.wait('a')
+        limiter.wait('a')
+        limiter.wait('b')
+        self.assertEqual(sleeps, [])
+        now[0] = 10
+        limiter.wait('a')
+        self.assertEqual(sleeps, [50])
+
+
+class EmailDeliveryTests(TestCase):
+    def setUp(self):
+        self.sink = SMTPSink(refuse={'nobody@example.com'}).start()
+        self.addCleanup(self.sink.close)
+        self.sender = EmailSender(per_recipient_limit=2, connection=get_connection(
+            'django.core.mail.backends.smtp.EmailBackend', host=self.sink.host, port=self.sink.port,
+            username='', password='', use_tls=False, use_ssl=False, fail_silently=False,
+        ))
+        self.addCleanup(self.sender.close)
+        self.dispatcher = OutboxDispatcher({OutboxMessage.CHANNEL_EMAIL: self.sender}, batch_size=50, max_attempts=3)
+
+    def test_batch_is_sent_over_one_connection(self):
+        for i in range(5):
+            enqueue_email('Code', f'Your OTP code is: {i}', [f'user{i}@example.com'])
+        self.dispatcher.run_once()
+        enqueue_email('Code', 'Your OTP code is: 5', ['user5@example.com'])
+        self.dispatcher.run_once()
+
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.STATUS_SENT).count(), 6)
+        self.assertEqual(len(self.sink.messages), 6)
+        self.assertEqual(self.sink.connections, 1)
+
+    def test_reconnects_after_server_drops_idle_connection(self):
+        enqueue_email('Code', '1', ['user@example.com'])
+        self.dispatcher.run_once()
+        self.sender.connection.connection.close()
+        enqueue_email('Code', '2', ['other@example.com'])
+        self.dispatcher.run_once()
+
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.STATUS_SENT).count(), 2)
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_recipient_over_limit_is_deferred_without_spending_attempts(self):
+        for i in range(3):
+            enqueue_email('Code', str(i), ['user@example.com'])
+        self.dispatcher.run_once()
+
+        deferred = OutboxMessage.objects.get(status=OutboxMessage.STATUS_PENDING)
+        self.assertEqual(deferred.attempts, 0)
+        self.assertGreater(deferred.next_attempt_at, timezone.now() + timedelta(seconds=30))
+        self.assertEqual(len(self.sink.messages), 2)
+
+    def test_refused_recipient_is_dead_lettered(self):
+        message = enqueue_email('Code', '1', ['nobody@example.com'])
+        self.dispatcher.run_once()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_DEAD)
+        self.assertIn('550', message.last_error)
+
+    def test_expired_message_is_not_sent(self):
+        message = enqueue_email('Code', '1', ['user@example.com'], expires_at=timezone.now() - timedelta(seconds=1))
+        self.dispatcher.run_once()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_DEAD)
+        self.assertEqual(self.sink.messages, [])
@@ -1,17 +1,26 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.utils.html import format_html
 from products.models import Product
-from .models import Order, OrderItem
+from user.models import CustomUser
+from .models import Order, OrderItem, OrderStatusEvent
+from .services import change_order_status, transition_orders
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    fields = ('product', 'quantity', 'get_item_total')
-    readonly_fields = ('get_item_total',)
+    fields = ('product', 'quantity', 'unit_price', 'get_item_total')
+    readonly_fields = ('unit_price', 'get_item_total')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
     def get_item_total(self, obj):
-        return obj.product.price * obj.quantity
+        if obj.unit_price is None:
+            return None
+        return obj.unit_price * obj.quantity
     get_item_total.short_description = 'Стоимость'
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
@@ -31,49 +40,115 @@ class OrderItemInline(admin.TabularInline):
                     )
 
 
+class OrderStatusEventInline(admin.TabularInline):
+    model = OrderStatusEvent
+    extra = 0
+    fields = ('created_at', 'from_status', 'to_status', 'changed_by')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('changed_by')
+
+
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        if self.instance.pk and status != self.instance.status and not self.instance.can_transition(status):
+            raise forms.ValidationError(f"Недопустимый переход статуса: {self.instance.status} → {status}.")
+        return status
+
+
+class UserFilter(admin.SimpleListFilter):
+    """Фильтр по клиенту без списка всех пользователей: клиента выбирают ссылкой в колонке «Клиент» или поиском."""
+    title = 'Клиент'
+    parameter_name = 'user'
+
+    def lookups(self, request, model_admin):
+        user_id = self.value()
+        if not user_id or not user_id.isdigit():
+            return []
+        user = CustomUser.objects.filter(pk=user_id).only('name', 'surname').first()
+        return [(user_id, f"{user.name} {user.surname}")] if user else []
+
+    def queryset(self, request, queryset):
+        user_id = self.value()
+        if user_id:
+            return queryset.filter(user_id=user_id) if user_id.isdigit() else queryset.none()
+        return queryset
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'get_user_full_name', 'created_at', 'status', 'address', 'comment', 'get_total_items', 'get_total_price')
-    list_filter = ('status', 'user')
+    list_display = ('id', 'get_user_full_name', 'created_at', 'status', 'address', 'comment', 'item_count', 'total_amount')
+    list_filter = ('status', UserFilter)
+    list_select_related = ('user',)
     search_fields = ('user__email', 'user__name', 'user__surname', 'address', 'comment')
+    autocomplete_fields = ('user',)
+    # Точное число всех заказов не считается на каждой странице поиска.
+    show_full_result_count = False
     list_per_page = 20
     list_editable = ('status', 'address', 'comment')
-    inlines = [OrderItemInline]
-    readonly_fields = ('created_at',)
+    form = OrderAdminForm
+    inlines = [OrderItemInline, OrderStatusEventInline]
+    readonly_fields = ('created_at', 'updated_at', 'item_count', 'total_amount')
     fieldsets = (
         (None, {
-            'fields': ('user', 'status', 'created_at')
+            'fields': ('user', 'status', 'created_at', 'updated_at', 'item_count', 'total_amount')
         }),
         ('Дополнительная информация', {
             'fields': ('address', 'comment')
         }),
     )
-    actions = ['mark_as_pending', 'mark_as_shipping', 'mark_as_delivered', 'mark_as_cancelled']
+    actions = ['mark_as_shipping', 'mark_as_delivered', 'mark_as_cancelled']
 
     def get_user_full_name(self, obj):
-        return f"{obj.user.name} {obj.user.surname}"
+        return format_html('<a href="?user={}">{} {}</a>', obj.user_id, obj.user.name, obj.user.surname)
     get_user_full_name.short_description = 'Клиент'
+    get_user_full_name.admin_order_field = 'user__surname'
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', OrderAdminForm)
+        return super().get_changelist_form(request, **kwargs)
 
-    def get_total_items(self, obj):
-        return sum(item.quantity for item in obj.items.all())
-    get_total_items.short_description = 'Количество продуктов'
+    def save_model(self, request, obj, form, change):
+        if not change:
+            super().save_model(request, obj, form, change)
+            return
+        status = obj.status if 'status' in form.changed_data else None
+        with transaction.atomic():
+            if not change_order_status(obj, status, request.user):
+                self.message_user(
+                    request, f"Статус заказа #{obj.pk} не изменён: недопустимый переход {obj.status} → {status}.",
+                    messages.WARNING,
+                )
+            super().save_model(request, obj, form, change)
 
-    def get_total_price(self, obj):
-        return sum(item.product.price * item.quantity for item in obj.items.all())
-    get_total_price.short_description = 'Общая сумма'
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.recalculate_totals()
 
-    def mark_as_pending(self, request, queryset):
-        queryset.update(status='pending')
-    mark_as_pending.short_description = 'Пометить как ожидает'
+    def transition(self, request, queryset, status):
+        updated, skipped = transition_orders(list(queryset.values_list('id', flat=True)), status, changed_by=request.user)
+        self.message_user(request, f"Обновлено заказов: {len(updated)}.")
+        if skipped:
+            self.message_user(request, f"Пропущено заказов с недопустимым переходом: {len(skipped)}.", messages.WARNING)
 
     def mark_as_shipping(self, request, queryset):
-        queryset.update(status='shipping')
+        self.transition(request, queryset, 'shipping')
     mark_as_shipping.short_description = 'Пометить как отправлен'
 
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status='delivered')
+        self.transition(request, queryset, 'delivered')
     mark_as_delivered.short_description = 'Пометить как доставлен'
 
     def mark_as_cancelled(self, request, queryset):
-        queryset.update(status='cancelled')
+        self.transition(request, queryset, 'cancelled')
     mark_as_cancelled.short_description = 'Пометить как отменен'
\ No newline at end of file
@@ -0,0 +1,120 @@
+import csv
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+from .models import Order
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+ORDER_FIELDS = {
+    'order_id': 'id',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'status': 'status',
+    'user_id': 'user_id',
+    'email': 'user__email',
+    'name': 'user__name',
+    'surname': 'user__surname',
+    'phone_number': 'user__phone_number',
+    'address': 'address',
+    'comment': 'comment',
+    'total_amount': 'total_amount',
+    'item_count': 'item_count',
+}
+ITEM_FIELDS = {
+    'product_id': 'items__product_id',
+    'product_title': 'items__product__title',
+    'quantity': 'items__quantity',
+    'unit_price': 'items__unit_price',
+}
+CSV_COLUMNS = [*ORDER_FIELDS, *ITEM_FIELDS, 'line_total']
+# Текст, который вводят покупатели: в CSV для бухгалтерии он не должен исполняться как формула.
+CSV_TEXT_COLUMNS = {'name', 'surname', 'address', 'comment', 'product_title'}
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def parse_moment(value, name, end_of_day=False):
+    """ISO-дата или дата-время; для даты без времени date_to включает весь день."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise serializers.ValidationError({name: "Неверный формат даты, ожидается ISO 8601."})
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_queryset(date_from=None, date_to=None, statuses=None):
+    """Строки «заказ × позиция» (LEFT JOIN, заказ без позиций даёт одну строку) в порядке заказов."""
+    queryset = Order.objects.all()
+    if date_from:
+        queryset = queryset.filter(created_at__gte=parse_moment(date_from, 'date_from'))
+    if date_to:
+        queryset = queryset.filter(created_at__lte=parse_moment(date_to, 'date_to', end_of_day=True))
+    if statuses:
+        unknown = set(statuses) - set(Order.STATUS_TRANSITIONS)
+        if unknown:
+            raise serializers.ValidationError({'status': f"Неизвестные статусы: {', '.join(sorted(unknown))}."})
+        queryset = queryset.filter(status__in=statuses)
+    return queryset.order_by('id', 'items__id').values_list(*ORDER_FIELDS.values(), *ITEM_FIELDS.values())
+
+
+def iter_rows(queryset, chunk_size=None):
+    for row in queryset.iterator(chunk_size=chunk_size or settings.ORDER_EXPORT_CHUNK_SIZE):
+        yield dict(zip(ORDER_FIELDS, row)), dict(zip(ITEM_FIELDS, row[len(ORDER_FIELDS):]))
+
+
+def csv_text(value):
+    """Ячейка, начинающаяся как формула (=, +, -, @), экранируется апострофом: Excel покажет её как текст."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, chunk_size=None):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for order, item in iter_rows(queryset, chunk_size):
+        line_total = item['quantity'] * item['unit_price'] if item['unit_price'] is not None else None
+        row = {**order, **item, 'line_total': line_total}
+        yield writer.writerow([
+            csv_text(value) if column in CSV_TEXT_COLUMNS
+            else value.isoformat() if isinstance(value, datetime) else value
+            for column, value in row.items()
+        ])
+
+
+def stream_jsonl(queryset, chunk_size=None):
+    """Один JSON-объект на заказ с массивом items; строки идут по порядку заказов, поэтому в памяти один заказ."""
+    current = None
+    for order, item in iter_rows(queryset, chunk_size):
+        if current is None or current['order_id'] != order['order_id']:
+            if current is not None:
+                yield json.dumps(current, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+            current = {**order, 'items': []}
+        if item['product_id'] is not None:
+            current['items'].append(item)
+    if current is not None:
+        yield json.dumps(current, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def stream_export(queryset, export_format, chunk_size=None):
+    if export_format == 'csv':
+        return stream_csv(queryset, chunk_size)
+    return stream_jsonl(queryset, chunk_size)
@@ -0,0 +1,103 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from drf_yasg import openapi
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+idempotency_key_parameter = openapi.Parameter(
+    IDEMPOTENCY_HEADER, openapi.IN_HEADER, type=openapi.TYPE_STRING, required=False,
+    description="Уникальный ключ запроса (например, UUID). Повтор с тем же ключом вернёт сохранённый ответ, "
+                "не создавая второй заказ."
+)
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def claim_key(user, key, fingerprint):
+    """Возвращает (запись, True), если запрос нужно выполнить, или (запись, False) для уже известного ключа.
+
+    Просроченные ключи и ключи, выполнение которых оборвалось (дольше IDEMPOTENCY_LOCK_TIMEOUT без ответа),
+    занимаются заново.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=fingerprint, created_at=now, expires_at=expires_at
+            ), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.get(user=user, key=key)
+    abandoned = record.response is None and record.created_at <= now - timedelta(
+        seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT
+    )
+    if record.expires_at <= now or abandoned:
+        # Условие по created_at не даёт двум повторам одновременно занять один и тот же ключ.
+        reclaimed = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(
+            fingerprint=fingerprint, status_code=None, response=None, created_at=now, expires_at=expires_at
+        )
+        record.refresh_from_db()
+        if reclaimed:
+            return record, True
+    return record, False
+
+
+def idempotent(view_method):
+    """Поддержка заголовка Idempotency-Key для POST, создающих заказ.
+
+    Без заголовка запрос выполняется как обычно. С заголовком успешный (2xx) ответ сохраняется в той же
+    транзакции, что и заказ, и повтор с тем же ключом получает его без повторного выполнения. Ошибочный
+    запрос ничего не сохраняет, ключ освобождается, и его можно повторить.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            raise serializers.ValidationError({IDEMPOTENCY_HEADER: "Ключ не должен быть длиннее 255 символов."})
+
+        fingerprint = request_fingerprint(request)
+        record, claimed = claim_key(request.user, key, fingerprint)
+        if not claimed:
+            if record.fingerprint != fingerprint:
+                return Response({'error': "Idempotency-Key уже использован с другим запросом."}, status=422)
+            if record.response is None:
+                return Response({'error': "Запрос с этим Idempotency-Key ещё выполняется."}, status=409)
+            response = Response(record.response, status=record.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if 200 <= response.status_code < 300:
+                    IdempotencyKey.objects.filter(pk=record.pk).update(
+                        status_code=response.status_code, response=response.data
+                    )
+                    return response
+        except Exception:
+            record.delete()
+            raise
+        record.delete()
+        return response
+    return wrapper
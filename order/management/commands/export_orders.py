@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from order.export import FORMATS, export_queryset, stream_export
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка заказов с позициями в CSV или JSONL (в файл или stdout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', help="Заказы, созданные не раньше (ISO 8601)")
+        parser.add_argument('--to', dest='date_to', help="Заказы, созданные не позже (для даты — включая весь день)")
+        parser.add_argument('--status', action='append', help="Статус; можно указать несколько раз")
+        parser.add_argument('--output', help="Файл; по умолчанию stdout")
+        parser.add_argument('--chunk-size', type=int, help="Сколько строк читать из БД за раз")
+
+    def handle(self, *args, **options):
+        try:
+            queryset = export_queryset(options['date_from'], options['date_to'], options['status'])
+        except ValidationError as e:
+            raise CommandError(e.detail)
+        chunks = stream_export(queryset, options['export_format'], options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-17 07:46
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_unit_price(apps, schema_editor):
+    # Историческую цену не восстановить; берём текущую цену продукта как лучшее приближение.
+    OrderItem = apps.get_model('order', 'OrderItem')
+    Product = apps.get_model('products', 'Product')
+    OrderItem.objects.filter(unit_price__isnull=True).update(
+        unit_price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_order_order_order_created_47a984_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_unit_price, migrations.RunPython.noop),
+    ]
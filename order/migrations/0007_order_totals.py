@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-17 08:00
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+    OrderItem = apps.get_model('order', 'OrderItem')
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    Order.objects.update(
+        total_amount=Coalesce(Subquery(items.annotate(total=Sum(F('quantity') * F('unit_price'))).values('total')), 0),
+        item_count=Coalesce(Subquery(items.annotate(count=Sum('quantity')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0006_orderitem_unit_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Количество продуктов'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False, verbose_name='Общая сумма'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,24 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import F, Sum
+from django.utils import timezone
 from user.models import CustomUser
 from products.models import Product
 
 
 class Order(models.Model):
+    # Допустимые переходы статуса; delivered и cancelled — конечные.
+    STATUS_TRANSITIONS = {
+        'pending': ('shipping', 'cancelled'),
+        'shipping': ('delivered', 'cancelled'),
+        'delivered': (),
+        'cancelled': (),
+    }
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Массовые update() должны выставлять updated_at явно (см. order.services.transition_orders).
+    updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(
         max_length=20,
         choices=[
@@ -18,17 +31,79 @@ class Order(models.Model):
     )
     address = models.TextField(max_length=500, blank=True, null=True)
     comment = models.TextField(max_length=1000, blank=True, null=True)
+    # Итоги по позициям (по unit_price), фиксируются при создании; пересчёт — recalculate_totals().
+    total_amount = models.PositiveBigIntegerField('Общая сумма', default=0, db_index=True, editable=False)
+    item_count = models.PositiveIntegerField('Количество продуктов', default=0, db_index=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['status', 'updated_at', 'id']),
+            models.Index(fields=['updated_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.user.email}"
 
+    def can_transition(self, status):
+        return status in self.STATUS_TRANSITIONS[self.status]
+
+    def recalculate_totals(self):
+        totals = self.items.aggregate(total_amount=Sum(F('quantity') * F('unit_price')), item_count=Sum('quantity'))
+        self.total_amount = totals['total_amount'] or 0
+        self.item_count = totals['item_count'] or 0
+        Order.objects.filter(pk=self.pk).update(total_amount=self.total_amount, item_count=self.item_count)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # Цена за единицу на момент заказа; дальнейшие изменения цены продукта заказ не затрагивают.
+    unit_price = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ('order', 'product')
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None and self.product_id:
+            self.unit_price = self.product.price
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.title} in order {self.order.id}"
+
+
+class OrderStatusEvent(models.Model):
+    """Запись журнала смены статуса заказа. Только добавляется, не изменяется."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+    from_status = models.CharField(max_length=20)
+    to_status = models.CharField(max_length=20)
+    changed_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status} → {self.to_status}"
+
+
+class IdempotencyKey(models.Model):
+    """Ответ на запрос создания заказа, сохранённый по заголовку Idempotency-Key (см. order.idempotency)."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # sha256 от метода, пути и тела запроса: тот же ключ с другим запросом отклоняется.
+    fingerprint = models.CharField(max_length=64)
+    # Пока запрос выполняется, status_code и response пустые.
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
     def __str__(self):
-        return f"{self.quantity} x {self.product.title} in order {self.order.id}"
\ No newline at end of file
+        return f"{self.key} ({self.user_id})"
@@ -5,7 +5,7 @@ from .models import Order, OrderItem
 from user.serializers import UserSerializer
 from products.serializers import ProductSerializers
 from user.models import CustomUser
-from django.db import transaction
+from .services import create_order
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -16,8 +16,8 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
-        fields = ['product', 'product_id', 'quantity']
-        read_only_fields = ['product']
+        fields = ['product', 'product_id', 'quantity', 'unit_price']
+        read_only_fields = ['product', 'unit_price']
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -26,8 +26,25 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'user', 'items', 'created_at', 'status', 'address', 'comment']
-        read_only_fields = ['id', 'user', 'created_at']
+        fields = ['id', 'user', 'items', 'created_at', 'updated_at', 'status', 'address', 'comment', 'total_amount',
+                  'item_count']
+        read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'total_amount', 'item_count']
+
+    def validate_status(self, value):
+        if self.instance is not None and value != self.instance.status and not self.instance.can_transition(value):
+            raise serializers.ValidationError(f"Недопустимый переход статуса: {self.instance.status} → {value}.")
+        return value
+
+
+class OrderChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ['id', 'user', 'status', 'total_amount', 'item_count', 'created_at', 'updated_at']
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000)
+    status = serializers.ChoiceField(choices=list(Order.STATUS_TRANSITIONS))
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
@@ -48,24 +65,17 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         fields = ['product_ids', 'user_id', 'address', 'comment']
 
     def validate_product_ids(self, value):
-        product_ids = [item['product_id'] for item in value]
-        products = Product.objects.filter(id__in=product_ids)
-
-        if len(products) != len(product_ids):
-            missing_ids = set(product_ids) - set(products.values_list('id', flat=True))
-            raise serializers.ValidationError(f"Продукты с ID {missing_ids} не существуют.")
-
         for item in value:
-            product = Product.objects.get(id=item['product_id'])
-            if product.total < item['quantity']:
-                raise serializers.ValidationError(
-                    f"Недостаточно товара для продукта ID {item['product_id']}: "
-                    f"доступно {product.total}, запрошено {item['quantity']}."
-                )
             if item['quantity'] <= 0:
                 raise serializers.ValidationError(
                     f"Количество для продукта ID {item['product_id']} должно быть больше 0."
                 )
+
+        product_ids = {item['product_id'] for item in value}
+        missing_ids = product_ids - set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        if missing_ids:
+            raise serializers.ValidationError(f"Продукты с ID {missing_ids} не существуют.")
+        # Остатки проверяются при списании в create_order, под блокировкой.
         return value
 
     def create(self, validated_data):
@@ -79,32 +89,10 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         else:
             user = self.context['request'].user
 
-        with transaction.atomic():
-            order = Order.objects.create(
-                user=user,
-                address=address,
-                comment=comment
-            )
-
-            order_items = []
-            for item in product_ids:
-                product = Product.objects.select_for_update().get(id=item['product_id'])
-                product.total -= item['quantity']
-                if product.total < 0:
-                    raise serializers.ValidationError(
-                        f"Недостаточно товара для продукта ID {item['product_id']}: "
-                        f"доступно {product.total + item['quantity']}, запрошено {item['quantity']}."
-                    )
-                product.save()
-
-                order_items.append(
-                    OrderItem(
-                        order=order,
-                        product=product,
-                        quantity=item['quantity']
-                    )
-                )
-
-            OrderItem.objects.bulk_create(order_items)
-
-        return order
\ No newline at end of file
+        return create_order(
+            user,
+            [(item['product_id'], item['quantity']) for item in product_ids],
+            address=address,
+            comment=comment,
+            created_by_admin=self.context.get('created_by_admin', False),
+        )
\ No newline at end of file
@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.db.models import Prefetch, Sum
+from django.utils import timezone
+
+from notifications.outbox import enqueue_telegram
+from products.inventory import apply_movements, merge_quantities, reserve_stock
+from products.models import InventoryMovement
+from products.querysets import plan_product_items
+from .models import Order, OrderItem, OrderStatusEvent
+
+
+def planned_orders():
+    return Order.objects.select_related('user').prefetch_related(
+        Prefetch('items', queryset=plan_product_items(OrderItem))
+    )
+
+
+def order_message(order, items, created_by_admin=False):
+    """Текст уведомления о новом заказе для Telegram (HTML)."""
+    user = order.user
+    product_list = "\n".join(
+        [f"- {item.product.title} (ID: {item.product.id}, Кол-во: {item.quantity}, Цена: {item.unit_price})"
+         for item in items]
+    )
+    return (
+        f"<b>🛒 Новый заказ #{order.id}{' (Создан админом)' if created_by_admin else ''}</b>\n\n"
+        f"<b>👤 Клиент:</b> {user.name} {user.surname}\n"
+        f"<b>📞 Телефон:</b> {user.phone_number}\n"
+        f"<b>🏠 Адрес доставки:</b> {order.address or 'Не указан'}\n"
+        f"<b>💬 Комментарий:</b> {order.comment or 'Не указан'}\n"
+        f"<b>📦 Продукты:</b>\n{product_list}\n\n"
+        f"<b>💵 Общая сумма:</b> {order.total_amount}\n"
+        f"<b>📅 Дата:</b> {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"<b>📢 Статус:</b> {order.status}"
+    )
+
+
+def create_order(user, items, address='', comment='', created_by_admin=False):
+    """Создаёт заказ из [(product_id, quantity), ...] и атомарно списывает остатки.
+
+    Повторяющиеся продукты объединяются в одну позицию, цены фиксируются по заблокированным строкам. При нехватке товара выбрасывает
+    products.inventory.InsufficientStock со всеми недостающими позициями, и ничего не сохраняется.
+    Уведомление в Telegram ставится в outbox в той же транзакции и отправляется воркером dispatch_notifications.
+    """
+    quantities = merge_quantities(items)
+    with transaction.atomic():
+        # Заказ создаётся первым, чтобы записи складского журнала ссылались на него; при нехватке всё откатится.
+        order = Order.objects.create(user=user, address=address, comment=comment)
+        products = reserve_stock(quantities, reference=f'order:{order.id}')
+        order.total_amount = sum(products[product_id].price * quantity for product_id, quantity in quantities.items())
+        order.item_count = sum(quantities.values())
+        Order.objects.filter(pk=order.pk).update(total_amount=order.total_amount, item_count=order.item_count)
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=products[product_id], quantity=quantity, unit_price=products[product_id].price
+            )
+            for product_id, quantity in sorted(quantities.items())
+        ])
+        enqueue_telegram(order_message(order, order_items, created_by_admin=created_by_admin))
+    return order
+
+
+
+def transition_orders(order_ids, status, changed_by=None):
+    """Переводит заказы в status одним UPDATE и записывает события одним bulk_create.
+
+    Заказы, для которых переход недопустим (см. Order.STATUS_TRANSITIONS), не меняются.
+    Возвращает (список переведённых id, {id: текущий статус} пропущенных); несуществующие id игнорируются.
+    """
+    allowed_from = [source for source, targets in Order.STATUS_TRANSITIONS.items() if status in targets]
+    with transaction.atomic():
+        current = dict(
+            Order.objects.select_for_update().filter(id__in=order_ids).order_by('id').values_list('id', 'status')
+        )
+        moved = [order_id for order_id, source in current.items() if source in allowed_from]
+        skipped = {order_id: source for order_id, source in current.items() if source not in allowed_from}
+        now = timezone.now()
+        Order.objects.filter(id__in=moved).update(status=status, updated_at=now)
+        if status == 'cancelled':
+            restock_orders(moved, changed_by)
+        OrderStatusEvent.objects.bulk_create([
+            OrderStatusEvent(
+                order_id=order_id, from_status=current[order_id], to_status=status, changed_by=changed_by,
+                created_at=now,
+            )
+            for order_id in moved
+        ], batch_size=1000)
+    return moved, skipped
+
+
+def restock_orders(order_ids, user=None):
+    """Возвращает на склад то, что заказы списали продажей (движения restock со ссылкой на заказ).
+
+    Количество берётся из журнала, а не из OrderItem: позиции, добавленные в админке, склад не списывали,
+    а уже возвращённое повторно не возвращается.
+    """
+    sold = InventoryMovement.objects.filter(
+        reference__in=[f'order:{order_id}' for order_id in order_ids],
+        reason__in=[InventoryMovement.SALE, InventoryMovement.RESTOCK],
+    ).values_list('reference', 'product_id').annotate(net=Sum('delta')).order_by('reference', 'product_id')
+    apply_movements(
+        [(product_id, -net, reference) for reference, product_id, net in sold if net < 0],
+        InventoryMovement.RESTOCK, user,
+    )
+
+
+def change_order_status(order, status, changed_by=None):
+    """Смена статуса одного заказа перед сохранением остальных его полей; вызывать внутри transaction.atomic().
+
+    Строка заказа блокируется, и order.status перечитывается: последующий order.save() не вернёт устаревший
+    статус, а параллельные отмены не вернут товар на склад дважды. Переход, журнал и возврат на склад
+    выполняет transition_orders. status=None только перечитывает статус.
+    Возвращает False, если переход из текущего статуса недопустим (order.status остаётся текущим).
+    """
+    order.status = Order.objects.select_for_update().values_list('status', flat=True).get(pk=order.pk)
+    if status is None or status == order.status:
+        return True
+    moved, _ = transition_orders([order.pk], status, changed_by)
+    if moved:
+        order.status = status
+    return bool(moved)
@@ -1,3 +1,602 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.forms.models import model_to_dict
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notifications.models import OutboxMessage
+from products.admin import ProductAdmin, ProductAdminForm
+from products.category_tree import get_category_tree
+from products.inventory import InsufficientStock
+from products.models import Category, Comment, InventoryMovement, Product, Tag
+from products.serializers import ProductSerializers
+from products.testing import create_product
+from user.models import CustomUser
+from .models import IdempotencyKey, Order, OrderItem, OrderStatusEvent
+from .services import change_order_status, create_order, transition_orders
+
+
+class OrderQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.admin = CustomUser.objects.create_user(
+            email='admin@example.com', password='x', name='A', surname='B', phone_number='+998901234568',
+            is_staff=True,
+        )
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.tag = Tag.objects.create(name_uz='Antibiotik', name_ru='Антибиотик', name_en='Antibiotic')
+        # Дерево категорий кэшируется на процесс; прогреваем, чтобы считать только запросы на продукты.
+        get_category_tree()
+
+    def create_orders(self, count):
+        for i in range(count):
+            order = Order.objects.create(user=self.user, address='Tashkent')
+            for j in range(2):
+                product = create_product(self.category)
+                product.tags.add(self.tag)
+                Comment.objects.create(product=product, user=self.user, text='ok', rating=5)
+                OrderItem.objects.create(order=order, product=product, quantity=1)
+
+    def count_queries(self, user, url):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assertConstantQueries(self, user, url):
+        self.create_orders(2)
+        small = self.count_queries(user, url)
+        self.create_orders(5)
+        self.assertEqual(self.count_queries(user, url), small)
+
+    def test_user_orders(self):
+        self.assertConstantQueries(self.user, '/api/my-orders/')
+
+    def test_admin_order_list(self):
+        self.assertConstantQueries(self.admin, '/api/admin/orders/')
+
+
+class OrderAdminQueryCountTests(TestCase):
+    def setUp(self):
+        admin_user = CustomUser.objects.create_superuser(
+            email='admin@example.com', password='x', name='A', surname='B', phone_number='+998901234568'
+        )
+        self.client.force_login(admin_user)
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+
+    def create_orders(self, count):
+        for i in range(count):
+            user = CustomUser.objects.create_user(
+                email=f'buyer{CustomUser.objects.count()}@example.com', password='x', name='A', surname='B',
+                phone_number='+998901234567'
+            )
+            create_order(user, [(create_product(self.category, total=10).id, 2)])
+
+    def count_queries(self, url='/admin/order/order/'):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_changelist_query_count_is_constant(self):
+        self.create_orders(2)
+        small = self.count_queries()
+        self.create_orders(15)
+        self.assertEqual(self.count_queries(), small)
+
+    def test_user_filter_and_total_ordering(self):
+        self.create_orders(3)
+        user = Order.objects.first().user
+        small = self.count_queries(f'/admin/order/order/?user={user.id}&o=7')
+        self.create_orders(5)
+        self.assertEqual(self.count_queries(f'/admin/order/order/?user={user.id}&o=-7'), small)
+        response = self.client.get(f'/admin/order/order/?user={user.id}')
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class CreateOrderStockTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+
+    def test_reports_every_short_item_and_keeps_stock(self):
+        first = create_product(self.category, total=1)
+        second = create_product(self.category, total=2)
+        third = create_product(self.category, total=5)
+        with self.assertRaises(InsufficientStock) as raised:
+            create_order(self.user, [(first.id, 2), (second.id, 3), (third.id, 1)])
+        self.assertEqual(raised.exception.shortages, [(first.id, 1, 2), (second.id, 2, 3)])
+        self.assertEqual(list(Product.objects.order_by('id').values_list('total', flat=True)), [1, 2, 5])
+        self.assertFalse(Order.objects.exists())
+
+    def test_merges_repeated_products(self):
+        product = create_product(self.category, total=5)
+        order = create_order(self.user, [(product.id, 2), (product.id, 1)])
+        self.assertEqual(list(order.items.values_list('product_id', 'quantity')), [(product.id, 3)])
+        product.refresh_from_db()
+        self.assertEqual(product.total, 2)
+
+    def test_snapshots_prices_and_totals(self):
+        first = create_product(self.category, total=5)
+        second = create_product(self.category, total=5)
+        Product.objects.filter(pk=second.pk).update(price=250)
+        order = create_order(self.user, [(first.id, 2), (second.id, 1)])
+        Product.objects.update(price=999)
+
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount, order.item_count), (2 * first.price + 250, 3))
+        order.recalculate_totals()
+        self.assertEqual((order.total_amount, order.item_count), (2 * first.price + 250, 3))
+
+
+class InventoryLedgerTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            email='admin@example.com', password='x', name='A', surname='B', phone_number='+998901234568',
+            is_staff=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def movements(self, product):
+        return list(product.inventory_movements.order_by('id').values_list('reason', 'delta', 'balance_after', 'reference'))
+
+    def test_sale_and_cancellation_are_recorded(self):
+        product = create_product(self.category, total=10)
+        order = create_order(self.user, [(product.id, 3)])
+        response = self.client.post(
+            '/api/admin/orders/transition/', {'order_ids': [order.id], 'status': 'cancelled'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        product.refresh_from_db()
+        self.assertEqual(product.total, 10)
+        self.assertEqual(self.movements(product), [
+            (InventoryMovement.SALE, -3, 7, f'order:{order.id}'),
+            (InventoryMovement.RESTOCK, 3, 10, f'order:{order.id}'),
+        ])
+
+    def test_cancellation_restocks_only_what_the_order_sold(self):
+        sold, added = create_product(self.category, total=10), create_product(self.category, total=5)
+        order = create_order(self.user, [(sold.id, 3)])
+        # Позиции из админки не проходят через склад: возвращать по ним нечего.
+        OrderItem.objects.create(order=order, product=added, quantity=2)
+        OrderItem.objects.filter(order=order, product=sold).update(quantity=4)
+        transition_orders([order.id], 'cancelled', self.admin)
+
+        sold.refresh_from_db()
+        added.refresh_from_db()
+        self.assertEqual((sold.total, added.total), (10, 5))
+        self.assertEqual(self.movements(added), [])
+        self.assertEqual(self.movements(sold)[-1], (InventoryMovement.RESTOCK, 3, 10, f'order:{order.id}'))
+
+    def test_update_api_cancellation_restocks(self):
+        product = create_product(self.category, total=4)
+        order = create_order(self.user, [(product.id, 4)])
+        response = self.client.patch(f'/api/admin/orders/{order.id}/update/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual(product.total, 4)
+
+    def test_low_stock_alert_is_sent_once_when_threshold_is_crossed(self):
+        product = create_product(self.category, total=8)
+        Product.objects.filter(pk=product.pk).update(low_stock_threshold=5)
+        alerts = OutboxMessage.objects.filter(payload__text__icontains='Заканчивается товар')
+
+        create_order(self.user, [(product.id, 3)])
+        self.assertFalse(alerts.exists())
+        create_order(self.user, [(product.id, 1)])
+        self.assertEqual(alerts.count(), 1)
+        create_order(self.user, [(product.id, 1)])
+        self.assertEqual(alerts.count(), 1)
+
+    def test_product_api_records_adjustment(self):
+        product = create_product(self.category, total=5)
+        response = self.client.patch(f'/api/products/{product.id}/', {'total': 12}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 12)
+        product.refresh_from_db()
+        self.assertEqual(product.total, 12)
+        self.assertEqual(self.movements(product)[-1], (InventoryMovement.ADJUSTMENT, 7, 12, 'api'))
+
+    def test_product_api_put_does_not_accept_total(self):
+        product = create_product(self.category, total=10)
+        shown = self.client.get(f'/api/products/{product.id}/').json()
+        create_order(self.user, [(product.id, 3)])
+        data = {field: shown[field] for field in ProductSerializers.Meta.fields if field in shown}
+        data.update(title='Renamed', category=self.category.id, tags_ids=[])
+        response = self.client.put(f'/api/products/{product.id}/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('PATCH', response.json()['total'][0])
+
+        del data['total']
+        response = self.client.put(f'/api/products/{product.id}/', data, format='json')
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json()['total'], 7)
+        product.refresh_from_db()
+        self.assertEqual((product.title, product.total), ('Renamed', 7))
+        self.assertFalse(product.inventory_movements.filter(reason=InventoryMovement.ADJUSTMENT).exists())
+
+    def save_in_admin(self, shown, **changes):
+        data = {**model_to_dict(shown, exclude=['id', *Product.RATING_FIELDS]), **changes}
+        form = ProductAdminForm(data, instance=shown)
+        self.assertTrue(form.is_valid(), form.errors)
+        request = RequestFactory().post('/')
+        request.user = self.admin
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        ProductAdmin(Product, admin.site).save_model(request, form.save(commit=False), form, True)
+        return [str(message) for message in request._messages]
+
+    def test_admin_adjusts_stock_by_the_change_from_the_shown_total(self):
+        product = create_product(self.category, total=10)
+        shown = Product.objects.get(pk=product.pk)
+        create_order(self.user, [(product.id, 3)])
+        self.save_in_admin(shown, title='Renamed')
+        product.refresh_from_db()
+        self.assertEqual((product.title, product.total), ('Renamed', 7))
+
+        shown = Product.objects.get(pk=product.pk)
+        create_order(self.user, [(product.id, 2)])
+        self.save_in_admin(shown, total=4)
+        product.refresh_from_db()
+        self.assertEqual(product.total, 2)
+        self.assertEqual(self.movements(product)[-1], (InventoryMovement.ADJUSTMENT, -3, 2, 'admin'))
+
+        shown = Product.objects.get(pk=product.pk)
+        create_order(self.user, [(product.id, 2)])
+        messages = self.save_in_admin(shown, total=0)
+        product.refresh_from_db()
+        self.assertEqual(product.total, 0)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(product.inventory_movements.filter(reason=InventoryMovement.ADJUSTMENT).count(), 1)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = create_product(Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head'), total=5)
+
+    def post(self, quantity=2, key='retry-1'):
+        return self.client.post(
+            '/api/orders/create/', {'product_ids': [{'product_id': self.product.id, 'quantity': quantity}]},
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_returns_stored_response_without_creating_another_order(self):
+        first = self.post()
+        second = self.post()
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OutboxMessage.objects.filter(payload__text__icontains='Новый заказ').count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total, 3)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        self.post()
+        self.assertEqual(self.post(quantity=1).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_request_releases_key(self):
+        self.assertEqual(self.post(quantity=10).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        Product.objects.update(total=10)
+        self.assertEqual(self.post(quantity=10).status_code, 201)
+
+    def test_expired_keys_are_purged(self):
+        self.post(key='old')
+        self.post(key='new')
+        IdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+class OrderStatusTransitionTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            email='admin@example.com', password='x', name='A', surname='B', phone_number='+998901234568',
+            is_staff=True,
+        )
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_orders(self, count, status='pending'):
+        return [Order.objects.create(user=self.user, status=status).id for i in range(count)]
+
+    def transition(self, order_ids, status):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/admin/orders/transition/', {'order_ids': order_ids, 'status': status}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(context)
+
+    def test_bulk_transition_skips_invalid_and_logs_events(self):
+        pending = self.create_orders(3)
+        delivered = self.create_orders(1, status='delivered')
+        result, _ = self.transition(pending + delivered, 'shipping')
+
+        self.assertEqual(result, {'updated': pending, 'skipped': {str(delivered[0]): 'delivered'}})
+        self.assertEqual(Order.objects.filter(status='shipping').count(), 3)
+        self.assertEqual(
+            list(OrderStatusEvent.objects.values_list('order_id', 'from_status', 'to_status', 'changed_by')),
+            [(order_id, 'pending', 'shipping', self.admin.id) for order_id in pending]
+        )
+
+    def test_bulk_transition_query_count_is_constant(self):
+        _, small = self.transition(self.create_orders(3), 'cancelled')
+        _, large = self.transition(self.create_orders(40), 'cancelled')
+        self.assertEqual(large, small)
+
+    def test_update_api_validates_transition_and_logs_event(self):
+        order_id = self.create_orders(1, status='shipping')[0]
+        url = f'/api/admin/orders/{order_id}/update/'
+        self.assertEqual(self.client.patch(url, {'status': 'pending'}, format='json').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'status': 'delivered'}, format='json').status_code, 200)
+        self.assertEqual(
+            list(OrderStatusEvent.objects.values_list('from_status', 'to_status')), [('shipping', 'delivered')]
+        )
+
+    def test_changes_feed_returns_only_orders_changed_since(self):
+        old = self.create_orders(2)
+        Order.objects.filter(id__in=old).update(updated_at=timezone.now() - timedelta(hours=1))
+        since = timezone.now() - timedelta(minutes=1)
+        fresh = self.create_orders(2)
+        self.transition(fresh[:1], 'shipping')
+
+        response = self.client.get('/api/admin/orders/changes/', {'changed_since': since.isoformat()})
+        self.assertEqual([order['id'] for order in response.json()['results']], [fresh[1], fresh[0]])
+        response = self.client.get(
+            '/api/admin/orders/changes/', {'changed_since': since.isoformat(), 'status': 'shipping'}
+        )
+        self.assertEqual([order['id'] for order in response.json()['results']], fresh[:1])
+        response = self.client.get('/api/admin/orders/changes/', {'changed_since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def feed_pages(self, url):
+        with CaptureQueriesContext(connection) as context:
+            for _ in range(20):
+                body = self.client.get(url).json()
+                yield [order['id'] for order in body['results']]
+                url = body['next']
+                if url is None:
+                    break
+            else:
+                self.fail("Лента не закончилась за 20 страниц")
+        self.assertFalse(any('OFFSET' in query['sql'] for query in context.captured_queries))
+
+    def test_changes_feed_pages_through_orders_with_equal_updated_at(self):
+        order_ids = self.create_orders(7)
+        # Массовый переход ставит всем заказам один и тот же updated_at.
+        self.transition(order_ids, 'shipping')
+        self.assertEqual(Order.objects.values('updated_at').distinct().count(), 1)
+
+        pages = list(self.feed_pages('/api/admin/orders/changes/?page_size=3'))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), order_ids)
+
+    def test_changes_feed_does_not_skip_orders_changed_between_pages(self):
+        order_ids = self.create_orders(6)
+        Order.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+        seen = []
+        for page in self.feed_pages('/api/admin/orders/changes/?page_size=2'):
+            if not seen:
+                # Между страницами меняются уже прочитанный и ещё не прочитанный заказы.
+                self.transition([order_ids[0], order_ids[4]], 'shipping')
+            seen.extend(page)
+        self.assertEqual(seen, order_ids[:4] + [order_ids[5], order_ids[0], order_ids[4]])
+
+    def test_polling_resumes_inside_a_batch_with_equal_updated_at(self):
+        order_ids = self.create_orders(5)
+        Order.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+        body = self.client.get('/api/admin/orders/changes/?page_size=10').json()
+        self.assertEqual([order['id'] for order in body['results']], order_ids)
+        self.assertIsNone(body['next'])
+
+        self.transition(order_ids[:4], 'shipping')
+        body = self.client.get(body['poll'].replace('page_size=10', 'page_size=2')).json()
+        self.assertEqual([order['id'] for order in body['results']], order_ids[:2])
+        # Страница закончилась посреди массового перехода: опрос продолжает с курсора, а не с updated_at.
+        poll = body['poll']
+        body = self.client.get(poll).json()
+        self.assertEqual([order['id'] for order in body['results']], order_ids[2:4])
+        body = self.client.get(body['poll']).json()
+        self.assertEqual(body['results'], [])
+        self.assertIsNotNone(body['poll'])
+
+
+class OrderStatusChangeLockTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(
+            email='admin@example.com', password='x', name='A', surname='B', phone_number='+998901234568'
+        )
+        user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.product = create_product(Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head'), total=10)
+        self.order = create_order(user, [(self.product.id, 3)], address='Tashkent')
+
+    def assertRestockedOnce(self):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total, 10)
+        self.assertEqual(self.product.inventory_movements.filter(reason=InventoryMovement.RESTOCK).count(), 1)
+        self.assertEqual(OrderStatusEvent.objects.filter(to_status='cancelled').count(), 1)
+
+    def test_stale_instances_cannot_cancel_twice(self):
+        first, second = Order.objects.get(pk=self.order.pk), Order.objects.get(pk=self.order.pk)
+        self.assertTrue(change_order_status(first, 'cancelled', self.admin))
+        # Второй видел pending, но под блокировкой читает cancelled: повторная отмена ничего не делает.
+        self.assertTrue(change_order_status(second, 'cancelled', self.admin))
+        self.assertFalse(change_order_status(Order.objects.get(pk=self.order.pk), 'shipping'))
+        self.assertEqual(second.status, 'cancelled')
+        self.assertRestockedOnce()
+
+    def test_saving_other_fields_keeps_a_concurrent_status_change(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        transition_orders([self.order.pk], 'cancelled', self.admin)
+        change_order_status(stale, None)
+        stale.address = 'Samarkand'
+        stale.save()
+        self.assertEqual(Order.objects.values_list('status', 'address').get(), ('cancelled', 'Samarkand'))
+
+    def test_update_api_cancels_once(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = f'/api/admin/orders/{self.order.id}/update/'
+        for _ in range(2):
+            self.assertEqual(client.patch(url, {'status': 'cancelled'}, format='json').status_code, 200)
+        self.assertRestockedOnce()
+        self.assertEqual(client.patch(url, {'status': 'shipping'}, format='json').status_code, 400)
+
+    def test_admin_changelist_cancels_through_the_lock(self):
+        self.client.force_login(self.admin)
+        data = {
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1', 'form-0-id': str(self.order.id),
+            'form-0-status': 'cancelled', 'form-0-address': 'Samarkand', 'form-0-comment': '', '_save': 'Save',
+        }
+        # Повторная отправка той же формы (вторая вкладка) не возвращает товар ещё раз.
+        for _ in range(2):
+            self.assertEqual(self.client.post('/admin/order/order/', data).status_code, 302)
+        self.assertRestockedOnce()
+        self.assertEqual(Order.objects.values_list('status', 'address').get(), ('cancelled', 'Samarkand'))
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        admin = CustomUser.objects.create_user(
+            email='admin@example.com', password='x', name='A', surname='B', phone_number='+998901234568',
+            is_staff=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='Ali', surname='Valiev', phone_number='+998901234567'
+        )
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        first, second = create_product(category, total=10), create_product(category, total=10)
+        self.order = create_order(self.user, [(first.id, 2), (second.id, 1)], address='Tashkent')
+        self.empty = Order.objects.create(user=self.user, status='cancelled')
+
+    def export(self, **params):
+        response = self.client.get('/api/admin/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_has_a_row_per_line_item(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual(
+            [(row['order_id'], row['quantity'], row['line_total']) for row in rows],
+            [(str(self.order.id), '2', '200'), (str(self.order.id), '1', '100'), (str(self.empty.id), '', '')]
+        )
+        self.assertEqual(rows[0]['email'], 'buyer@example.com')
+
+    def test_csv_escapes_formulas_in_customer_text(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(name='=HYPERLINK("http://evil")', surname='@SUM(A1)')
+        Order.objects.filter(pk=self.order.pk).update(address='+1 street', comment='-2+3')
+        row = next(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual(
+            (row['name'], row['surname'], row['address'], row['comment']),
+            ('\'=HYPERLINK("http://evil")', "'@SUM(A1)", "'+1 street", "'-2+3")
+        )
+        self.assertEqual(row['phone_number'], '+998901234567')
+
+    def test_jsonl_has_an_object_per_order(self):
+        lines = [json.loads(line) for line in self.export(export_format='jsonl').splitlines()]
+        self.assertEqual([(line['order_id'], len(line['items'])) for line in lines], [(self.order.id, 2), (self.empty.id, 0)])
+        self.assertEqual(lines[0]['total_amount'], 300)
+
+    def test_filters_by_status_and_date(self):
+        lines = self.export(export_format='jsonl', status='cancelled').splitlines()
+        self.assertEqual([json.loads(line)['order_id'] for line in lines], [self.empty.id])
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.export(date_from=tomorrow).splitlines()[1:], [])
+        self.assertEqual(self.client.get('/api/admin/orders/export/', {'status': 'lost'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/orders/export/', {'date_to': 'soon'}).status_code, 400)
+
+    def test_query_count_does_not_depend_on_rows(self):
+        with CaptureQueriesContext(connection) as context:
+            self.export()
+        self.assertEqual(len(context), 1)
+
+    def test_command_writes_the_same_export(self):
+        stdout = io.StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--status', 'pending', stdout=stdout)
+        self.assertEqual([json.loads(line)['order_id'] for line in stdout.getvalue().splitlines()], [self.order.id])
+
+
+class OrderStockConcurrencyTests(TransactionTestCase):
+    """Параллельные заказы не продают больше, чем есть на складе."""
+    workers = 20
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.popular = create_product(category, total=30)
+        self.other = create_product(category, total=30)
+
+    def place_order(self, worker):
+        # Половина заказов перечисляет товары в обратном порядке: блокировки всё равно берутся по id.
+        items = [(self.popular.id, 3), (self.other.id, 1)]
+        if worker % 2:
+            items.reverse()
+        deadline = time.monotonic() + 60
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    return create_order(self.user, items)
+                except InsufficientStock:
+                    return None
+                except OperationalError:
+                    # SQLite не ждёт блокировку таблицы, а сразу отказывает; повторяем транзакцию.
+                    time.sleep(random.uniform(0.001, 0.02))
+            raise AssertionError("Заказ не удалось выполнить из-за блокировок.")
+        finally:
+            connection.close()
+
+    def test_parallel_orders_do_not_oversell(self):
+        with ThreadPoolExecutor(self.workers) as pool:
+            orders = [order for order in pool.map(self.place_order, range(self.workers)) if order]
+
+        self.popular.refresh_from_db()
+        self.other.refresh_from_db()
+        sold = sum(OrderItem.objects.filter(product=self.popular).values_list('quantity', flat=True))
+        self.assertEqual(len(orders), 10)
+        self.assertEqual(sold, 30)
+        self.assertEqual(self.popular.total, 0)
+        self.assertEqual(self.other.total, 20)
@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import CreateOrderAPI, UserOrdersAPI, AdminOrderListAPI, AdminOrderDetailAPI, AdminOrderUpdateAPI, AdminOrderDeleteAPI, AdminOrderCreateAPI
+from .views import CreateOrderAPI, UserOrdersAPI, AdminOrderListAPI, AdminOrderDetailAPI, AdminOrderUpdateAPI, AdminOrderDeleteAPI, AdminOrderCreateAPI, \
+    AdminOrderTransitionAPI, AdminOrderChangesAPI, AdminOrderExportAPI
 
 
 urlpatterns = [
@@ -10,4 +11,7 @@ urlpatterns = [
     path('admin/orders/<int:pk>/update/', AdminOrderUpdateAPI.as_view(), name='admin_order_update'),
     path('admin/orders/<int:pk>/delete/', AdminOrderDeleteAPI.as_view(), name='admin_order_delete'),
     path('admin/orders/create/', AdminOrderCreateAPI.as_view(), name='admin_order_create'),
+    path('admin/orders/transition/', AdminOrderTransitionAPI.as_view(), name='admin_order_transition'),
+    path('admin/orders/changes/', AdminOrderChangesAPI.as_view(), name='admin_order_changes'),
+    path('admin/orders/export/', AdminOrderExportAPI.as_view(), name='admin_order_export'),
 ]
\ No newline at end of file
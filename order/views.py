@@ -1,12 +1,18 @@
-import requests
-import logging
-from django.conf import settings
-from rest_framework import generics, permissions
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import generics, permissions, serializers
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from conf.pagination import ChangeFeedPagination, CreatedAtCursorPagination
+from .export import FORMATS, export_queryset, stream_export
+from .idempotency import idempotency_key_parameter, idempotent
 from .models import Order
-from .serializers import OrderSerializer, OrderCreateSerializer
+from .services import change_order_status, planned_orders, transition_orders
+from .serializers import OrderSerializer, OrderCreateSerializer, OrderChangeSerializer, OrderTransitionSerializer
 
 
 class CreateOrderAPI(generics.CreateAPIView):
@@ -15,7 +21,7 @@ class CreateOrderAPI(generics.CreateAPIView):
 
     @swagger_auto_schema(
         operation_summary="Создать новый заказ",
-        operation_description="Создаёт новый заказ для аутентифицированного пользователя, принимая массив объектов с ID продуктов, количеством, адресом доставки и комментарием. Отправляет уведомление в Telegram.",
+        operation_description="Создаёт новый заказ для аутентифицированного пользователя, принимая массив объектов с ID продуктов, количеством, адресом доставки и комментарием. Уведомление в Telegram ставится в очередь и отправляется фоновым воркером.",
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             required=["product_ids"],
@@ -51,56 +57,27 @@ class CreateOrderAPI(generics.CreateAPIView):
                 "comment": "Please deliver after 5 PM"
             }
         ),
+        manual_parameters=[idempotency_key_parameter],
         responses={
             201: OrderSerializer,
             400: "Неверные данные или продукты не найдены"
         }
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        order = serializer.save()
-
-        user = request.user
-        total_price = sum(item.quantity * item.product.price for item in order.items.all())
-        product_list = "\n".join(
-            [f"- {item.product.title} (ID: {item.product.id}, Кол-во: {item.quantity}, Цена: {item.product.price})"
-             for item in order.items.all()]
-        )
-        message = (
-            f"<b>🛒 Новый заказ #{order.id}</b>\n\n"
-            f"<b>👤 Клиент:</b> {user.name} {user.surname}\n"
-            f"<b>📞 Телефон:</b> {user.phone_number}\n"
-            f"<b>🏠 Адрес доставки:</b> {order.address or 'Не указан'}\n"
-            f"<b>💬 Комментарий:</b> {order.comment or 'Не указан'}\n"
-            f"<b>📦 Продукты:</b>\n{product_list}\n\n"
-            f"<b>💵 Общая сумма:</b> {total_price}\n"
-            f"<b>📅 Дата:</b> {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-            f"<b>📢 Статус:</b> {order.status}"
-        )
-
-        telegram_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
-        payload = {
-            'chat_id': settings.TELEGRAM_CHAT_ID,
-            'text': message,
-            'parse_mode': 'HTML'
-        }
-        try:
-            response = requests.post(telegram_url, json=payload)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            logger = logging.getLogger(__name__)
-            logger.error(f"Не удалось отправить сообщение в Telegram: {e}")
-
+        order = planned_orders().get(pk=serializer.save().pk)
         return Response(OrderSerializer(order).data, status=201)
 
 
 class UserOrdersAPI(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return planned_orders().filter(user=self.request.user)
 
     @swagger_auto_schema(
         operation_summary="Получить список заказов пользователя",
@@ -165,7 +142,8 @@ class IsAdminUser(permissions.BasePermission):
 class AdminOrderListAPI(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAdminUser]
-    queryset = Order.objects.all().order_by('-created_at')
+    pagination_class = CreatedAtCursorPagination
+    queryset = planned_orders().order_by('-created_at')
 
     @swagger_auto_schema(
         operation_summary="Получить список всех заказов (Админ)",
@@ -179,10 +157,48 @@ class AdminOrderListAPI(generics.ListAPIView):
         return super().get(request, *args, **kwargs)
 
 
+class AdminOrderExportAPI(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_summary="Выгрузка заказов с позициями (Админ)",
+        operation_description="Потоково отдаёт заказы и их позиции в CSV (строка на позицию) или JSONL (объект на заказ). "
+                              "Строки читаются из БД порциями, память не зависит от объёма выгрузки.",
+        manual_parameters=[
+            openapi.Parameter('export_format', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(FORMATS),
+                              default='csv', description="Формат выгрузки"),
+            openapi.Parameter('date_from', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Заказы, созданные не раньше (ISO 8601 дата или дата-время)"),
+            openapi.Parameter('date_to', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Заказы, созданные не позже (для даты — включая весь день)"),
+            openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Статусы через запятую, например shipping,delivered"),
+        ],
+        responses={
+            200: "Файл выгрузки",
+            400: "Неверные параметры",
+            403: "Недостаточно прав доступа"
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in FORMATS:
+            return Response({'error': f"Допустимые форматы: {', '.join(FORMATS)}."}, status=400)
+        status = request.query_params.get('status')
+        queryset = export_queryset(
+            date_from=request.query_params.get('date_from'),
+            date_to=request.query_params.get('date_to'),
+            statuses=status.split(',') if status else None,
+        )
+        response = StreamingHttpResponse(stream_export(queryset, export_format), content_type=FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="orders-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"'
+        return response
+
+
 class AdminOrderDetailAPI(generics.RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAdminUser]
-    queryset = Order.objects.all()
+    queryset = planned_orders()
 
     @swagger_auto_schema(
         operation_summary="Получить детали заказа (Админ)",
@@ -240,6 +256,92 @@ class AdminOrderUpdateAPI(generics.UpdateAPIView):
     def patch(self, request, *args, **kwargs):
         return super().patch(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        status = serializer.validated_data.pop('status', None)
+        with transaction.atomic():
+            order = serializer.instance
+            if not change_order_status(order, status, self.request.user):
+                raise serializers.ValidationError({'status': f"Недопустимый переход статуса: {order.status} → {status}."})
+            serializer.save()
+
+
+class AdminOrderTransitionAPI(generics.GenericAPIView):
+    serializer_class = OrderTransitionSerializer
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_summary="Массово изменить статус заказов (Админ)",
+        operation_description="Переводит заказы в указанный статус одним запросом к БД и записывает события в журнал. "
+                              "Допустимые переходы: pending → shipping → delivered, pending/shipping → cancelled. "
+                              "Заказы с недопустимым переходом не меняются и возвращаются в skipped.",
+        request_body=OrderTransitionSerializer,
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "updated": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)),
+                    "skipped": openapi.Schema(
+                        type=openapi.TYPE_OBJECT, description="ID заказа → текущий статус",
+                        additional_properties=openapi.Schema(type=openapi.TYPE_STRING)
+                    ),
+                }
+            ),
+            400: "Неверные данные",
+            403: "Недостаточно прав доступа"
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated, skipped = transition_orders(
+            serializer.validated_data['order_ids'], serializer.validated_data['status'], changed_by=request.user
+        )
+        return Response({'updated': updated, 'skipped': skipped})
+
+
+class AdminOrderChangesAPI(generics.ListAPIView):
+    serializer_class = OrderChangeSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = ChangeFeedPagination
+
+    def get_queryset(self):
+        queryset = Order.objects.all()
+        changed_since = self.request.query_params.get('changed_since')
+        if changed_since:
+            moment = parse_datetime(changed_since)
+            if moment is None:
+                raise serializers.ValidationError({'changed_since': "Неверный формат даты, ожидается ISO 8601."})
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            queryset = queryset.filter(updated_at__gt=moment)
+        status = self.request.query_params.get('status')
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset
+
+    @swagger_auto_schema(
+        operation_summary="Лента изменений заказов (Админ)",
+        operation_description="Возвращает заказы, изменённые после changed_since, от старых изменений к новым, "
+                              "постранично (курсор по updated_at и id). Дочитывайте страницы по next, пока он не пуст, "
+                              "а следующий опрос делайте по ссылке poll из последнего ответа: она продолжает ленту "
+                              "после последнего полученного заказа, в том числе среди заказов с одинаковым updated_at "
+                              "после массового перехода. changed_since нужен только для первого запроса.",
+        manual_parameters=[
+            openapi.Parameter('changed_since', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date-time',
+                              description="Начало ленты для первого запроса: заказы, изменённые строго позже "
+                                          "этого момента (ISO 8601). Для опроса используйте ссылку poll"),
+            openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              enum=list(Order.STATUS_TRANSITIONS), description="Фильтр по статусу"),
+        ],
+        responses={
+            200: OrderChangeSerializer(many=True),
+            400: "Неверный формат даты",
+            403: "Недостаточно прав доступа"
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class AdminOrderDeleteAPI(generics.DestroyAPIView):
     serializer_class = OrderSerializer
@@ -306,46 +408,16 @@ class AdminOrderCreateAPI(generics.CreateAPIView):
                 "comment": "Admin created order"
             }
         ),
+        manual_parameters=[idempotency_key_parameter],
         responses={
             201: OrderSerializer,
             400: "Неверные данные или продукты/пользователь не найдены",
             403: "Недостаточно прав доступа"
         }
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data, context={'request': request})
+        serializer = self.get_serializer(data=request.data, context={'request': request, 'created_by_admin': True})
         serializer.is_valid(raise_exception=True)
-        order = serializer.save()
-
-        user = order.user
-        total_price = sum(item.quantity * item.product.price for item in order.items.all())
-        product_list = "\n".join(
-            [f"- {item.product.title} (ID: {item.product.id}, Кол-во: {item.quantity}, Цена: {item.product.price})"
-             for item in order.items.all()]
-        )
-        message = (
-            f"<b>🛒 Новый заказ #{order.id} (Создан админом)</b>\n\n"
-            f"<b>👤 Клиент:</b> {user.name} {user.surname}\n"
-            f"<b>📞 Телефон:</b> {user.phone_number}\n"
-            f"<b>🏠 Адрес доставки:</b> {order.address or 'Не указан'}\n"
-            f"<b>💬 Комментарий:</b> {order.comment or 'Не указан'}\n"
-            f"<b>📦 Продукты:</b>\n{product_list}\n\n"
-            f"<b>💵 Общая сумма:</b> {total_price}\n"
-            f"<b>📅 Дата:</b> {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-            f"<b>📢 Статус:</b> {order.status}"
-        )
-
-        telegram_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
-        payload = {
-            'chat_id': settings.TELEGRAM_CHAT_ID,
-            'text': message,
-            'parse_mode': 'HTML'
-        }
-        try:
-            response = requests.post(telegram_url, json=payload)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            logger = logging.getLogger(__name__)
-            logger.error(f"Не удалось отправить сообщение в Telegram: {e}")
-
+        order = planned_orders().get(pk=serializer.save().pk)
         return Response(OrderSerializer(order).data, status=201)
\ No newline at end of file
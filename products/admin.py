@@ -1,6 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django import forms
-from .models import Product, Comment, Category, Tag, FAQ
+from .models import Product, Comment, Category, Tag, FAQ, InventoryMovement, InventoryReconciliation
+from .inventory import InsufficientStock, adjust_stock, lock_stock, record_opening_balance
 
 @admin.register(FAQ)
 class FAQAdmin(admin.ModelAdmin):
@@ -32,8 +33,24 @@ class ProductAdmin(admin.ModelAdmin):
     form = ProductAdminForm
     list_display = ('title', 'price', 'total',)
     search_fields = ('title', 'description')
+    readonly_fields = Product.RATING_FIELDS
     inlines = [CommentInline]
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            super().save_model(request, obj, form, change)
+            record_opening_balance(obj, user=request.user)
+            return
+        # Остаток меняется через складской журнал, см. products.inventory. Форма отправляет total целиком,
+        # поэтому корректируется только разница с показанным значением, а не устаревший остаток.
+        delta = obj.total - form.initial['total'] if 'total' in form.changed_data else 0
+        try:
+            obj.total = adjust_stock(obj.pk, delta, request.user, reference='admin')
+        except InsufficientStock as e:
+            obj.total = lock_stock(obj.pk)
+            self.message_user(request, f"Остаток не изменён: {' '.join(e.detail)}", messages.WARNING)
+        super().save_model(request, obj, form, change)
+
     def links_display(self, obj):
         return ", ".join(obj.link) if obj.link else "No links"
     links_display.short_description = "links"
@@ -62,3 +79,26 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ('name_en',)
     search_fields = ('name_en', 'name_ru', 'name_uz')
 
+
+@admin.register(InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product', 'delta', 'balance_after', 'reason', 'reference', 'created_by', 'created_at')
+    list_filter = ('reason',)
+    list_select_related = ('product', 'created_by')
+    search_fields = ('reference',)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(InventoryReconciliation)
+class InventoryReconciliationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'last_movement_id', 'products_checked', 'created_at')
+    readonly_fields = ('last_movement_id', 'products_checked', 'mismatches', 'created_at')
@@ -0,0 +1,216 @@
+import heapq
+import re
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Count
+
+from .search_index import IndexHolder, transliterate
+
+LANGUAGES = ('uz', 'ru', 'en')
+# Ключи длиннее не углубляют дерево: хватает для подсказок и экономит память.
+MAX_KEY_LENGTH = 24
+_WORD_START_RE = re.compile(r'\w+')
+
+Suggestion = namedtuple('Suggestion', 'type id label lang popularity')
+
+
+def _rank(suggestion):
+    return -suggestion.popularity, suggestion.label
+
+
+def suggestion_keys(label):
+    """Ключи для подсказки: нормализованная строка с начала каждого слова."""
+    normalized = transliterate(label)
+    return {normalized[match.start():][:MAX_KEY_LENGTH] for match in _WORD_START_RE.finditer(normalized)}
+
+
+def suggestion_languages(suggestion):
+    return LANGUAGES if suggestion.lang is None else (suggestion.lang,)
+
+
+class _Node:
+    __slots__ = ('children', 'suggestions', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.suggestions = set()
+        self.top = {}
+
+
+class AutocompleteTrie:
+    """Префиксное дерево, где каждый узел хранит лучшие `size` подсказок на каждый язык.
+
+    Поиск проходит len(q) узлов и сразу отдаёт готовый список, без обхода поддерева.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.root = _Node()
+
+    def add(self, suggestion):
+        for key in suggestion_keys(suggestion.label):
+            node = self.root
+            self._offer(node, suggestion)
+            for char in key:
+                node = node.children.setdefault(char, _Node())
+                self._offer(node, suggestion)
+            node.suggestions.add(suggestion)
+
+    def _offer(self, node, suggestion):
+        for lang in suggestion_languages(suggestion):
+            top = node.top.setdefault(lang, [])
+            if suggestion in top:
+                continue
+            if len(top) < self.size or _rank(suggestion) < _rank(top[-1]):
+                top.append(suggestion)
+                top.sort(key=_rank)
+                del top[self.size:]
+
+    def remove(self, suggestion):
+        for key in suggestion_keys(suggestion.label):
+            path = [self.root]
+            for char in key:
+                node = path[-1].children.get(char)
+                if node is None:
+                    break
+                path.append(node)
+            else:
+                path[-1].suggestions.discard(suggestion)
+                for depth in range(len(path) - 1, -1, -1):
+                    node = path[depth]
+                    self._refresh(node, suggestion)
+                    if depth and not node.children and not node.suggestions:
+                        del path[depth - 1].children[key[depth - 1]]
+
+    def _refresh(self, node, suggestion):
+        for lang in suggestion_languages(suggestion):
+            if suggestion not in node.top.get(lang, ()):
+                continue
+            candidates = [s for s in node.suggestions if lang in suggestion_languages(s)]
+            for child in node.children.values():
+                candidates.extend(child.top.get(lang, ()))
+            node.top[lang] = heapq.nsmallest(self.size, set(candidates), key=_rank)
+
+    def lookup(self, prefix, lang, limit):
+        node = self.root
+        for char in transliterate(prefix)[:MAX_KEY_LENGTH]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top.get(lang, [])[:limit]
+
+
+class AutocompleteIndex:
+    """Подсказки по названиям продуктов, тегам и заболеваниям с учётом популярности (числа заказов)."""
+
+    def __init__(self, size):
+        self.trie = AutocompleteTrie(size)
+        self._lock = threading.RLock()
+        self._products = {}
+        self._product_popularity = {}
+        self._tags = {}
+        self._illnesses = {}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, size):
+        from .models import Product, Tag
+
+        index = cls(size)
+        products = Product.objects.annotate(
+            order_count=Count('orderitem')
+        ).values('id', 'title', 'illness_uz', 'illness_ru', 'illness_en', 'order_count')
+        for row in products.iterator(chunk_size=2000):
+            index._product_popularity[row['id']] = row['order_count']
+            index.add_product(row)
+        tags = Tag.objects.annotate(popularity=Count('products__orderitem')).values(
+            'id', 'name_uz', 'name_ru', 'name_en', 'popularity'
+        )
+        for row in tags.iterator(chunk_size=2000):
+            index.add_tag(row, popularity=row['popularity'])
+        return index
+
+    def is_stale(self, ttl):
+        return bool(ttl) and time.monotonic() - self.built_at > ttl
+
+    def _replace(self, old, new):
+        if old == new:
+            return
+        if old is not None:
+            self.trie.remove(old)
+        if new is not None:
+            self.trie.add(new)
+
+    def add_product(self, row):
+        with self._lock:
+            self.remove_product(row['id'])
+            popularity = self._product_popularity.get(row['id'], 0)
+            suggestion = Suggestion('product', row['id'], row['title'], None, popularity)
+            self.trie.add(suggestion)
+            illnesses = {
+                (lang, str(label)) for lang in LANGUAGES for label in (row.get(f'illness_{lang}') or []) if label
+            }
+            self._products[row['id']] = (suggestion, illnesses)
+            for lang, label in illnesses:
+                contributors = self._illnesses.setdefault((lang, label), {})
+                old = self._illness_suggestion(lang, label, contributors)
+                contributors[row['id']] = popularity
+                self._replace(old, self._illness_suggestion(lang, label, contributors))
+
+    def remove_product(self, product_id):
+        with self._lock:
+            entry = self._products.pop(product_id, None)
+            if entry is None:
+                return
+            suggestion, illnesses = entry
+            self.trie.remove(suggestion)
+            for lang, label in illnesses:
+                contributors = self._illnesses[lang, label]
+                old = self._illness_suggestion(lang, label, contributors)
+                contributors.pop(product_id, None)
+                self._replace(old, self._illness_suggestion(lang, label, contributors))
+                if not contributors:
+                    del self._illnesses[lang, label]
+
+    @staticmethod
+    def _illness_suggestion(lang, label, contributors):
+        if not contributors:
+            return None
+        return Suggestion('illness', None, label, lang, sum(contributors.values()))
+
+    def add_tag(self, row, popularity=None):
+        with self._lock:
+            previous = self._tags.get(row['id'], ())
+            if popularity is None:
+                popularity = previous[0].popularity if previous else 0
+            self.remove_tag(row['id'])
+            suggestions = tuple(
+                Suggestion('tag', row['id'], row[f'name_{lang}'], lang, popularity)
+                for lang in LANGUAGES if row.get(f'name_{lang}')
+            )
+            for suggestion in suggestions:
+                self.trie.add(suggestion)
+            self._tags[row['id']] = suggestions
+
+    def remove_tag(self, tag_id):
+        with self._lock:
+            for suggestion in self._tags.pop(tag_id, ()):
+                self.trie.remove(suggestion)
+
+    def lookup(self, prefix, lang, limit):
+        with self._lock:
+            return self.trie.lookup(prefix, lang, limit)
+
+
+autocomplete_index = IndexHolder(
+    lambda: AutocompleteIndex.build(settings.AUTOCOMPLETE_MAX_LIMIT), 'AUTOCOMPLETE_INDEX_TTL'
+)
+
+
+def get_autocomplete_index():
+    """Индекс текущего процесса; строится лениво и перестраивается по AUTOCOMPLETE_INDEX_TTL,
+    чтобы подтянуть популярность из новых заказов."""
+    return autocomplete_index.get()
@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+
+class CategoryTree:
+    """Всё дерево категорий, загруженное одним запросом и упорядоченное по path."""
+
+    def __init__(self, categories):
+        self.categories = categories
+        self._by_id = {category.pk: category for category in categories}
+        self._children = defaultdict(list)
+        for category in categories:
+            self._children[category.parent_id].append(category)
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls):
+        from .models import Category
+        return cls(list(Category.objects.order_by('path')))
+
+    def is_stale(self, ttl):
+        return bool(ttl) and time.monotonic() - self.built_at > ttl
+
+    def get(self, category_id):
+        return self._by_id.get(category_id)
+
+    def children(self, category_id):
+        return self._children.get(category_id, [])
+
+
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def get_category_tree():
+    """Дерево текущего процесса; перестраивается после изменения категорий и по CATEGORY_TREE_TTL."""
+    global _tree
+    with _tree_lock:
+        if _tree is None or _tree.is_stale(settings.CATEGORY_TREE_TTL):
+            _tree = CategoryTree.build()
+        return _tree
+
+
+def invalidate_category_tree():
+    global _tree
+    with _tree_lock:
+        _tree = None
@@ -0,0 +1,137 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.http import QueryDict
+
+from conf.localization import localize
+from .models import Product, Tag, AGE_RANGE_CHOICES
+
+# Параметры фильтра каждого измерения: при подсчёте фасета его собственные параметры не применяются.
+DIMENSIONS = {
+    'tags': ('tags', 'tag_name'),
+    'age_range': ('age_range',),
+    'price': ('price_min', 'price_max'),
+    'rating': ('average_rating',),
+    'has_old_price': ('has_old_price',),
+    'new': ('new',),
+}
+FILTER_PARAMS = tuple(param for params in DIMENSIONS.values() for param in params) + ('search',)
+RATING_BANDS = (4, 3, 2, 1)
+
+
+def normalize_params(query_params):
+    """Оставляет только параметры фильтра в каноническом виде: порядок и пустые значения не влияют на ключ кэша."""
+    params = QueryDict(mutable=True)
+    for name in FILTER_PARAMS:
+        values = query_params.getlist(name)
+        if name == 'tags':
+            values = [part for value in values for part in value.split(',')]
+        values = {value.strip() for value in values}
+        if name in ('has_old_price', 'new'):
+            values = {value.lower() for value in values}
+        values.discard('')
+        if values:
+            params.setlist(name, sorted(values))
+    return params
+
+
+def cache_key(params, language):
+    digest = hashlib.sha1(f'{params.urlencode()}|{language}'.encode()).hexdigest()
+    return f'products:facets:{digest}'
+
+
+def without(params, dimension):
+    params = params.copy()
+    for name in DIMENSIONS[dimension]:
+        params.pop(name, None)
+    return params
+
+
+def _price_buckets():
+    bounds = settings.PRODUCT_FACET_PRICE_BUCKETS
+    return [(low, bounds[i + 1] if i + 1 < len(bounds) else None) for i, low in enumerate(bounds)]
+
+
+def _price_q(low, high):
+    q = Q(price__gte=low)
+    return q & Q(price__lt=high) if high is not None else q
+
+
+def _scalar_aggregates(dimension):
+    """Условные COUNT для измерения: все такие фасеты одной базы считаются одним запросом."""
+    if dimension == 'age_range':
+        return {f'age_range:{value}': Count('id', filter=Q(age_range=value)) for value, _ in AGE_RANGE_CHOICES}
+    if dimension == 'price':
+        return {
+            f'price:{low}': Count('id', filter=_price_q(low, high)) for low, high in _price_buckets()
+        }
+    if dimension == 'rating':
+        return {f'rating:{band}': Count('id', filter=Q(average_rating__gte=band)) for band in RATING_BANDS}
+    if dimension == 'has_old_price':
+        return {
+            'has_old_price:true': Count('id', filter=Q(old_price__isnull=False)),
+            'has_old_price:false': Count('id', filter=Q(old_price__isnull=True)),
+        }
+    if dimension == 'new':
+        return {
+            'new:true': Count('id', filter=Q(new=True)),
+            'new:false': Count('id', filter=Q(new=False)),
+        }
+    return {}
+
+
+def compute_facets(filter_products, params, language=None):
+    """Считает фасеты каталога.
+
+    filter_products(params) возвращает queryset продуктов, отфильтрованный по params так же,
+    как список продуктов. Измерения, для которых набор параметров без собственного измерения
+    совпадает, делят один агрегирующий запрос; теги считаются отдельным GROUP BY.
+    """
+    bases = {params.urlencode(): params}
+    groups = {params.urlencode(): {'total': Count('id')}}
+    for dimension in DIMENSIONS:
+        if dimension == 'tags':
+            continue
+        base = without(params, dimension)
+        bases[base.urlencode()] = base
+        groups.setdefault(base.urlencode(), {}).update(_scalar_aggregates(dimension))
+
+    counts = {}
+    for key, aggregates in groups.items():
+        products = Product.objects.filter(id__in=filter_products(bases[key]).values('id'))
+        counts.update(products.aggregate(**aggregates))
+
+    tag_products = filter_products(without(params, 'tags')).values('id')
+    tags = (
+        Tag.objects.filter(products__in=tag_products)
+        .annotate(count=Count('products'))
+        .values('id', 'name_uz', 'name_ru', 'name_en', 'count')
+        .order_by('-count', 'id')
+    )
+
+    return {
+        'total': counts['total'],
+        'tags': [localize(dict(tag), ('name',), language) for tag in tags],
+        'age_range': [
+            {'value': value, 'label': label, 'count': counts[f'age_range:{value}']}
+            for value, label in AGE_RANGE_CHOICES
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': counts[f'price:{low}']} for low, high in _price_buckets()
+        ],
+        'rating': [{'min': band, 'count': counts[f'rating:{band}']} for band in RATING_BANDS],
+        'has_old_price': {'true': counts['has_old_price:true'], 'false': counts['has_old_price:false']},
+        'new': {'true': counts['new:true'], 'false': counts['new:false']},
+    }
+
+
+def get_facets(filter_products, query_params, language=None):
+    params = normalize_params(query_params)
+    key = cache_key(params, language)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filter_products, params, language)
+        cache.set(key, facets, settings.PRODUCT_FACETS_CACHE_TTL)
+    return facets
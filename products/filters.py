@@ -2,52 +2,15 @@ from rest_framework.filters import SearchFilter
 from django.db.models import Q
 from django_filters import rest_framework as filters
 from .models import Product, Tag, AGE_RANGE_CHOICES
+from .search import get_search_backend
 
 
 class CustomSearchFilter(SearchFilter):
     def filter_queryset(self, request, queryset, view):
-        search_terms = request.query_params.get(self.search_param, None)
+        search_terms = request.query_params.get(self.search_param, '').strip()
         if not search_terms:
             return queryset
-
-        q_objects = Q()
-        text_fields = [
-            'title',
-            'description_uz',
-            'description_ru',
-            'description_en',
-            'instruction_uz',
-            'instruction_ru',
-            'instruction_en',
-        ]
-        for field in text_fields:
-            q_objects |= Q(**{f'{field}__icontains': search_terms})
-
-        json_fields = [
-            'illness_uz',
-            'illness_ru',
-            'illness_en',
-            'composition_uz',
-            'composition_ru',
-            'composition_en',
-        ]
-
-        filtered_ids = set()
-        for obj in queryset:
-            include = False
-            for field in json_fields:
-                json_data = getattr(obj, field) or []
-                if isinstance(json_data, list):
-                    text = ' '.join(str(item) for item in json_data)
-                    if search_terms.lower() in text.lower():
-                        include = True
-                elif isinstance(json_data, str):
-                    if search_terms.lower() in json_data.lower():
-                        include = True
-            if include:
-                filtered_ids.add(obj.id)
-
-        return queryset.filter(q_objects | Q(id__in=filtered_ids))
+        return get_search_backend(queryset.db).filter(queryset, search_terms)
 
 
 class ProductFilter(filters.FilterSet):
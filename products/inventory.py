@@ -0,0 +1,202 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Max, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+
+from notifications.outbox import enqueue_telegram
+from .models import InventoryMovement, InventoryReconciliation, Product
+
+
+class InsufficientStock(serializers.ValidationError):
+    """Не хватает товара; shortages — список (product_id, доступно, запрошено) по всем позициям сразу."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__([
+            f"Недостаточно товара для продукта ID {product_id}: доступно {available}, запрошено {requested}."
+            for product_id, available, requested in shortages
+        ])
+
+
+def merge_quantities(items):
+    """[(product_id, quantity), ...] -> {product_id: общее количество}."""
+    quantities = Counter()
+    for product_id, quantity in items:
+        quantities[product_id] += quantity
+    return dict(quantities)
+
+
+def _shortages(quantities, available):
+    return [
+        (product_id, available.get(product_id, 0), quantity)
+        for product_id, quantity in sorted(quantities.items())
+        if available.get(product_id, 0) < quantity
+    ]
+
+
+def apply_movements(movements, reason, user=None):
+    """Проводит движения [(product_id, delta, reference), ...] по складу и возвращает продукты {id: Product}.
+
+    Вызывать внутри transaction.atomic(). Строки продуктов блокируются в порядке id, чтобы параллельные
+    заказы с пересекающимися товарами не взаимоблокировались. Остатки меняются одним UPDATE с условием
+    total >= списания для каждой строки; если обновилось меньше строк, значит остаток успели забрать, и
+    выбрасывается InsufficientStock. Записи журнала создаются одним bulk_create, а переход остатка
+    через порог уходит уведомлением в outbox.
+    """
+    movements = [movement for movement in movements if movement[1]]
+    deltas = Counter()
+    for product_id, delta, reference in movements:
+        deltas[product_id] += delta
+    ids = sorted(deltas)
+    products = {
+        product.pk: product
+        for product in Product.objects.select_for_update().filter(id__in=ids).order_by('id').only(
+            'id', 'title', 'price', 'total', 'low_stock_threshold'
+        )
+    }
+    requested = {product_id: -delta for product_id, delta in deltas.items() if delta < 0}
+    shortages = _shortages(requested, {pk: product.total for pk, product in products.items()})
+    if shortages:
+        raise InsufficientStock(shortages)
+    missing = set(ids) - set(products)
+    if missing:
+        raise serializers.ValidationError(f"Продукты с ID {sorted(missing)} не существуют.")
+    if not ids:
+        return products
+
+    enough = Q()
+    for product_id in ids:
+        enough |= Q(id=product_id, total__gte=requested.get(product_id, 0))
+    updated = Product.objects.filter(enough).update(
+        total=Case(*[When(id=product_id, then=F('total') + deltas[product_id]) for product_id in ids])
+    )
+    if updated != len(ids):
+        available = dict(Product.objects.filter(id__in=ids).values_list('id', 'total'))
+        raise InsufficientStock(_shortages(requested, available) or [
+            (product_id, available.get(product_id, 0), quantity) for product_id, quantity in sorted(requested.items())
+        ])
+
+    balances = {product_id: products[product_id].total for product_id in ids}
+    entries = []
+    for product_id, delta, reference in movements:
+        balances[product_id] += delta
+        entries.append(InventoryMovement(
+            product_id=product_id, delta=delta, balance_after=balances[product_id], reason=reason,
+            reference=reference, created_by=user,
+        ))
+    InventoryMovement.objects.bulk_create(entries)
+
+    low = []
+    for product_id in ids:
+        product = products[product_id]
+        threshold = product.low_stock_threshold
+        if threshold is None:
+            threshold = settings.LOW_STOCK_THRESHOLD
+        if balances[product_id] < threshold <= product.total:
+            low.append(product)
+        product.total = balances[product_id]
+    if low:
+        enqueue_telegram("<b>⚠️ Заканчивается товар</b>\n\n" + "\n".join(
+            f"- {product.title} (ID: {product.id}): осталось {product.total}" for product in low
+        ))
+    return products
+
+
+def reserve_stock(quantities, reference=''):
+    """Списывает остатки {product_id: quantity} как продажу и возвращает заблокированные продукты {id: Product}."""
+    return apply_movements(
+        [(product_id, -quantity, reference) for product_id, quantity in sorted(quantities.items())],
+        InventoryMovement.SALE,
+    )
+
+
+def lock_stock(product_id):
+    """Блокирует строку продукта и возвращает текущий остаток (вызывать внутри transaction.atomic())."""
+    return Product.objects.select_for_update().filter(pk=product_id).values_list('total', flat=True).get()
+
+
+def adjust_stock(product_id, delta, user=None, reference=''):
+    """Корректирует остаток на delta записью в журнале и возвращает новый остаток под блокировкой строки.
+
+    Вызывать внутри transaction.atomic(). Изменение задаётся разницей, а не абсолютным total: продажи,
+    прошедшие с момента, когда остаток показали пользователю, не перезаписываются.
+    """
+    if not delta:
+        return lock_stock(product_id)
+    return apply_movements([(product_id, delta, reference)], InventoryMovement.ADJUSTMENT, user)[product_id].total
+
+
+def record_opening_balance(product, reason=InventoryMovement.IMPORT, user=None):
+    """Журнальная запись для остатка, заданного при создании продукта (total уже сохранён)."""
+    if product.total:
+        InventoryMovement.objects.create(
+            product=product, delta=product.total, balance_after=product.total, reason=reason, created_by=user
+        )
+
+
+def fix_total(product_id):
+    """Выставляет total по последнему балансу журнала и возвращает его.
+
+    Баланс читается после блокировки строки: продажа, зафиксированная после сверки, уже в журнале,
+    а новые ждут блокировку, так что остаток не откатывается к снимку сверки.
+    """
+    with transaction.atomic():
+        total = lock_stock(product_id)
+        ledger = InventoryMovement.objects.filter(product_id=product_id).order_by('-id').values_list(
+            'balance_after', flat=True
+        ).first() or 0
+        if total != ledger:
+            Product.objects.filter(id=product_id).update(total=ledger)
+    return ledger
+
+
+def reconcile(full=False, fix=False, chunk_size=1000):
+    """Сверяет Product.total с журналом и возвращает InventoryReconciliation.
+
+    По умолчанию проверяются только продукты с новыми записями журнала (после прошлой сверки),
+    и для каждого — непрерывность баланса: баланс до окна + сумма движений окна = баланс в конце окна,
+    а также совпадение total с последним балансом. Записи моложе INVENTORY_RECONCILE_LAG секунд
+    откладываются до следующего запуска: их транзакции могут быть ещё не зафиксированы.
+    full=True проверяет total всех продуктов; fix=True выставляет total по последнему балансу журнала,
+    перечитанному под блокировкой строки (см. fix_total).
+    Разрыв цепочки (chain_ok=False) значит, что total меняли в обход журнала; он только сообщается.
+    """
+    previous = InventoryReconciliation.objects.order_by('-id').first()
+    start = previous.last_movement_id if previous and not full else 0
+    cutoff = timezone.now() - timedelta(seconds=settings.INVENTORY_RECONCILE_LAG)
+    end = InventoryMovement.objects.filter(id__gt=start, created_at__lte=cutoff).aggregate(
+        end=Max('id')
+    )['end'] or start
+
+    def balance(upto=None):
+        movements = InventoryMovement.objects.filter(product=OuterRef('pk'))
+        if upto is not None:
+            movements = movements.filter(id__lte=upto)
+        return Coalesce(Subquery(movements.order_by('-id').values('balance_after')[:1]), 0)
+
+    window = InventoryMovement.objects.filter(id__gt=start, id__lte=end)
+    window_deltas = dict(window.order_by().values('product_id').annotate(delta=Sum('delta')).values_list('product_id', 'delta'))
+    product_ids = list(Product.objects.values_list('id', flat=True)) if full else sorted(window_deltas)
+
+    mismatches = []
+    for offset in range(0, len(product_ids), chunk_size):
+        rows = Product.objects.filter(id__in=product_ids[offset:offset + chunk_size]).annotate(
+            before=balance(start), at_end=balance(end), ledger=balance()
+        ).values_list('id', 'total', 'before', 'at_end', 'ledger')
+        for product_id, total, before, at_end, ledger in rows:
+            if before + window_deltas.get(product_id, 0) != at_end or total != ledger:
+                mismatches.append({
+                    'product_id': product_id, 'total': total, 'ledger': ledger,
+                    'chain_ok': before + window_deltas.get(product_id, 0) == at_end,
+                })
+    if fix:
+        for mismatch in mismatches:
+            fix_total(mismatch['product_id'])
+    return InventoryReconciliation.objects.create(
+        last_movement_id=end, products_checked=len(product_ids), mismatches=mismatches
+    )
@@ -0,0 +1,129 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.search_index import ProductSearchIndex
+
+SYLLABLES = [
+    'pa', 'ra', 'ce', 'ta', 'mol', 'ibu', 'pro', 'fen', 'ami', 'no', 'xi', 'cil', 'lin', 'dor',
+    'va', 'nal', 'gin', 'zol', 'me', 'tro', 'ni', 'da', 'fo', 'sal', 'bu', 'ter', 'lo', 'ri',
+    'dex', 'su', 'vit', 'ko', 'fer', 'man', 'tin', 'ral', 'bin', 'sol', 'gel', 'cor',
+]
+FORMS = ['forte', 'retard', 'plus', 'max', 'neo', 'rapid', 'junior', 'duo']
+ILLNESSES = [
+    ('bosh ogrigi', 'головная боль', 'headache'),
+    ('isitma', 'температура', 'fever'),
+    ('yotal', 'кашель', 'cough'),
+    ('tish ogrigi', 'зубная боль', 'toothache'),
+    ('allergiya', 'аллергия', 'allergy'),
+    ('gripp', 'грипп', 'influenza'),
+    ('yallig`lanish', 'воспаление', 'inflammation'),
+    ('uyqusizlik', 'бессонница', 'insomnia'),
+]
+WORDS = [
+    'tabletka', 'kapsula', 'sirop', 'kuniga', 'marta', 'ovqatdan', 'keyin', 'oldin', 'suv', 'bilan',
+    'таблетка', 'принимать', 'раз', 'день', 'после', 'еды', 'запивая', 'водой', 'курс', 'лечения',
+    'tablet', 'take', 'daily', 'after', 'meals', 'with', 'water', 'course', 'treatment', 'doctor',
+]
+LATIN_TO_CYRILLIC = [
+    ('sh', 'ш'), ('ch', 'ч'), ('ts', 'ц'), ('yo', 'ё'), ('yu', 'ю'), ('ya', 'я'),
+    ('a', 'а'), ('b', 'б'), ('v', 'в'), ('g', 'г'), ('d', 'д'), ('e', 'е'), ('j', 'ж'),
+    ('z', 'з'), ('i', 'и'), ('y', 'й'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'),
+    ('o', 'о'), ('p', 'п'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('f', 'ф'),
+    ('x', 'х'), ('h', 'ҳ'), ('q', 'қ'), ('c', 'ц'),
+]
+
+
+def to_cyrillic(text):
+    result = []
+    i = 0
+    while i < len(text):
+        for latin, cyrillic in LATIN_TO_CYRILLIC:
+            if text.startswith(latin, i):
+                result.append(cyrillic)
+                i += len(latin)
+                break
+        else:
+            result.append(text[i])
+            i += 1
+    return ''.join(result)
+
+
+def with_typo(rng, word):
+    position = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(['substitute', 'delete', 'transpose'])
+    if kind == 'substitute':
+        return word[:position] + rng.choice('aeiou') + word[position + 1:]
+    if kind == 'delete':
+        return word[:position] + word[position + 1:]
+    return word[:position - 1] + word[position] + word[position - 1] + word[position + 1:]
+
+
+def synthetic_catalog(rng, size):
+    names = set()
+    while len(names) < size:
+        names.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 4))))
+    for product_id, name in enumerate(sorted(names), start=1):
+        illnesses = rng.sample(ILLNESSES, 2)
+        yield {
+            'id': product_id,
+            'title': f"{name.capitalize()} {rng.choice(FORMS).capitalize()}",
+            'description_uz': ' '.join(rng.choices(WORDS[:10], k=8)),
+            'description_ru': ' '.join(rng.choices(WORDS[10:20], k=8)),
+            'description_en': ' '.join(rng.choices(WORDS[20:], k=8)),
+            'instruction_uz': ' '.join(rng.choices(WORDS[:10], k=6)),
+            'instruction_ru': ' '.join(rng.choices(WORDS[10:20], k=6)),
+            'instruction_en': ' '.join(rng.choices(WORDS[20:], k=6)),
+            'illness_uz': [illness[0] for illness in illnesses],
+            'illness_ru': [illness[1] for illness in illnesses],
+            'illness_en': [illness[2] for illness in illnesses],
+            'composition_uz': [f"{name}-500mg"],
+            'composition_ru': [f"{to_cyrillic(name)}-500мг"],
+            'composition_en': [f"{name}-500mg"],
+        }
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк ранжированного поиска на синтетическом каталоге (по умолчанию 100 000 продуктов)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rows = list(synthetic_catalog(rng, options['products']))
+
+        started = time.perf_counter()
+        index = ProductSearchIndex.build(rows)
+        self.stdout.write(f"Индекс на {len(index)} продуктов построен за {time.perf_counter() - started:.2f} с")
+
+        targets = rng.sample(rows, min(options['queries'], len(rows)))
+        variants = {
+            'latin': lambda name: name,
+            'cyrillic': to_cyrillic,
+            'typo': lambda name: with_typo(rng, name),
+        }
+        for label, make_query in variants.items():
+            timings = []
+            hits = 0
+            for row in targets:
+                query = make_query(row['title'].split()[0].lower())
+                started = time.perf_counter()
+                results = index.search(query, limit=options['limit'])
+                timings.append((time.perf_counter() - started) * 1000)
+                hits += any(product_id == row['id'] for product_id, _ in results)
+            self.stdout.write(
+                f"{label:>9}: p50={statistics.median(timings):.2f} мс "
+                f"p95={percentile(timings, 0.95):.2f} мс p99={percentile(timings, 0.99):.2f} мс "
+                f"recall@{options['limit']}={hits / len(targets):.3f}"
+            )
@@ -0,0 +1,34 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from products.inventory import apply_movements
+from products.models import InventoryMovement
+
+
+class Command(BaseCommand):
+    help = "Проводит поступление товара из CSV со столбцами product_id,quantity одной транзакцией."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--reference', default='', help="Ссылка на документ поступления, например номер накладной")
+
+    def handle(self, *args, **options):
+        with open(options['path'], encoding='utf-8', newline='') as source:
+            try:
+                movements = [
+                    (int(row['product_id']), int(row['quantity']), options['reference'])
+                    for row in csv.DictReader(source)
+                ]
+            except (KeyError, ValueError) as e:
+                raise CommandError(f"Неверный формат файла: {e}")
+        if any(quantity <= 0 for _, quantity, _ in movements):
+            raise CommandError("Количество должно быть больше 0.")
+        try:
+            with transaction.atomic():
+                apply_movements(movements, InventoryMovement.IMPORT)
+        except ValidationError as e:
+            raise CommandError(e.detail)
+        self.stdout.write(self.style.SUCCESS(f"Проведено строк: {len(movements)}."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from products.models import Product
+from products.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает average_rating и rating_count всех продуктов по комментариям (исправляет расхождения)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Сколько продуктов обновлять одним запросом")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = Product.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        updated = 0
+        for start in range(0, last_id, chunk_size):
+            updated += recompute_ratings(Product.objects.filter(id__gt=start, id__lte=start + chunk_size))
+        self.stdout.write(self.style.SUCCESS(f"Рейтинги пересчитаны для {updated} продуктов."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from products.inventory import reconcile
+
+
+class Command(BaseCommand):
+    help = ("Сверяет остатки продуктов со складским журналом. По умолчанию проверяет только записи журнала, "
+            "появившиеся после прошлой сверки; запускать по расписанию.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Проверить все продукты, а не только изменённые")
+        parser.add_argument('--fix', action='store_true', help="Выставить остаток по журналу при расхождении")
+
+    def handle(self, *args, **options):
+        result = reconcile(full=options['full'], fix=options['fix'])
+        for mismatch in result.mismatches:
+            self.stdout.write(self.style.WARNING(
+                f"Продукт {mismatch['product_id']}: остаток {mismatch['total']}, по журналу {mismatch['ledger']}"
+                + ("" if mismatch['chain_ok'] else ", журнал непоследователен")
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Проверено продуктов: {result.products_checked}, расхождений: {len(result.mismatches)}, "
+            f"журнал проверен до #{result.last_movement_id}."
+        ))
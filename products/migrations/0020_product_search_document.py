@@ -0,0 +1,94 @@
+# Generated by Django 5.1.7 on 2026-10-17 07:19
+
+from django.db import migrations, models, OperationalError
+
+# Копия полей и сборки документа из products/search.py на момент миграции:
+# миграция не должна зависеть от текущего кода приложения.
+SEARCH_TEXT_FIELDS = [
+    'title',
+    'description_uz',
+    'description_ru',
+    'description_en',
+    'instruction_uz',
+    'instruction_ru',
+    'instruction_en',
+]
+
+SEARCH_JSON_FIELDS = [
+    'illness_uz',
+    'illness_ru',
+    'illness_en',
+    'composition_uz',
+    'composition_ru',
+    'composition_en',
+]
+
+
+def build_search_document(product):
+    parts = [getattr(product, field) or '' for field in SEARCH_TEXT_FIELDS]
+    for field in SEARCH_JSON_FIELDS:
+        json_data = getattr(product, field) or []
+        if isinstance(json_data, list):
+            parts.append(' '.join(str(item) for item in json_data))
+        else:
+            parts.append(str(json_data))
+    return '\n'.join(part for part in parts if part).lower()
+
+
+def fill_search_document(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    batch = []
+    for product in Product.objects.only('id', *SEARCH_TEXT_FIELDS, *SEARCH_JSON_FIELDS).iterator(chunk_size=500):
+        product.search_document = build_search_document(product)
+        batch.append(product)
+        if len(batch) >= 500:
+            Product.objects.bulk_update(batch, ['search_document'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['search_document'])
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE products_product_fts USING fts5(document, tokenize='trigram')"
+            )
+        except OperationalError:
+            # SQLite без FTS5/trigram (< 3.34): поиск останется на LIKE по search_document.
+            return
+        schema_editor.execute(
+            "INSERT INTO products_product_fts (rowid, document) SELECT id, search_document FROM products_product"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS products_product_search_trgm '
+            'ON products_product USING gin (search_document gin_trgm_ops)'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS products_product_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS products_product_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_category_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_document, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
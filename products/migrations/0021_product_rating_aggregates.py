@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-17 07:26
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Comment = apps.get_model('products', 'Comment')
+    stats = Comment.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        average_rating=Subquery(stats.annotate(value=Avg('rating')).values('value')[:1]),
+        rating_count=Coalesce(Subquery(stats.annotate(value=Count('id')).values('value')[:1]), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_product_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-17 07:40
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    children = defaultdict(list)
+    for category in Category.objects.only('id', 'parent_id'):
+        children[category.parent_id].append(category)
+
+    updated = []
+    stack = [(category, '', 0) for category in children[None]]
+    while stack:
+        category, parent_path, depth = stack.pop()
+        category.path = f'{parent_path}{category.pk}/'
+        category.depth = depth
+        updated.append(category)
+        stack.extend((child, category.path, depth + 1) for child in children[category.pk])
+    Category.objects.bulk_update(updated, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_comment_products_co_product_199940_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.7 on 2026-10-17 08:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    # Журнал начинается с текущих остатков: одна запись «поступление» на каждый продукт в наличии.
+    Product = apps.get_model('products', 'Product')
+    InventoryMovement = apps.get_model('products', 'InventoryMovement')
+    InventoryMovement.objects.bulk_create(
+        (
+            InventoryMovement(product_id=product_id, delta=total, balance_after=total, reason='import',
+                              reference='opening balance')
+            for product_id, total in Product.objects.filter(total__gt=0).values_list('id', 'total').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_category_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_movement_id', models.BigIntegerField()),
+                ('products_checked', models.PositiveIntegerField(default=0)),
+                ('mismatches', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('balance_after', models.PositiveIntegerField()),
+                ('reason', models.CharField(choices=[('sale', 'Продажа'), ('restock', 'Возврат при отмене заказа'), ('adjustment', 'Корректировка'), ('import', 'Поступление')], max_length=20)),
+                ('reference', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_movements', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'id'], name='products_in_product_5ca663_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
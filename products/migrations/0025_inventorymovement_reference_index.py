@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-17 09:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0024_inventory_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['reference', 'product'], name='products_in_referen_a65c9b_idx'),
+        ),
+    ]
@@ -1,6 +1,11 @@
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
+from .search import build_search_document, SEARCH_SOURCE_FIELDS
 AGE_RANGE_CHOICES = [
     ('0-2', '0-2 years (Infants)'),
     ('3-7', '3-7 years (Young Children)'),
@@ -24,10 +29,56 @@ class Category(models.Model):
     name_ru = models.CharField(max_length=100)
     name_en = models.CharField(max_length=100)
     image = models.ImageField(upload_to='categories', blank=True, null=True)
+    # Материализованный путь: id предков и самой категории, каждый с '/' на конце ("1/5/12/").
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name_en
 
+    def is_descendant_of(self, category):
+        return bool(category.path) and self.path.startswith(category.path)
+
+    def subtree_q(self, prefix=''):
+        """Q для категории и всех её потомков — диапазон по индексу path.
+
+        '/' идёт перед цифрами, поэтому все пути с префиксом "1/5/" лежат в ["1/5/", "1/50").
+        """
+        return Q(**{f'{prefix}path__gte': self.path, f'{prefix}path__lt': self.path[:-1] + '0'})
+
+    def clean(self):
+        super().clean()
+        if self.parent_id and self.pk and (self.parent_id == self.pk or self.parent.is_descendant_of(self)):
+            raise ValidationError({'parent': "Категория не может быть вложена в себя или в свою подкатегорию."})
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._update_path()
+
+    def _update_path(self):
+        parent = None
+        if self.parent_id:
+            parent = Category.objects.filter(pk=self.parent_id).values('path', 'depth').get()
+        path = f"{parent['path'] if parent else ''}{self.pk}/"
+        depth = parent['depth'] + 1 if parent else 0
+        old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).get()
+        if old_path == path:
+            self.path, self.depth = path, depth
+            return
+        if old_path and path.startswith(old_path):
+            raise ValueError("Категория не может быть вложена в свою подкатегорию.")
+
+        Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        if old_path:
+            old_depth = old_path.count('/') - 1
+            # Перенос поддерева: префикс пути и глубина меняются у всех потомков одним UPDATE.
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (depth - old_depth),
+            )
+        self.path, self.depth = path, depth
+
 
 class Product(models.Model):
     title = models.CharField(max_length=100)
@@ -47,7 +98,10 @@ class Product(models.Model):
     old_price = models.PositiveIntegerField(blank=True,  null=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     links = models.JSONField(default=list, blank=True, null=True)
+    # Кэш баланса по журналу InventoryMovement; менять только через products.inventory.apply_movements.
     total = models.PositiveIntegerField()
+    # Порог уведомления о заканчивающемся товаре; пусто — settings.LOW_STOCK_THRESHOLD.
+    low_stock_threshold = models.PositiveIntegerField(null=True, blank=True)
     new = models.BooleanField(null=True, blank=True)
     tags = models.ManyToManyField(Tag, related_name='products', blank=True)
     age_range = models.CharField(
@@ -55,6 +109,43 @@ class Product(models.Model):
         choices=AGE_RANGE_CHOICES,
         default='18+',
     )
+    search_document = models.TextField(blank=True, default='', editable=False)
+    average_rating = models.FloatField(null=True, blank=True, db_index=True, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price', 'id']),
+        ]
+
+    # Агрегаты рейтинга меняются только F-выражениями из products.ratings.
+    RATING_FIELDS = ('average_rating', 'rating_count')
+
+    def save(self, *args, **kwargs):
+        self.search_document = build_search_document(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and SEARCH_SOURCE_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'search_document'}
+        elif update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # Обычное сохранение не пишет загруженные (возможно, устаревшие) значения рейтинга
+            # поверх обновлений от комментариев; после сохранения они перечитываются.
+            skipped = {*self.RATING_FIELDS, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped and field.attname not in skipped
+            ]
+            super().save(*args, **kwargs)
+            self.refresh_from_db(fields=self.RATING_FIELDS)
+            return
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Цена в момент загрузки: по ней card.signals пересчитывает корзины только при её изменении.
+        instance._loaded_price = dict(zip(field_names, values)).get('price')
+        return instance
+
     def __str__(self):
         return self.title
 
@@ -72,10 +163,69 @@ class Comment(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        # Оценка в момент загрузки: по ней сигналы поправляют рейтинг продукта при изменении.
+        instance._loaded_rating = (loaded.get('product_id'), loaded.get('rating'))
+        return instance
+
     def __str__(self):
         return f"Comment for {self.product.title} ({self.rating})"
 
 
+class InventoryMovement(models.Model):
+    """Запись складского журнала: изменение остатка продукта и баланс после него. Только добавляется."""
+    SALE = 'sale'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    IMPORT = 'import'
+    REASON_CHOICES = [
+        (SALE, 'Продажа'),
+        (RESTOCK, 'Возврат при отмене заказа'),
+        (ADJUSTMENT, 'Корректировка'),
+        (IMPORT, 'Поступление'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_movements')
+    delta = models.IntegerField()
+    balance_after = models.PositiveIntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    # Источник изменения, например "order:15".
+    reference = models.CharField(max_length=64, blank=True, default='')
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'id']),
+            # Движения по заказу (reference="order:15") при возврате на склад.
+            models.Index(fields=['reference', 'product']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.delta:+d} ({self.reason})"
+
+
+class InventoryReconciliation(models.Model):
+    """Результат сверки остатков с журналом; last_movement_id — до какой записи журнал уже проверен."""
+    last_movement_id = models.BigIntegerField()
+    products_checked = models.PositiveIntegerField(default=0)
+    mismatches = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Сверка до #{self.last_movement_id} ({len(self.mismatches)} расхождений)"
+
+
 class FAQ(models.Model):
     question_uz = models.TextField()
     question_ru = models.TextField()
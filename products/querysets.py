@@ -0,0 +1,38 @@
+from django.db.models import Prefetch
+
+from .category_tree import get_category_tree
+
+# Связи, которые разворачивает ProductSerializers.
+PRODUCT_RELATIONS = ('comments', 'category', 'tags')
+
+
+def product_prefetches(prefix='', relations=PRODUCT_RELATIONS):
+    """Prefetch-объекты для продукта, доступного по пути prefix (например, 'product__')."""
+    from .models import Comment
+
+    prefetches = []
+    if 'comments' in relations:
+        prefetches.append(Prefetch(f'{prefix}comments', queryset=Comment.objects.select_related('user')))
+    if 'tags' in relations:
+        prefetches.append(f'{prefix}tags')
+    return prefetches
+
+
+def plan_products(queryset, relations=PRODUCT_RELATIONS):
+    """Готовит queryset продуктов к сериализации: число запросов не зависит от числа продуктов.
+
+    Подкатегории берутся из закэшированного дерева, см. category_children.
+    """
+    if 'category' in relations:
+        queryset = queryset.select_related('category')
+    return queryset.prefetch_related(*product_prefetches(relations=relations))
+
+
+def plan_product_items(model):
+    """Queryset позиций (CartItem, OrderItem) с продуктом, подготовленным для ProductSerializers."""
+    return model.objects.select_related('product__category').prefetch_related(*product_prefetches('product__'))
+
+
+def category_children(category):
+    """Дочерние категории из дерева категорий процесса, без запросов к базе."""
+    return get_category_tree().children(category.pk)
@@ -0,0 +1,40 @@
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+
+def add_rating(product_id, rating):
+    from .models import Product
+    Product.objects.filter(pk=product_id).update(
+        average_rating=(
+            Coalesce(F('average_rating'), Value(0.0)) * F('rating_count') + Value(float(rating))
+        ) / (F('rating_count') + 1),
+        rating_count=F('rating_count') + 1,
+    )
+
+
+def remove_rating(product_id, rating):
+    from .models import Product
+    Product.objects.filter(pk=product_id).update(
+        average_rating=Case(
+            When(rating_count__lte=1, then=Value(None, output_field=FloatField())),
+            default=(F('average_rating') * F('rating_count') - Value(float(rating))) / (F('rating_count') - 1),
+        ),
+        rating_count=Case(When(rating_count__lte=1, then=Value(0)), default=F('rating_count') - 1),
+    )
+
+
+def change_rating(product_id, old_rating, new_rating):
+    from .models import Product
+    Product.objects.filter(pk=product_id, rating_count__gt=0).update(
+        average_rating=F('average_rating') + Value(float(new_rating) - float(old_rating)) / F('rating_count'),
+    )
+
+
+def recompute_ratings(queryset):
+    """Пересчитывает average_rating и rating_count по комментариям одним UPDATE на queryset."""
+    from .models import Comment
+    stats = Comment.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    return queryset.update(
+        average_rating=Subquery(stats.annotate(value=Avg('rating')).values('value')[:1]),
+        rating_count=Coalesce(Subquery(stats.annotate(value=Count('id')).values('value')[:1]), 0),
+    )
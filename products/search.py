@@ -0,0 +1,99 @@
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+SEARCH_TEXT_FIELDS = [
+    'title',
+    'description_uz',
+    'description_ru',
+    'description_en',
+    'instruction_uz',
+    'instruction_ru',
+    'instruction_en',
+]
+
+SEARCH_JSON_FIELDS = [
+    'illness_uz',
+    'illness_ru',
+    'illness_en',
+    'composition_uz',
+    'composition_ru',
+    'composition_en',
+]
+
+SEARCH_SOURCE_FIELDS = frozenset(SEARCH_TEXT_FIELDS + SEARCH_JSON_FIELDS)
+
+FTS_TABLE = 'products_product_fts'
+
+
+def build_search_document(product):
+    """Собирает денормализованный документ поиска в нижнем регистре из всех текстовых полей продукта."""
+    parts = [getattr(product, field) or '' for field in SEARCH_TEXT_FIELDS]
+    for field in SEARCH_JSON_FIELDS:
+        json_data = getattr(product, field) or []
+        if isinstance(json_data, list):
+            parts.append(' '.join(str(item) for item in json_data))
+        else:
+            parts.append(str(json_data))
+    return '\n'.join(part for part in parts if part).lower()
+
+
+class SearchBackend:
+    """Поиск подстроки по колонке search_document.
+
+    На PostgreSQL колонка покрыта GIN-индексом pg_trgm (см. миграцию 0020),
+    поэтому LIKE '%...%' идёт по индексу.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def filter(self, queryset, term):
+        return queryset.filter(search_document__contains=term.lower())
+
+    def index(self, product_id, document):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """Поиск через виртуальную таблицу FTS5 с токенизатором trigram."""
+
+    # Токенизатор trigram не умеет искать подстроки короче трёх символов.
+    min_match_length = 3
+
+    def filter(self, queryset, term):
+        term = term.lower()
+        if len(term) < self.min_match_length:
+            return super().filter(queryset, term)
+        phrase = '"{}"'.format(term.replace('"', '""'))
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [phrase]
+        ))
+
+    def index(self, product_id, document):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, document) VALUES (%s, %s)', [product_id, document]
+            )
+
+    def remove(self, product_id):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+_backends = {}
+
+
+def get_search_backend(using='default'):
+    backend = _backends.get(using)
+    if backend is None:
+        connection = connections[using]
+        if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            backend = SQLiteFTSBackend(using)
+        else:
+            backend = SearchBackend(using)
+        _backends[using] = backend
+    return backend
@@ -0,0 +1,311 @@
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+# Кириллица (узбекская и русская) -> узбекская латиница.
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+}
+_TRANSLIT_TABLE = str.maketrans(CYRILLIC_TO_LATIN)
+_APOSTROPHES_RE = re.compile("[ʻʼ‘’'`]")
+_TOKEN_RE = re.compile(r'\w+')
+# Фонетические склейки, чтобы "paracetamol", "paratsetamol" и "парацетамол" давали один термин.
+_FOLDS = [
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'ts'), 's'),
+    (re.compile(r'c(?=[eiy])'), 's'),
+    (re.compile(r'c'), 'k'),
+    (re.compile(r'q'), 'k'),
+    (re.compile(r'([a-z])\1+'), r'\1'),
+]
+
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'illness': 2.0,
+    'composition': 1.5,
+    'description': 1.0,
+    'instruction': 0.5,
+}
+FIELDS = tuple(FIELD_WEIGHTS)
+INDEX_SOURCE_FIELDS = ['title'] + [
+    f'{field}_{lang}' for field in FIELDS[1:] for lang in ('uz', 'ru', 'en')
+]
+
+K1 = 1.2
+B = 0.75
+# Сколько самых похожих по триграммам терминов проверять на расстояние редактирования.
+MAX_FUZZY_CHECKS = 200
+
+
+def transliterate(text):
+    return _APOSTROPHES_RE.sub('', text.lower()).translate(_TRANSLIT_TABLE)
+
+
+def normalize(text):
+    text = transliterate(text)
+    for pattern, replacement in _FOLDS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(normalize(text)) if len(token) > 1]
+
+
+def trigrams(term):
+    padded = f'${term}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(term):
+    if len(term) < 4:
+        return 0
+    if len(term) <= 7:
+        return 1
+    return 2
+
+
+def edit_distance(a, b, limit):
+    """Расстояние Дамерау-Левенштейна (OSA) с отсечением: при превышении limit возвращает limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _field_text(row, field):
+    if field == 'title':
+        return row.get('title') or ''
+    parts = []
+    for lang in ('uz', 'ru', 'en'):
+        value = row.get(f'{field}_{lang}') or ''
+        if isinstance(value, list):
+            parts.extend(str(item) for item in value)
+        else:
+            parts.append(str(value))
+    return ' '.join(parts)
+
+
+def analyze(row):
+    """Возвращает (частоты терминов по полям, длины полей) для строки продукта."""
+    field_counts = []
+    lengths = []
+    for field in FIELDS:
+        tokens = tokenize(_field_text(row, field))
+        field_counts.append(Counter(tokens))
+        lengths.append(len(tokens))
+    return field_counts, tuple(lengths)
+
+
+class ProductSearchIndex:
+    """Инвертированный индекс продуктов в памяти процесса с ранжированием BM25F.
+
+    Запрос затрагивает только списки документов для своих терминов,
+    поэтому top-k находится без обхода всего каталога.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._length_totals = [0] * len(FIELDS)
+        self._grams = defaultdict(set)
+        self._lock = threading.RLock()
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, rows):
+        index = cls()
+        analyzed = [(row['id'], analyze(row)) for row in rows]
+        for _, (_, lengths) in analyzed:
+            for i, length in enumerate(lengths):
+                index._length_totals[i] += length
+        index._doc_lengths = {doc_id: lengths for doc_id, (_, lengths) in analyzed}
+        for doc_id, (field_counts, lengths) in analyzed:
+            index._add_postings(doc_id, field_counts, lengths)
+        return index
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def is_stale(self, ttl):
+        return bool(ttl) and time.monotonic() - self.built_at > ttl
+
+    def _average_lengths(self):
+        count = max(len(self._doc_lengths), 1)
+        return [max(total / count, 1.0) for total in self._length_totals]
+
+    def _add_postings(self, doc_id, field_counts, lengths):
+        averages = self._average_lengths()
+        weighted = defaultdict(float)
+        for i, counts in enumerate(field_counts):
+            norm = 1 - B + B * lengths[i] / averages[i]
+            weight = FIELD_WEIGHTS[FIELDS[i]]
+            for term, tf in counts.items():
+                weighted[term] += weight * tf / norm
+        for term, tf in weighted.items():
+            postings = self._postings[term]
+            if not postings:
+                for gram in trigrams(term):
+                    self._grams[gram].add(term)
+            postings[doc_id] = tf
+        self._doc_terms[doc_id] = tuple(weighted)
+
+    def add(self, row):
+        with self._lock:
+            self._remove(row['id'])
+            field_counts, lengths = analyze(row)
+            self._doc_lengths[row['id']] = lengths
+            for i, length in enumerate(lengths):
+                self._length_totals[i] += length
+            self._add_postings(row['id'], field_counts, lengths)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for i, length in enumerate(self._doc_lengths.pop(doc_id)):
+            self._length_totals[i] -= length
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                for gram in trigrams(term):
+                    self._grams[gram].discard(term)
+
+    def _candidates(self, term):
+        """Термины словаря для термина запроса с коэффициентом штрафа за опечатку."""
+        if term in self._postings:
+            return [(term, 1.0)]
+        limit = max_edits(term)
+        if not limit:
+            return []
+        grams = trigrams(term)
+        # Каждая правка разрушает не больше трёх триграмм.
+        required = len(grams) - 3 * limit
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, ()))
+        candidates = []
+        for candidate, count in shared.most_common(MAX_FUZZY_CHECKS):
+            if count < required:
+                break
+            if abs(len(candidate) - len(term)) > limit:
+                continue
+            distance = edit_distance(term, candidate, limit)
+            if distance <= limit:
+                candidates.append((distance, candidate))
+        candidates.sort()
+        return [(candidate, 1.0 / (1 + distance)) for distance, candidate in candidates[:10]]
+
+    def search(self, query, limit=20):
+        """Возвращает список (product_id, score) по убыванию релевантности."""
+        with self._lock:
+            total = len(self._doc_terms)
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                for candidate, penalty in self._candidates(term):
+                    postings = self._postings[candidate]
+                    df = len(postings)
+                    idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                    for doc_id, tf in postings.items():
+                        scores[doc_id] += penalty * idf * tf / (K1 + tf)
+            return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+class IndexHolder:
+    """Индекс процесса, который перестраивается по TTL без остановки чтения.
+
+    Первое построение ждут все запросы. Устаревший индекс перестраивает один запрос вне общей
+    блокировки, остальные до замены читают прежний. Изменения, пришедшие во время перестройки,
+    применяются к обоим индексам, чтобы новый не потерял их.
+    """
+
+    def __init__(self, build, ttl_setting):
+        self.build = build
+        self.ttl_setting = ttl_setting
+        self.index = None
+        self.pending = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def is_fresh(self, index):
+        return index is not None and not index.is_stale(getattr(settings, self.ttl_setting))
+
+    def get(self):
+        index = self.index
+        if self.is_fresh(index):
+            return index
+        if not self._build_lock.acquire(blocking=index is None):
+            return index
+        try:
+            index = self.index
+            if self.is_fresh(index):
+                return index
+            with self._lock:
+                self.pending = []
+            try:
+                fresh = self.build()
+                with self._lock:
+                    for change in self.pending:
+                        change(fresh)
+                    self.index = fresh
+            finally:
+                with self._lock:
+                    self.pending = None
+            return fresh
+        finally:
+            self._build_lock.release()
+
+    def apply(self, change):
+        """Применяет change(index) к построенному индексу; без индекса изменение не нужно."""
+        with self._lock:
+            if self.pending is not None:
+                self.pending.append(change)
+            index = self.index
+        if index is not None:
+            change(index)
+
+    def invalidate(self):
+        with self._lock:
+            self.index = None
+
+
+def build_product_search_index():
+    from .models import Product
+    return ProductSearchIndex.build(Product.objects.values('id', *INDEX_SOURCE_FIELDS).iterator(chunk_size=2000))
+
+
+product_search_index = IndexHolder(build_product_search_index, 'PRODUCT_SEARCH_INDEX_TTL')
+
+
+def get_product_search_index():
+    """Индекс текущего процесса; строится лениво и перестраивается по PRODUCT_SEARCH_INDEX_TTL."""
+    return product_search_index.get()
@@ -1,9 +1,46 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from conf.localization import LocalizedFieldsMixin
+from .querysets import plan_products, category_children
 from .models import Product, Comment, Category, Tag, AGE_RANGE_CHOICES, FAQ
 from user.serializers import UserSerializer
 
 
-class RecursiveCategorySerializer(serializers.ModelSerializer):
+def _query_list(request, name):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+class DynamicFieldsMixin:
+    """Поддержка ?fields=id,title (только перечисленные поля) и ?expand=comments,tags
+    (подключение тяжёлых вложенных полей из expandable_fields) для GET-запросов."""
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        for name in self.get_expand(request):
+            serializer_class, options = self.expandable_fields[name]
+            self.fields[name] = serializer_class(read_only=True, **options)
+
+        requested = _query_list(request, 'fields')
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @classmethod
+    def get_expand(cls, request):
+        return (_query_list(request, 'expand') or set()) & set(cls.expandable_fields)
+
+
+class RecursiveCategorySerializer(LocalizedFieldsMixin, serializers.ModelSerializer):
+    localized_fields = ('name',)
+
     class Meta:
         model = Category
         fields = ['id', 'name_uz', 'name_ru', 'name_en', 'children', 'image']
@@ -11,35 +48,50 @@ class RecursiveCategorySerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
 
     def get_children(self, obj):
-        children = obj.children.all()
+        children = category_children(obj)
         serializer = RecursiveCategorySerializer(children, many=True, context=self.context)
         return serializer.data
 
 
-class TagSerializer(serializers.ModelSerializer):
+class CategoryChildrenSerializer(serializers.ListSerializer):
+    def get_attribute(self, instance):
+        return category_children(instance)
+
+
+class TagSerializer(LocalizedFieldsMixin, serializers.ModelSerializer):
+    localized_fields = ('name',)
+
     class Meta:
         model = Tag
         fields = ['id', 'name_uz', 'name_ru', 'name_en']
 
 
-class TagDetailSerializer(serializers.ModelSerializer):
+class TagDetailSerializer(LocalizedFieldsMixin, serializers.ModelSerializer):
     products = serializers.SerializerMethodField()
+    localized_fields = ('name',)
 
     class Meta:
         model = Tag
         fields = ('id', 'name_uz', 'name_ru', 'name_en', 'products')
 
     def get_products(self, obj):
-        products = Product.objects.filter(tags=obj)
-        return ProductSerializers(products, many=True).data
+        products = plan_products(Product.objects.filter(tags=obj))
+        return ProductSerializers(products, many=True, context=self.context).data
+
 
+class CategorySerializers(LocalizedFieldsMixin, serializers.ModelSerializer):
+    children = CategoryChildrenSerializer(child=RecursiveCategorySerializer(), read_only=True)
+    localized_fields = ('name',)
 
-class CategorySerializers(serializers.ModelSerializer):
-    children = RecursiveCategorySerializer(many=True, read_only=True)
     class Meta:
         model = Category
         fields = ['id', 'name_uz', 'name_ru', 'name_en', 'parent', 'children', 'image']
 
+    def validate_parent(self, value):
+        if value and self.instance and (value.pk == self.instance.pk or value.is_descendant_of(self.instance)):
+            raise serializers.ValidationError("Категория не может быть вложена в себя или в свою подкатегорию.")
+        return value
+
 
 class CommentSerializers(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -55,9 +107,10 @@ class CommentSerializers(serializers.ModelSerializer):
         return value
 
 
-class ProductSerializers(serializers.ModelSerializer):
+class ProductSerializers(LocalizedFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     comments = CommentSerializers(many=True, read_only=True)
     average_rating = serializers.FloatField(read_only=True)
+    rating_count = serializers.IntegerField(read_only=True)
     category = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
         write_only=False
@@ -71,10 +124,26 @@ class ProductSerializers(serializers.ModelSerializer):
         required=False,
     )
 
+    localized_fields = ('description', 'instruction', 'illness', 'composition')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # При полном обновлении остаток не передаётся: total меняется только через PATCH.
+        if self.instance is not None and not self.partial and 'total' in fields:
+            fields['total'].required = False
+        return fields
+
+    def validate_total(self, value):
+        if self.instance is not None and not self.partial:
+            raise serializers.ValidationError(
+                "Остаток нельзя задать полным обновлением (PUT): измените его через PATCH с полем total."
+            )
+        return value
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         category = instance.category
-        if category:
+        if category and 'category' in representation:
             representation['category'] = CategorySerializers(category, context=self.context).data
         # representation['age_range'] = dict(Product.AGE_RANGE_CHOICES).get(instance.age_range, instance.age_range)
         return representation
@@ -82,10 +151,32 @@ class ProductSerializers(serializers.ModelSerializer):
 
     class Meta:
         model=Product
-        fields=['id', 'title','description_uz', 'description_ru', 'description_en', 'instruction_uz', 'instruction_ru', 'instruction_en', 'illness_uz', 'illness_ru', 'illness_en', 'composition_uz', 'composition_ru', 'composition_en', 'price', 'old_price', 'links', 'total', 'comments', 'average_rating', 'category', 'new', 'tags', 'tags_ids', 'age_range',]
+        fields=['id', 'title','description_uz', 'description_ru', 'description_en', 'instruction_uz', 'instruction_ru', 'instruction_en', 'illness_uz', 'illness_ru', 'illness_en', 'composition_uz', 'composition_ru', 'composition_en', 'price', 'old_price', 'links', 'total', 'comments', 'average_rating', 'rating_count', 'category', 'new', 'tags', 'tags_ids', 'age_range',]
+
+
+class ProductListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Компактное представление препарата для списков; comments, category и tags — через ?expand=."""
+    average_rating = serializers.FloatField(read_only=True)
+    rating_count = serializers.IntegerField(read_only=True)
+    image = serializers.SerializerMethodField()
+
+    expandable_fields = {
+        'comments': (CommentSerializers, {'many': True}),
+        'category': (CategorySerializers, {}),
+        'tags': (TagSerializer, {'many': True}),
+    }
+
+    class Meta:
+        model = Product
+        fields = ['id', 'title', 'price', 'old_price', 'average_rating', 'rating_count', 'image', 'category']
+
+    def get_image(self, obj):
+        return obj.links[0] if obj.links else None
+
 
+class FAQSerializer(LocalizedFieldsMixin, serializers.ModelSerializer):
+    localized_fields = ('question', 'answer')
 
-class FAQSerializer(serializers.ModelSerializer):
     class Meta:
         model = FAQ
         fields = ['id', 'question_uz', 'question_ru', 'question_en', 'answer_uz', 'answer_ru', 'answer_en',]
@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Product, Tag, Comment, Category
+from .category_tree import invalidate_category_tree
+from .ratings import add_rating, remove_rating, change_rating, recompute_ratings
+from .search import get_search_backend
+from .search_index import product_search_index, INDEX_SOURCE_FIELDS
+from .autocomplete import autocomplete_index
+
+AUTOCOMPLETE_PRODUCT_FIELDS = ('title', 'illness_uz', 'illness_ru', 'illness_en')
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, using='default', **kwargs):
+    if update_fields is not None and 'search_document' not in update_fields:
+        return
+    get_search_backend(using).index(instance.pk, instance.search_document)
+
+    row = {'id': instance.pk, **{field: getattr(instance, field) for field in INDEX_SOURCE_FIELDS}}
+
+    def update_in_memory_indexes():
+        product_search_index.apply(lambda index: index.add(row))
+        autocomplete_index.apply(lambda index: index.add_product(row))
+
+    transaction.on_commit(update_in_memory_indexes, using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using='default', **kwargs):
+    get_search_backend(using).remove(instance.pk)
+
+    product_id = instance.pk
+
+    def update_in_memory_indexes():
+        product_search_index.apply(lambda index: index.remove(product_id))
+        autocomplete_index.apply(lambda index: index.remove_product(product_id))
+
+    transaction.on_commit(update_in_memory_indexes, using=using)
+
+
+@receiver(post_save, sender=Tag)
+def index_tag(sender, instance, using='default', **kwargs):
+    row = {'id': instance.pk, 'name_uz': instance.name_uz, 'name_ru': instance.name_ru, 'name_en': instance.name_en}
+
+    def update_autocomplete():
+        autocomplete_index.apply(lambda index: index.add_tag(row))
+
+    transaction.on_commit(update_autocomplete, using=using)
+
+
+@receiver(post_delete, sender=Tag)
+def unindex_tag(sender, instance, using='default', **kwargs):
+    tag_id = instance.pk
+
+    def update_autocomplete():
+        autocomplete_index.apply(lambda index: index.remove_tag(tag_id))
+
+    transaction.on_commit(update_autocomplete, using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def reset_category_tree(sender, using='default', **kwargs):
+    invalidate_category_tree()
+    # Повторно после коммита, чтобы не остался кэш, прочитанный до фиксации транзакции.
+    transaction.on_commit(invalidate_category_tree, using=using)
+
+
+@receiver(post_save, sender=Comment)
+def update_product_rating(sender, instance, created, **kwargs):
+    loaded_product_id, loaded_rating = getattr(instance, '_loaded_rating', (None, None))
+    if created:
+        add_rating(instance.product_id, instance.rating)
+    elif loaded_product_id is None or loaded_rating is None:
+        recompute_ratings(Product.objects.filter(pk=instance.product_id))
+    elif loaded_product_id != instance.product_id:
+        remove_rating(loaded_product_id, loaded_rating)
+        add_rating(instance.product_id, instance.rating)
+    elif loaded_rating != instance.rating:
+        change_rating(instance.product_id, loaded_rating, instance.rating)
+    instance._loaded_rating = (instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_product_rating(sender, instance, **kwargs):
+    loaded_product_id, loaded_rating = getattr(instance, '_loaded_rating', (None, None))
+    if loaded_product_id is None or loaded_rating is None:
+        remove_rating(instance.product_id, instance.rating)
+    else:
+        remove_rating(loaded_product_id, loaded_rating)
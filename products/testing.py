@@ -0,0 +1,14 @@
+from .models import Product
+
+
+def create_product(category, title=None, **fields):
+    """Продукт для тестов с заполненными обязательными полями; без title получает уникальное «Product N»."""
+    values = {
+        'price': 100, 'total': 10,
+        'description_uz': 'd', 'description_ru': 'd', 'description_en': 'd',
+        'instruction_uz': 'i', 'instruction_ru': 'i', 'instruction_en': 'i',
+    }
+    values.update(fields)
+    if title is None:
+        title = f'Product {Product.objects.count()}'
+    return Product.objects.create(title=title, category=category, **values)
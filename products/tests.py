@@ -1,3 +1,602 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from user.models import CustomUser
+from .category_tree import get_category_tree
+from .inventory import apply_movements, lock_stock, reconcile
+from .models import Category, Comment, InventoryMovement, Product, Tag
+from .autocomplete import autocomplete_index
+from .search import SearchBackend, SQLiteFTSBackend, get_search_backend
+from .search_index import IndexHolder, product_search_index
+from .testing import create_product
+
+
+class ProductQueryCountTests(TestCase):
+    """Число запросов при сериализации продуктов не должно зависеть от их количества."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        root = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        child = Category.objects.create(name_uz='Ko`z', name_ru='Глаза', name_en='Eyes', parent=root)
+        Category.objects.create(name_uz='Qovoq', name_ru='Веки', name_en='Eyelids', parent=child)
+        self.category = child
+        self.tag = Tag.objects.create(name_uz='Antibiotik', name_ru='Антибиотик', name_en='Antibiotic')
+        # Дерево категорий кэшируется на процесс; прогреваем, чтобы считать только запросы на продукты.
+        get_category_tree()
+
+    def create_products(self, count):
+        for i in range(count):
+            product = create_product(self.category)
+            product.tags.add(self.tag)
+            Comment.objects.create(product=product, user=self.user, text='ok', rating=5)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assertConstantQueries(self, url):
+        self.create_products(2)
+        small = self.count_queries(url)
+        self.create_products(5)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_product_list(self):
+        self.assertConstantQueries('/api/products/?expand=comments,category,tags')
+
+    def test_product_list_by_category(self):
+        self.assertConstantQueries(f'/api/products/by_category/{self.category.id}/?expand=comments,category,tags')
+
+    def test_tag_detail(self):
+        self.assertConstantQueries(f'/api/tags/{self.tag.id}/')
+
+    def test_tag_detail_serializer(self):
+        from .serializers import TagDetailSerializer
+
+        self.create_products(2)
+        with CaptureQueriesContext(connection) as small:
+            TagDetailSerializer(self.tag).data
+        self.create_products(5)
+        with self.assertNumQueries(len(small)):
+            TagDetailSerializer(self.tag).data
+
+
+@override_settings(INVENTORY_RECONCILE_LAG=0)
+class InventoryReconcileTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.products = [
+            create_product(category, f'Product {i}', total=0)
+            for i in range(3)
+        ]
+        apply_movements([(product.id, 10, 'doc:1') for product in self.products], InventoryMovement.IMPORT)
+
+    def test_incremental_checks_only_products_with_new_movements(self):
+        first = reconcile()
+        self.assertEqual((first.products_checked, first.mismatches), (3, []))
+
+        drifted, moved, untouched = self.products
+        Product.objects.filter(pk__in=[drifted.pk, untouched.pk]).update(total=99)
+        apply_movements([(drifted.id, -1, ''), (moved.id, -2, '')], InventoryMovement.SALE)
+
+        second = reconcile()
+        self.assertEqual(second.products_checked, 2)
+        self.assertEqual([mismatch['product_id'] for mismatch in second.mismatches], [drifted.id])
+        self.assertEqual(reconcile().products_checked, 0)
+
+        full = reconcile(full=True, fix=True)
+        self.assertEqual(
+            [(mismatch['product_id'], mismatch['chain_ok']) for mismatch in full.mismatches],
+            [(drifted.id, False), (untouched.id, True)]
+        )
+        # Разрыв цепочки только сообщается; total чинится там, где он разошёлся с журналом.
+        self.assertEqual(list(Product.objects.order_by('id').values_list('total', flat=True)), [98, 8, 10])
+
+    def test_fix_uses_ledger_balance_read_under_lock(self):
+        drifted = self.products[0]
+        Product.objects.filter(pk=drifted.pk).update(total=99)
+
+        def sale_then_lock(product_id):
+            # Продажа, зафиксированная между чтением сверки и исправлением.
+            InventoryMovement.objects.create(
+                product_id=product_id, delta=-3, balance_after=7, reason=InventoryMovement.SALE
+            )
+            return lock_stock(product_id)
+
+        with mock.patch('products.inventory.lock_stock', side_effect=sale_then_lock):
+            result = reconcile(full=True, fix=True)
+        self.assertEqual([(mismatch['product_id'], mismatch['ledger']) for mismatch in result.mismatches], [(drifted.id, 10)])
+        drifted.refresh_from_db()
+        self.assertEqual(drifted.total, 7)
+
+
+class ProductSearchFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.paracetamol = create_product(
+            category, 'Paracetamol', description_ru='Жаропонижающее средство', illness_en=['Headache'],
+        )
+        self.ibuprofen = create_product(category, 'Ibuprofen', composition_en=['ibuprofen 200 mg'])
+
+    def search(self, term):
+        response = self.client.get('/api/products/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.json()}
+
+    def test_uses_fts_backend_on_sqlite(self):
+        self.assertIsInstance(get_search_backend(), SQLiteFTSBackend)
+
+    def test_matches_substrings_of_any_field_case_insensitively(self):
+        self.assertEqual(self.search('CETAM'), {self.paracetamol.id})
+        self.assertEqual(self.search('жаропонижающ'), {self.paracetamol.id})
+        self.assertEqual(self.search('headache'), {self.paracetamol.id})
+        self.assertEqual(self.search('200 mg'), {self.ibuprofen.id})
+        self.assertEqual(self.search('aspirin'), set())
+
+    def test_short_terms_fall_back_to_substring_search(self):
+        self.assertEqual(self.search('ib'), {self.ibuprofen.id})
+
+    def test_index_follows_product_changes(self):
+        self.ibuprofen.title = 'Nurofen'
+        self.ibuprofen.composition_en = []
+        self.ibuprofen.save()
+        self.assertEqual(self.search('nurofen'), {self.ibuprofen.id})
+        self.assertEqual(self.search('ibuprofen'), set())
+
+        self.paracetamol.delete()
+        self.assertEqual(self.search('paracetamol'), set())
+
+    def test_fallback_backend_matches_fts_backend(self):
+        queryset = Product.objects.all()
+        for term in ('cetam', 'HEADACHE', '200 mg', 'ib', 'aspirin'):
+            self.assertEqual(
+                set(SearchBackend().filter(queryset, term)), set(SQLiteFTSBackend().filter(queryset, term)), term
+            )
+
+
+class RankedSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.paracetamol = create_product(category, 'Paracetamol 500', illness_ru=['Головная боль'])
+        self.combined = create_product(
+            category, 'Coldrex', description_en='Contains paracetamol and vitamin C for colds and flu',
+        )
+        self.other = create_product(category, 'Loratadine', description_en='Allergy relief')
+        product_search_index.invalidate()
+        self.addCleanup(product_search_index.invalidate)
+
+    def search(self, q, **params):
+        response = self.client.get('/api/products/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()]
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('paracetamol'), [self.paracetamol.id, self.combined.id])
+        self.assertEqual(self.search('paracetamol', limit=1), [self.paracetamol.id])
+
+    def test_tolerates_typos_and_other_scripts(self):
+        for query in ('paracetmol', 'parasetamol', 'paratsetamol', 'парацетамол'):
+            self.assertEqual(self.search(query)[:1], [self.paracetamol.id], query)
+        self.assertEqual(self.search('головная'), [self.paracetamol.id])
+        self.assertEqual(self.search('xyzzy'), [])
+
+    def test_requires_query(self):
+        self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+
+
+class FakeIndex:
+    def __init__(self, name):
+        self.name = name
+        self.stale = False
+        self.changes = []
+
+    def is_stale(self, ttl):
+        return self.stale
+
+
+class IndexHolderTests(TestCase):
+    def test_serves_old_index_while_rebuilding_and_replays_changes(self):
+        started, release = threading.Event(), threading.Event()
+        indexes = iter([FakeIndex('first'), FakeIndex('second')])
+
+        def build():
+            index = next(indexes)
+            if index.name == 'second':
+                started.set()
+                release.wait(5)
+            return index
+
+        holder = IndexHolder(build, 'PRODUCT_SEARCH_INDEX_TTL')
+        first = holder.get()
+        first.stale = True
+
+        rebuilding = threading.Thread(target=holder.get)
+        rebuilding.start()
+        self.assertTrue(started.wait(5))
+        # Пока идёт перестройка, запросы не ждут её и читают прежний индекс.
+        self.assertIs(holder.get(), first)
+        holder.apply(lambda index: index.changes.append('product:1'))
+        release.set()
+        rebuilding.join(5)
+
+        second = holder.get()
+        self.assertEqual(second.name, 'second')
+        self.assertEqual((first.changes, second.changes), (['product:1'], ['product:1']))
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.paracetamol = create_product(category, 'Paracetamol', illness_ru=['Головная боль'])
+        self.parodontax = create_product(category, 'Parodontax')
+        self.tag = Tag.objects.create(name_uz='Og`riq qoldiruvchi', name_ru='Обезболивающее', name_en='Painkiller')
+        self.paracetamol.tags.add(self.tag)
+
+        from order.models import Order, OrderItem
+        user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        for _ in range(2):
+            OrderItem.objects.create(order=Order.objects.create(user=user), product=self.parodontax)
+        autocomplete_index.invalidate()
+        self.addCleanup(autocomplete_index.invalidate)
+
+    def suggest(self, q, **params):
+        response = self.client.get('/api/products/autocomplete/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def labels(self, q, lang):
+        return [item['label'] for item in self.suggest(q, lang=lang)[lang]]
+
+    def test_products_are_ranked_by_popularity(self):
+        self.assertEqual(self.suggest('par', lang='en'), {'en': [
+            {'type': 'product', 'id': self.parodontax.id, 'label': 'Parodontax'},
+            {'type': 'product', 'id': self.paracetamol.id, 'label': 'Paracetamol'},
+        ]})
+        self.assertEqual(self.labels('par', 'en'), self.labels('пар', 'en'))
+        self.assertEqual(self.labels('parac', 'uz'), ['Paracetamol'])
+
+    def test_tags_and_illnesses_are_suggested_per_language(self):
+        self.assertEqual(self.labels('обез', 'ru'), ['Обезболивающее'])
+        self.assertEqual(self.labels('pain', 'en'), ['Painkiller'])
+        self.assertEqual(self.labels('pain', 'ru'), [])
+        # Совпадение с началом любого слова, а не только всей строки.
+        self.assertEqual(self.labels('бол', 'ru'), ['Головная боль'])
+        self.assertEqual(set(self.suggest('бол')), {'uz', 'ru', 'en'})
+
+    def test_index_follows_committed_changes(self):
+        self.suggest('par')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paracetamol.title = 'Acetaminophen'
+            self.paracetamol.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.delete()
+        self.assertEqual(self.labels('par', 'en'), ['Parodontax'])
+        self.assertEqual(self.labels('acet', 'en'), ['Acetaminophen'])
+        self.assertEqual(self.labels('pain', 'en'), [])
+
+    def test_validates_parameters(self):
+        self.assertEqual(self.suggest(''), {})
+        self.assertEqual(len(self.suggest('par', lang='en', limit=1)['en']), 1)
+        self.assertEqual(self.client.get('/api/products/autocomplete/', {'q': 'par', 'lang': 'de'}).status_code, 400)
+
+
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.product = create_product(category, 'Paracetamol')
+        self.other = create_product(category, 'Ibuprofen')
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+
+    def comment(self, rating, product=None):
+        return Comment.objects.create(product=product or self.product, user=self.user, text='ok', rating=rating)
+
+    def assertRating(self, product, average, count):
+        product.refresh_from_db(fields=Product.RATING_FIELDS)
+        self.assertEqual((product.average_rating, product.rating_count), (average, count))
+
+    def test_comment_signals_maintain_aggregates(self):
+        first, second = self.comment(5), self.comment(3)
+        self.assertRating(self.product, 4.0, 2)
+
+        second = Comment.objects.get(pk=second.pk)
+        second.rating = 1
+        second.save()
+        self.assertRating(self.product, 3.0, 2)
+
+        first = Comment.objects.get(pk=first.pk)
+        first.product = self.other
+        first.save()
+        self.assertRating(self.product, 1.0, 1)
+        self.assertRating(self.other, 5.0, 1)
+
+        second.delete()
+        self.assertRating(self.product, None, 0)
+
+    def test_stale_product_save_keeps_rating_aggregates(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.comment(5)
+        self.comment(4)
+
+        stale.title = 'Paracetamol 500'
+        stale.save()
+        self.assertEqual((stale.average_rating, stale.rating_count), (4.5, 2))
+        self.assertRating(self.product, 4.5, 2)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).title, 'Paracetamol 500')
+
+
+class ProductCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        # Много одинаковых цен и нулевых rating_count: курсор должен различать строки по id.
+        self.products = [create_product(category, f'Product {i}', price=(100, 200, 300)[i % 3]) for i in range(11)]
+
+    def walk(self, url, link='next'):
+        ids, pages = [], 0
+        with CaptureQueriesContext(connection) as context:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                ids.extend(item['id'] for item in response.json()['results'])
+                url, pages = response.json()[link], pages + 1
+        self.assertFalse(any('OFFSET' in query['sql'] for query in context.captured_queries))
+        return ids, pages
+
+    def test_pages_through_tied_values_without_gaps_or_duplicates(self):
+        by_price = sorted(self.products, key=lambda product: (product.price, product.id))
+        by_price_desc = sorted(self.products, key=lambda product: (-product.price, -product.id))
+        expected = {
+            'price': [product.id for product in by_price],
+            '-price': [product.id for product in by_price_desc],
+            '-rating_count': sorted((product.id for product in self.products), reverse=True),
+            'id': sorted(product.id for product in self.products),
+        }
+        for ordering, ids in expected.items():
+            self.assertEqual(self.walk(f'/api/products/?ordering={ordering}&page_size=2'), (ids, 6), ordering)
+
+    def test_previous_links_walk_back_over_the_same_rows(self):
+        url = '/api/products/?ordering=price&page_size=3'
+        pages = []
+        while url:
+            body = self.client.get(url).json()
+            pages.append([item['id'] for item in body['results']])
+            url = body['next']
+        self.assertIsNone(self.client.get('/api/products/?ordering=price&page_size=3').json()['previous'])
+
+        previous = body['previous']
+        for page in reversed(pages[:-1]):
+            body = self.client.get(previous).json()
+            self.assertEqual([item['id'] for item in body['results']], page)
+            previous = body['previous']
+        self.assertIsNone(previous)
+
+    def test_datetime_cursor_keeps_microseconds(self):
+        user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.client.force_authenticate(user)
+        product = self.products[0]
+        comments = [Comment.objects.create(product=product, user=user, text='ok', rating=5) for _ in range(5)]
+        moment = timezone.now().replace(microsecond=500)
+        for i, comment in enumerate(comments):
+            # Все в пределах одной миллисекунды.
+            Comment.objects.filter(pk=comment.pk).update(created_at=moment + timedelta(microseconds=i * 100))
+
+        url, ids = f'/api/products/{product.id}/comments/?page_size=2', []
+        for _ in range(5):
+            body = self.client.get(url).json()
+            ids.extend(item['id'] for item in body['results'])
+            url = body['next']
+            if url is None:
+                break
+        self.assertIsNone(url)
+        self.assertEqual(ids, [comment.id for comment in reversed(comments)])
+
+    def test_rejects_unknown_ordering_and_broken_cursor(self):
+        self.assertEqual(self.client.get('/api/products/?ordering=title&page_size=2').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/?cursor=broken').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/?cursor=eyJwIjogWzFdfQ==&ordering=price').status_code, 404)
+
+
+class ProductRepresentationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.tag = Tag.objects.create(name_uz='Antibiotik', name_ru='Антибиотик', name_en='Antibiotic')
+        self.product = create_product(self.category, 'Paracetamol', links=['http://example.com/1.png'])
+        self.product.tags.add(self.tag)
+
+    def test_list_is_compact_by_default(self):
+        item, = self.client.get('/api/products/').json()
+        self.assertEqual(item, {
+            'id': self.product.id, 'title': 'Paracetamol', 'price': 100, 'old_price': None, 'average_rating': None,
+            'rating_count': 0, 'image': 'http://example.com/1.png', 'category': self.category.id,
+        })
+
+    def test_expand_adds_nested_data(self):
+        item, = self.client.get('/api/products/', {'expand': 'tags,category,unknown'}).json()
+        self.assertEqual([tag['id'] for tag in item['tags']], [self.tag.id])
+        self.assertEqual(item['category']['id'], self.category.id)
+        self.assertNotIn('comments', item)
+        self.assertNotIn('unknown', item)
+
+    def test_fields_limits_list_and_detail(self):
+        item, = self.client.get('/api/products/', {'fields': 'id,title,tags', 'expand': 'tags'}).json()
+        self.assertEqual(set(item), {'id', 'title', 'tags'})
+
+        detail = self.client.get(f'/api/products/{self.product.id}/').json()
+        self.assertIn('description_ru', detail)
+        self.assertEqual([tag['id'] for tag in detail['tags']], [self.tag.id])
+        detail = self.client.get(f'/api/products/{self.product.id}/', {'fields': 'id,price'}).json()
+        self.assertEqual(detail, {'id': self.product.id, 'price': 100})
+
+
+class LocalizationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.product = create_product(
+            category, 'Paracetamol', description_uz='', description_ru='Жаропонижающее', description_en='Antipyretic',
+            illness_ru=['Головная боль'], illness_en=['Headache'],
+        )
+        self.url = f'/api/products/{self.product.id}/'
+
+    def test_accept_language_collapses_translations(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_LANGUAGE='de-DE, en-US;q=0.8, ru;q=0.5')
+        data = response.json()
+        self.assertEqual((data['description'], data['illness'], data['category']['name']), ('Antipyretic', ['Headache'], 'Head'))
+        self.assertNotIn('description_en', data)
+        self.assertEqual(response['Content-Language'], 'en')
+        self.assertIn('Accept-Language', response['Vary'])
+
+    def test_lang_parameter_overrides_header_and_falls_back(self):
+        data = self.client.get(self.url, {'lang': 'uz'}, HTTP_ACCEPT_LANGUAGE='en').json()
+        # Пустой узбекский перевод заменяется следующим по LOCALE_FALLBACKS (русским).
+        self.assertEqual((data['description'], data['category']['name']), ('Жаропонижающее', 'Bosh'))
+
+    def test_full_form_without_preference_or_with_lang_all(self):
+        for params, headers in (({}, {}), ({'lang': 'all'}, {'HTTP_ACCEPT_LANGUAGE': 'ru'})):
+            response = self.client.get(self.url, params, **headers)
+            self.assertEqual(
+                [response.json()[f'description_{lang}'] for lang in ('uz', 'ru', 'en')], ['', 'Жаропонижающее', 'Antipyretic']
+            )
+            self.assertNotIn('Content-Language', response)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # id 10 начинается с id 1: поддерево "1/" не должно захватывать "10/".
+        self.head = self.category(1)
+        self.eyes = self.category(12, self.head)
+        self.eyelids = self.category(120, self.eyes)
+        self.legs = self.category(10)
+        self.knee = self.category(11, self.legs)
+
+    def category(self, pk, parent=None):
+        return Category.objects.create(pk=pk, parent=parent, name_uz=str(pk), name_ru=str(pk), name_en=str(pk))
+
+    def paths(self):
+        return dict(Category.objects.values_list('pk', 'path'))
+
+    def subtree(self, category):
+        return set(Category.objects.filter(category.subtree_q()).values_list('pk', flat=True))
+
+    def test_paths_and_subtrees(self):
+        self.assertEqual(self.paths(), {1: '1/', 12: '1/12/', 120: '1/12/120/', 10: '10/', 11: '10/11/'})
+        self.assertEqual(self.subtree(self.head), {1, 12, 120})
+        self.assertEqual(self.subtree(self.eyes), {12, 120})
+        self.assertEqual(self.subtree(self.legs), {10, 11})
+
+    def test_moving_a_category_rewrites_its_subtree(self):
+        self.eyes.parent = self.knee
+        self.eyes.save()
+        self.assertEqual(self.paths(), {1: '1/', 12: '10/11/12/', 120: '10/11/12/120/', 10: '10/', 11: '10/11/'})
+        self.assertEqual(dict(Category.objects.values_list('pk', 'depth'))[120], 3)
+        self.assertEqual(self.subtree(self.head), {1})
+
+        self.eyes.parent = None
+        self.eyes.save()
+        self.assertEqual((self.paths()[12], self.paths()[120]), ('12/', '12/120/'))
+
+    def test_rejects_cycles(self):
+        self.head.parent = self.eyelids
+        with self.assertRaises(ValidationError):
+            self.head.full_clean()
+        with self.assertRaises(ValueError):
+            self.head.save()
+        self.assertEqual(self.paths()[1], '1/')
+
+        response = self.client.patch(f'/api/categories/{self.eyes.id}/', {'parent': self.eyes.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_lists_products_of_a_subtree(self):
+        inner = create_product(self.eyelids, 'Drops')
+        create_product(self.legs, 'Gel')
+        response = self.client.get(f'/api/products/by_category/{self.head.id}/', {'descendants': 'true'})
+        self.assertEqual([item['id'] for item in response.json()], [inner.id])
+        self.assertEqual(self.client.get(f'/api/products/by_category/{self.head.id}/').json(), [])
+
+    def test_subtree_listing_does_not_depend_on_the_cached_tree(self):
+        stale = get_category_tree()
+        # Другой процесс перенёс категорию и создал новую: дерево этого процесса об этом не знает.
+        self.eyes.parent = self.knee
+        self.eyes.save()
+        created = self.category(13, self.head)
+        moved, new = create_product(self.eyelids, 'Drops'), create_product(created, 'Gel')
+        with mock.patch('products.category_tree._tree', stale):
+            self.assertEqual(self.listed(self.legs), [moved.id])
+            self.assertEqual(self.listed(self.head), [new.id])
+            self.assertEqual(self.listed(created), [new.id])
+        response = self.client.get('/api/products/by_category/999/', {'descendants': 'true'})
+        self.assertEqual(response.status_code, 404)
+
+    def listed(self, category):
+        response = self.client.get(f'/api/products/by_category/{category.id}/', {'descendants': 'true'})
+        return [item['id'] for item in response.json()]
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.a = Tag.objects.create(name_uz='A', name_ru='А', name_en='A')
+        self.b = Tag.objects.create(name_uz='B', name_ru='Б', name_en='B')
+        create_product(category, 'One', price=5000, new=True).tags.add(self.a)
+        create_product(category, 'Two', price=20000, old_price=25000, new=False).tags.add(self.a, self.b)
+        create_product(category, 'Three', price=600000, age_range='0-2').tags.add(self.b)
+
+    def facets(self, **params):
+        response = self.client.get('/api/products/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def counts(self, facet):
+        return {item.get('value', item.get('min')): item['count'] for item in facet if item['count']}
+
+    def test_counts_each_dimension_without_its_own_filter(self):
+        facets = self.facets(tags=str(self.a.id))
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual([(tag['id'], tag['count']) for tag in facets['tags']], [(self.a.id, 2), (self.b.id, 2)])
+        self.assertEqual(self.counts(facets['age_range']), {'18+': 2})
+        self.assertEqual(self.counts(facets['price']), {0: 1, 10000: 1})
+        self.assertEqual(facets['has_old_price'], {'true': 1, 'false': 1})
+        self.assertEqual(facets['new'], {'true': 1, 'false': 1})
+
+    def test_other_filters_narrow_each_facet(self):
+        facets = self.facets(tags=str(self.a.id), price_min='10000')
+        self.assertEqual(facets['total'], 1)
+        # Теги считаются только с фильтром по цене, цены — только с фильтром по тегам.
+        self.assertEqual([(tag['id'], tag['count']) for tag in facets['tags']], [(self.b.id, 2), (self.a.id, 1)])
+        self.assertEqual(self.counts(facets['price']), {0: 1, 10000: 1})
+        self.assertEqual(facets['new'], {'true': 0, 'false': 1})
+
+    def test_localizes_tags_and_normalizes_cache_key(self):
+        tags = self.facets(tags=f'{self.b.id},{self.a.id}', lang='ru')['tags']
+        self.assertEqual(tags[0], {'id': self.a.id, 'name': 'А', 'count': 2})
+        self.assertEqual(
+            self.facets(tags=f'{self.a.id},{self.b.id}', lang='ru'),
+            self.facets(tags=f' {self.b.id},{self.a.id}', lang='ru', page_size='5'),
+        )
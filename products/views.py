@@ -4,13 +4,23 @@ from rest_framework import viewsets
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from .models import Product, Comment, Category, Tag, FAQ
+from .inventory import adjust_stock, record_opening_balance
 from .serializers import ProductSerializers, CommentSerializers, CategorySerializers, TagSerializer, \
-    TagDetailSerializer, FAQSerializer
-from django.db.models import Avg
+    TagDetailSerializer, FAQSerializer, ProductListSerializer
+from .querysets import plan_products
+from .facets import get_facets
+from .search import get_search_backend
+from .category_tree import get_category_tree
 from .filters import CustomSearchFilter, ProductFilter
+from .search_index import get_product_search_index
+from .autocomplete import get_autocomplete_index, LANGUAGES
+from django.conf import settings
+from django.db import transaction
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
+from conf.localization import get_response_language, localize
+from conf.pagination import ProductCursorPagination, CreatedAtCursorPagination
 
 class TagViewSet(viewsets.ModelViewSet):
     queryset = Tag.objects.all()
@@ -105,10 +115,11 @@ class TagViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         tag = self.get_object()
 
-        products = tag.products.all()
+        language = get_response_language(request)
+        products = plan_products(tag.products.all(), relations=('tags',))
         product_data = []
         for product in products:
-            product_data.append({
+            product_data.append(localize({
                 'id': product.id,
                 'title': product.title,
                 'description_uz': product.description_uz,
@@ -125,20 +136,20 @@ class TagViewSet(viewsets.ModelViewSet):
                 'composition_en': product.composition_en,
                 'price': product.price,
                 'old_price': product.old_price,
-                'category': product.category.id if product.category else None,
+                'category': product.category_id,
                 'tags': [tag.id for tag in product.tags.all()],
                 'links': product.links,
                 'total': product.total,
                 'new': product.new,
-            })
+            }, ProductSerializers.localized_fields, language))
 
-        return Response({
+        return Response(localize({
             'id': tag.id,
             'name_uz': tag.name_uz,
             'name_ru': tag.name_ru,
             'name_en': tag.name_en,
             'products': product_data
-        })
+        }, TagSerializer.localized_fields, language))
 
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
@@ -155,7 +166,8 @@ class CategoryViewSet(viewsets.ModelViewSet):
         }
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer(get_category_tree().categories, many=True)
+        return Response(serializer.data)
 
     @swagger_auto_schema(
         operation_summary="Получить данные категории",
@@ -279,6 +291,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializers
+    pagination_class = ProductCursorPagination
     filter_backends = [CustomSearchFilter, DjangoFilterBackend]
     filterset_class = ProductFilter
     search_fields = [
@@ -297,14 +310,38 @@ class ProductViewSet(viewsets.ModelViewSet):
         'composition_en',
     ]
 
+    list_actions = ('list', 'by_category', 'search')
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions:
+            return ProductListSerializer
+        return ProductSerializers
+
     def get_queryset(self):
-        base_queryset = Product.objects.annotate(
-            average_rating=Avg('comments__rating')
-        )
-        return self.get_filtered_queryset(base_queryset)
+        return self.get_filtered_queryset(self.with_expansions(Product.objects.all()))
 
-    def get_filtered_queryset(self, base_queryset):
-        params = self.request.query_params.copy()
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            record_opening_balance(serializer.save(), user=self.request.user)
+
+    def perform_update(self, serializer):
+        # Остаток меняется только через складской журнал: разница с загруженным значением проводится
+        # корректировкой, а продукт сохраняется с получившимся остатком. total принимает только PATCH
+        # (см. ProductSerializers.validate_total).
+        instance = serializer.instance
+        delta = 0
+        if 'total' in serializer.validated_data:
+            delta = serializer.validated_data['total'] - instance.total
+        with transaction.atomic():
+            serializer.save(total=adjust_stock(instance.pk, delta, self.request.user, reference='api'))
+
+    def with_expansions(self, queryset):
+        if self.action in self.list_actions:
+            return plan_products(queryset, relations=ProductListSerializer.get_expand(self.request))
+        return plan_products(queryset)
+
+    def get_filtered_queryset(self, base_queryset, params=None):
+        params = (self.request.query_params if params is None else params).copy()
 
         tags = params.get('tags')
         if tags and ',' in tags:
@@ -363,8 +400,12 @@ class ProductViewSet(viewsets.ModelViewSet):
             openapi.Parameter('search', openapi.IN_QUERY,
                               description="Поиск по названию, описанию, инструкции или составу",
                               type=openapi.TYPE_STRING),
+            openapi.Parameter('fields', openapi.IN_QUERY,
+                              description="Список полей через запятую (например: id,title,price)", type=openapi.TYPE_STRING),
+            openapi.Parameter('expand', openapi.IN_QUERY,
+                              description="Вложенные данные через запятую: comments, category, tags", type=openapi.TYPE_STRING),
         ],
-        responses={200: ProductSerializers(many=True)}
+        responses={200: ProductListSerializer(many=True)}
     )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
@@ -372,6 +413,10 @@ class ProductViewSet(viewsets.ModelViewSet):
     @swagger_auto_schema(
         operation_summary="Получить данные медицинского препарата",
         operation_description="Возвращает данные конкретного медицинского препарата по его ID, включая название, описание, инструкции на трёх языках, цену, возрастной диапазон, средний рейтинг и ссылки на фотографии препарата. Препарат связан с категорией, представляющей часть тела или орган.",
+        manual_parameters=[
+            openapi.Parameter('fields', openapi.IN_QUERY,
+                              description="Список полей через запятую (например: id,title,price)", type=openapi.TYPE_STRING),
+        ],
         responses={200: ProductSerializers()}
     )
     def retrieve(self, request, *args, **kwargs):
@@ -501,13 +546,13 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @swagger_auto_schema(
         operation_summary="Обновить данные медицинского препарата (полное обновление)",
-        operation_description="Обновляет данные указанного медицинского препарата по его ID, включая ссылки на фотографии препарата. Препарат связывается с категорией, представляющей часть тела или орган.",
+        operation_description="Обновляет данные указанного медицинского препарата по его ID, включая ссылки на фотографии препарата. Препарат связывается с категорией, представляющей часть тела или орган. Поле total при полном обновлении не передаётся (ошибка 400): остаток меняется через PATCH.",
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             required=[
                 "title", "description_uz", "description_ru", "description_en",
                 "instruction_uz", "instruction_ru", "instruction_en",
-                "price", "category", "total"
+                "price", "category"
             ],
             properties={
                 "title": openapi.Schema(type=openapi.TYPE_STRING, description="Название медицинского препарата",
@@ -576,8 +621,6 @@ class ProductViewSet(viewsets.ModelViewSet):
                     description="Ссылки на фотографии медицинского препарата",
                     nullable=True
                 ),
-                "total": openapi.Schema(type=openapi.TYPE_INTEGER, description="Количество единиц препарата в наличии",
-                                        minimum=0),
                 "new": openapi.Schema(type=openapi.TYPE_BOOLEAN, description="Препарат является новым (True/False)",
                                       nullable=True),
                 "age_range": openapi.Schema(
@@ -693,7 +736,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                     description="Ссылки на фотографии медицинского препарата",
                     nullable=True
                 ),
-                "total": openapi.Schema(type=openapi.TYPE_INTEGER, description="Количество единиц препарата в наличии",
+                "total": openapi.Schema(type=openapi.TYPE_INTEGER, description="Новое количество единиц в наличии; разница с текущим остатком проводится корректировкой",
                                         minimum=0),
                 "new": openapi.Schema(type=openapi.TYPE_BOOLEAN, description="Препарат является новым (True/False)",
                                       nullable=True),
@@ -726,26 +769,168 @@ class ProductViewSet(viewsets.ModelViewSet):
         operation_description="Возвращает список медицинских препаратов в указанной категории, представляющей часть тела или орган (например, Голова), с возможностью фильтрации по цене, наличию старой цены и среднему рейтингу.",
         manual_parameters=[
             openapi.Parameter('category_id', openapi.IN_PATH, description="ID категории (например, Голова или Нога)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('descendants', openapi.IN_QUERY, description="Включить препараты из всех подкатегорий (true/false)", type=openapi.TYPE_STRING),
             openapi.Parameter('has_old_price', openapi.IN_QUERY, description="Фильтр по наличию старой цены (true/false)", type=openapi.TYPE_STRING),
             openapi.Parameter('price_min', openapi.IN_QUERY, description="Минимальная цена", type=openapi.TYPE_INTEGER),
             openapi.Parameter('price_max', openapi.IN_QUERY, description="Максимальная цена", type=openapi.TYPE_INTEGER),
-            openapi.Parameter('average_rating', openapi.IN_QUERY, description="Минимальный средний рейтинг", type=openapi.TYPE_INTEGER)
+            openapi.Parameter('average_rating', openapi.IN_QUERY, description="Минимальный средний рейтинг", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('fields', openapi.IN_QUERY,
+                              description="Список полей через запятую (например: id,title,price)", type=openapi.TYPE_STRING),
+            openapi.Parameter('expand', openapi.IN_QUERY,
+                              description="Вложенные данные через запятую: comments, category, tags", type=openapi.TYPE_STRING),
         ],
-        responses={200: ProductSerializers(many=True)}
+        responses={200: ProductListSerializer(many=True), 404: "Категория не найдена (при descendants=true)"}
     )
     @action(detail=False, methods=['get'], url_path='by_category/(?P<category_id>[^/.]+)')
     def by_category(self, request, category_id=None):
-        queryset = Product.objects.filter(category_id=category_id).annotate(
-            average_rating=Avg('comments__rating')
-        )
+        if request.query_params.get('descendants') == 'true':
+            # path читается из базы: дерево в памяти другого процесса может не знать о переносе
+            # или создании категории до истечения CATEGORY_TREE_TTL.
+            category = Category.objects.only('id', 'path').filter(pk=category_id).first() if category_id.isdigit() else None
+            if category is None:
+                raise NotFound("Категория не найдена.")
+            queryset = Product.objects.filter(category.subtree_q(prefix='category__'))
+        else:
+            queryset = Product.objects.filter(category_id=category_id)
+        queryset = self.with_expansions(queryset)
         filtered_qs = self.get_filtered_queryset(queryset)
+        page = self.paginate_queryset(filtered_qs)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
         serializer = self.get_serializer(filtered_qs, many=True)
         return Response(serializer.data)
 
+    @swagger_auto_schema(
+        operation_summary="Ранжированный поиск медицинских препаратов",
+        operation_description="Ищет препараты по названию, заболеваниям, составу, описанию и инструкции на трёх языках и сортирует их по релевантности (BM25). Совпадения в названии весят больше, чем в описании и инструкции. Запрос можно вводить латиницей, кириллицей или по-русски, допускаются опечатки в 1-2 символа.",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Поисковый запрос (например: 'paracetamol', 'парацетамол', 'paratsetamol')",
+                              type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Количество результатов (по умолчанию 20, максимум 100)",
+                              type=openapi.TYPE_INTEGER),
+            openapi.Parameter('fields', openapi.IN_QUERY,
+                              description="Список полей через запятую (например: id,title,price)", type=openapi.TYPE_STRING),
+            openapi.Parameter('expand', openapi.IN_QUERY,
+                              description="Вложенные данные через запятую: comments, category, tags", type=openapi.TYPE_STRING),
+        ],
+        responses={200: ProductListSerializer(many=True), 400: "Не указан параметр q"}
+    )
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': "Параметр q обязателен."})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            raise ValidationError({'limit': "limit должен быть целым числом."})
+
+        ranked = get_product_search_index().search(query, limit=limit)
+        products = self.with_expansions(Product.objects.all()).in_bulk([product_id for product_id, _ in ranked])
+
+        data = []
+        for product_id, score in ranked:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            item = self.get_serializer(product).data
+            item['score'] = round(score, 4)
+            data.append(item)
+        return Response(data)
+
+    def get_facet_queryset(self, params):
+        queryset = self.get_filtered_queryset(Product.objects.all(), params)
+        search = params.get('search')
+        if search:
+            queryset = get_search_backend(queryset.db).filter(queryset, search)
+        return queryset
+
+    @swagger_auto_schema(
+        operation_summary="Счётчики для фильтров каталога",
+        operation_description="Принимает те же параметры фильтрации, что и список препаратов, и возвращает количество препаратов для каждого значения фильтра: по тегам, возрастным диапазонам, ценовым интервалам, рейтингу, наличию старой цены и новинкам. Каждый фасет считается без учёта собственного фильтра (например, счётчики тегов не зависят от выбранных тегов). Результат кэшируется на PRODUCT_FACETS_CACHE_TTL секунд.",
+        manual_parameters=[
+            openapi.Parameter('has_old_price', openapi.IN_QUERY, description="Фильтр по наличию старой цены (true/false)", type=openapi.TYPE_STRING),
+            openapi.Parameter('new', openapi.IN_QUERY, description="Фильтр по статусу нового продукта (true/false)", type=openapi.TYPE_STRING),
+            openapi.Parameter('price_min', openapi.IN_QUERY, description="Минимальная цена", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('price_max', openapi.IN_QUERY, description="Максимальная цена", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('average_rating', openapi.IN_QUERY, description="Минимальный средний рейтинг", type=openapi.TYPE_NUMBER),
+            openapi.Parameter('age_range', openapi.IN_QUERY, description="Возрастной диапазон (0-2, 3-7, 8-12, 13-17, 18+)", type=openapi.TYPE_STRING),
+            openapi.Parameter('tags', openapi.IN_QUERY, description="ID тегов через запятую", type=openapi.TYPE_STRING),
+            openapi.Parameter('tag_name', openapi.IN_QUERY, description="Имя тега на любом языке", type=openapi.TYPE_STRING),
+            openapi.Parameter('search', openapi.IN_QUERY, description="Поиск по названию, описанию, инструкции или составу", type=openapi.TYPE_STRING),
+        ],
+        responses={200: openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            example={
+                'total': 42,
+                'tags': [{'id': 1, 'name_uz': 'Antibiotik', 'name_ru': 'Антибиотик', 'name_en': 'Antibiotic', 'count': 7}],
+                'age_range': [{'value': '18+', 'label': '18+ years (Adults)', 'count': 30}],
+                'price': [{'min': 0, 'max': 10000, 'count': 12}, {'min': 500000, 'max': None, 'count': 1}],
+                'rating': [{'min': 4, 'count': 9}],
+                'has_old_price': {'true': 5, 'false': 37},
+                'new': {'true': 3, 'false': 20},
+            }
+        )}
+    )
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        return Response(get_facets(self.get_facet_queryset, request.query_params, get_response_language(request)))
+
+    @swagger_auto_schema(
+        operation_summary="Подсказки для строки поиска",
+        operation_description="Возвращает подсказки по префиксу из названий препаратов, тегов и заболеваний, отсортированные по популярности (числу заказов). Ответ сгруппирован по языкам, limit ограничивает количество подсказок на каждый язык. Для заболеваний id равен null.",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Начало слова (например: 'para', 'пара', 'bosh')",
+                              type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('lang', openapi.IN_QUERY, description="Язык подсказок (uz, ru, en). По умолчанию все три",
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('limit', openapi.IN_QUERY, description=f"Количество подсказок на язык (по умолчанию и максимум {settings.AUTOCOMPLETE_MAX_LIMIT})",
+                              type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            additional_properties=openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'type': openapi.Schema(type=openapi.TYPE_STRING, enum=['product', 'tag', 'illness']),
+                        'id': openapi.Schema(type=openapi.TYPE_INTEGER, nullable=True),
+                        'label': openapi.Schema(type=openapi.TYPE_STRING),
+                    }
+                )
+            ),
+            example={'ru': [{'type': 'product', 'id': 1, 'label': 'Парацетамол'}, {'type': 'illness', 'id': None, 'label': 'головная боль'}]}
+        )}
+    )
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        prefix = request.query_params.get('q', '').strip()
+        lang = request.query_params.get('lang')
+        if lang and lang not in LANGUAGES:
+            raise ValidationError({'lang': f"Допустимые значения: {', '.join(LANGUAGES)}."})
+        try:
+            limit = min(max(int(request.query_params.get('limit', settings.AUTOCOMPLETE_MAX_LIMIT)), 1),
+                        settings.AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({'limit': "limit должен быть целым числом."})
+        if not prefix:
+            return Response({})
+
+        index = get_autocomplete_index()
+        return Response({
+            language: [
+                {'type': suggestion.type, 'id': suggestion.id, 'label': suggestion.label}
+                for suggestion in index.lookup(prefix, language, limit)
+            ]
+            for language in ([lang] if lang else LANGUAGES)
+        })
+
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializers
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         product_id = self.kwargs.get('product_id')
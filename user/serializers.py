@@ -51,8 +51,9 @@ class UserProfileSerializer(serializers.ModelSerializer):
     favorites = serializers.SerializerMethodField()
 
     def get_favorites(self, obj):
+        from products.querysets import plan_products
         from products.serializers import ProductSerializers
-        return ProductSerializers(obj.favorites, many=True, read_only=True).data
+        return ProductSerializers(plan_products(obj.favorites.all()), many=True, read_only=True, context=self.context).data
 
     class Meta:
         model = CustomUser
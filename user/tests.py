@@ -1,3 +1,63 @@
+from django.core import mail
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from notifications.models import OutboxMessage
+from products.category_tree import get_category_tree
+from products.models import Category, Comment, Tag
+from products.testing import create_product
+from .models import CustomUser
+
+
+class ProfileQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='x', name='A', surname='B', phone_number='+998901234567'
+        )
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name_uz='Bosh', name_ru='Голова', name_en='Head')
+        self.tag = Tag.objects.create(name_uz='Antibiotik', name_ru='Антибиотик', name_en='Antibiotic')
+        # Дерево категорий кэшируется на процесс; прогреваем, чтобы считать только запросы на продукты.
+        get_category_tree()
+
+    def add_favorites(self, count):
+        for i in range(count):
+            product = create_product(self.category)
+            product.tags.add(self.tag)
+            Comment.objects.create(product=product, user=self.user, text='ok', rating=5)
+            self.user.favorites.add(product)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_favorites_query_count_is_constant(self):
+        self.add_favorites(2)
+        small = self.count_queries()
+        self.add_favorites(5)
+        self.assertEqual(self.count_queries(), small)
+
+
+
+class LoginOTPTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', password='secret', name='A', surname='B', phone_number='+998901234567'
+        )
+
+    def test_login_queues_otp_email_instead_of_sending_inline(self):
+        response = APIClient().post('/api/signin/', {'email': 'buyer@example.com', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+
+        self.user.refresh_from_db()
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.channel, OutboxMessage.CHANNEL_EMAIL)
+        self.assertEqual(message.payload['to'], ['buyer@example.com'])
+        self.assertIn(self.user.otp_code, message.payload['body'])
+        self.assertGreater(message.expires_at, self.user.otp_created_at)
@@ -9,19 +9,39 @@ from .serializers import UserSerializer, RegisterSerializer, UserProfileSerializ
  ExtendedUserSerializer, AdminUserUpdateSerializer
 from products.models import Product
 from products.serializers import ProductSerializers
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
 import random
 from datetime import timedelta
 from .models import CustomUser
 from django.utils import timezone
 from rest_framework import serializers
 from .permissions import IsAdminUser
+from conf.pagination import IdCursorPagination
+from notifications.outbox import enqueue_email
+from card.stores import merge_anonymous_cart
+
+OTP_LIFETIME = timedelta(minutes=5)
+
+
+def issue_otp(user):
+    """Сохраняет новый OTP-код и ставит письмо с ним в очередь; отправляет воркер dispatch_notifications."""
+    otp = str(random.randint(100000, 999999))
+    with transaction.atomic():
+        user.otp_code = otp
+        user.otp_created_at = timezone.now()
+        user.save(update_fields=['otp_code', 'otp_created_at'])
+        enqueue_email(
+            'Your Verification Code',
+            f'Your OTP code is: {otp}. The code is valid for 5 minutes.',
+            [user.email],
+            expires_at=user.otp_created_at + OTP_LIFETIME,
+        )
 
 
 class AdminUserListAPI(generics.ListAPIView):
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
         queryset = CustomUser.objects.all()
@@ -155,18 +175,7 @@ class AdminUserCreateAPI(generics.CreateAPIView):
                 fields = ['id', 'email', 'name', 'surname', 'phone_number', 'avatar', 'role']
 
         if user.role == 'user':
-            otp = str(random.randint(100000, 999999))
-            user.otp_code = otp
-            user.otp_created_at = timezone.now()
-            user.save()
-
-            send_mail(
-                'Your Verification Code',
-                f'Your OTP code is: {otp}. The code is valid for 5 minutes.',
-                settings.EMAIL_HOST_USER,
-                [user.email],
-                fail_silently=False,
-            )
+            issue_otp(user)
             return Response({
                 'user': ExtendedUserSerializer(user).data,
                 'message': 'User created. OTP sent to email.'
@@ -428,6 +437,7 @@ class RegisterAPI(generics.CreateAPIView):
 
         # Если роль specialist, выдаем токены без OTP
         if user.role == 'specialist':
+            merge_anonymous_cart(request, user)
             refresh = RefreshToken.for_user(user)
             return Response({
                 'user': ExtendedUserSerializer(user).data,
@@ -437,18 +447,7 @@ class RegisterAPI(generics.CreateAPIView):
             }, status=201)
 
         # Для роли user отправляем OTP
-        otp = str(random.randint(100000, 999999))
-        user.otp_code = otp
-        user.otp_created_at = timezone.now()
-        user.save()
-
-        send_mail(
-            'Your Verification Code',
-            f'Your OTP code is: {otp}. The code is valid for 5 minutes.',
-            settings.EMAIL_HOST_USER,
-            [user.email],
-            fail_silently=False,
-        )
+        issue_otp(user)
 
         return Response({
             'user': ExtendedUserSerializer(user).data,
@@ -534,6 +533,7 @@ class LoginAPI(APIView):
             return Response({'error': 'Invalid credentials'}, status=401)
 
         if user.role == 'specialist':
+            merge_anonymous_cart(request, user)
             refresh = RefreshToken.for_user(user)
             return Response({
                 'message': 'Login successful. Tokens generated for specialist.',
@@ -541,25 +541,15 @@ class LoginAPI(APIView):
                 'access': str(refresh.access_token),
             }, status=200)
 
-        otp = str(random.randint(100000, 999999))
-        user.otp_code = otp
-        user.otp_created_at = timezone.now()
-        user.save()
-
-        send_mail(
-            'Your Verification Code',
-            f'Your OTP code is: {otp}. The code is valid for 5 minutes.',
-            settings.EMAIL_HOST_USER,
-            [email],
-            fail_silently=False,
-        )
+        issue_otp(user)
 
         return Response({'message': 'OTP sent to your email'})
 
 class VerifyOTPAPI(APIView):
     @swagger_auto_schema(
         operation_summary="Верификация OTP-кода",
-        operation_description="Проверяет OTP-код, отправленный на email пользователя, и возвращает токены доступа, если код верный и не истёк.",
+        operation_description="Проверяет OTP-код, отправленный на email пользователя, и возвращает токены доступа, если код верный и не истёк. "
+                              "Анонимная корзина из заголовка X-Cart-Token переносится в корзину пользователя.",
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             required=["email", "otp_code"],
@@ -620,12 +610,13 @@ class VerifyOTPAPI(APIView):
         try:
             user = CustomUser.objects.get(email=email)
             if (user.otp_code != otp_code or
-                    timezone.now() - user.otp_created_at > timedelta(minutes=5)):
+                    timezone.now() - user.otp_created_at > OTP_LIFETIME):
                 return Response({'error': 'Invalid or expired OTP'}, status=400)
 
             user.otp_code = None
             user.otp_created_at = None
             user.save()
+            merge_anonymous_cart(request, user)
 
             refresh = RefreshToken.for_user(user)
             return Response({